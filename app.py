@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import base64
 import asyncio
+import copy
 import hashlib
 import json
 import logging
@@ -8,15 +9,19 @@ import os
 import random
 import re
 import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 from typing import Any, Dict, List, Optional
 from uuid import uuid4
 
 import httpx
+import orjson
 import requests
-from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile, Depends
+from fastapi import FastAPI, File, Form, HTTPException, Request, Response, UploadFile, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, RedirectResponse, StreamingResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
 from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, UniqueConstraint, create_engine, inspect
@@ -24,11 +29,18 @@ from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Session, declarative_base, sessionmaker
 from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
 
+# Configuração de logging do processo (antes dos módulos locais, que só criam loggers)
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
 # Importar serviço Tiny
 import tiny_service
 import canva_service
 import mercadolivre_service
 from image_selection import select_ad_images
+import image_conversion
 import mercadolivre_category_tree
 from appgtw_auth import ApplicationGatewayAuth, ApplicationGatewayAuthConfig, CurrentUser
 from config import settings
@@ -51,7 +63,19 @@ _auth = ApplicationGatewayAuth(ApplicationGatewayAuthConfig(
 from pricing import PriceCalculatorFactory
 from pricing import ml_shipping
 
-app = FastAPI(title="Ads Generator API", version="2.2.0")
+class _OrjsonResponse(JSONResponse):
+    """JSONResponse serializada com orjson; classe de resposta padrão da API."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _json_text(obj: Any) -> str:
+    """Serializa em JSON (UTF-8, compacto) via orjson e devolve como str."""
+    return orjson.dumps(obj).decode("utf-8")
+
+
+app = FastAPI(title="Ads Generator API", version="2.2.0", default_response_class=_OrjsonResponse)
 app.include_router(_auth.router)
 get_current_user_master = _auth.require_user  # alias for backward compat (tests)
 logger = logging.getLogger("ads_generator.workspace")
@@ -69,6 +93,10 @@ app.add_middleware(
     trusted_hosts="*",
 )
 
+# Respostas grandes (base64 de arquivos do Drive, cotações, buscas) comprimem bem.
+# O GZipMiddleware do Starlette já ignora text/event-stream (SSE de publicação ML).
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 # Static
 if not os.path.isdir("static"):
     os.makedirs("static", exist_ok=True)
@@ -194,6 +222,19 @@ def get_db():
         db.close()
 
 
+def get_user_config(
+        current_user: CurrentUser = Depends(get_current_user_master),
+        db: Session = Depends(get_db),
+) -> Optional[UserConfig]:
+    """
+    UserConfig do usuário autenticado, buscado uma única vez por requisição.
+
+    O FastAPI reaproveita o resultado de um Depends dentro da mesma requisição,
+    então dependências que também precisem da config não repetem o SELECT.
+    """
+    return db.query(UserConfig).filter(UserConfig.user_id == str(current_user.user_id)).first()
+
+
 def _run_alembic_migrations() -> None:
     """Run alembic upgrade head. All migrations are idempotent."""
     import subprocess
@@ -237,11 +278,29 @@ async def _startup_category_tree() -> None:
     asyncio.create_task(mercadolivre_category_tree.initialise_category_tree(SessionLocal))
 
 
+INDEX_PAGE_PATH = os.path.join("static", "main.html")
+
+
+@lru_cache(maxsize=1)
+def _load_index_page(path: str, mtime_ns: int) -> tuple:
+    """Conteúdo e ETag da SPA; a chave inclui o mtime, então edições no arquivo invalidam o cache."""
+    with open(path, "rb") as f:
+        content = f.read()
+    return content, f'"{hashlib.md5(content).hexdigest()}"'
+
+
+def _index_page() -> tuple:
+    return _load_index_page(INDEX_PAGE_PATH, os.stat(INDEX_PAGE_PATH).st_mtime_ns)
+
+
 @app.get("/", include_in_schema=False)
-async def root_index(current_user: CurrentUser = Depends(get_current_user_master)):
-    # Serve the SPA from /static/main.html
-    index_path = os.path.join("static", "main.html")
-    return FileResponse(index_path)
+async def root_index(request: Request, current_user: CurrentUser = Depends(get_current_user_master)):
+    # Serve the SPA from /static/main.html (em memória; revalidação via ETag)
+    content, etag = _index_page()
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=60"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type="text/html; charset=utf-8", headers=headers)
 
 
 class Options(BaseModel):
@@ -254,6 +313,10 @@ class Options(BaseModel):
     prompt_template: Optional[str] = None
     tiny_product_data: Optional[Dict[str, Any]] = None
     variation_context: Optional[Dict[str, Any]] = None
+    temperature: Optional[float] = Field(
+        None, ge=0, le=2,
+        description="Temperatura do LLM (None = padrão do provedor; 0 = determinístico, habilita cache)",
+    )
 
 
 class GenerateIn(BaseModel):
@@ -367,81 +430,97 @@ def _extract_kit_name_replacements_from_config(
     return fallback
 
 
+# Placeholders expandidos no template e escape das demais chaves literais
+_RE_PROMPT_PLACEHOLDER = re.compile(r"\{(product|marketplace|specs)\}")
+_PROMPT_BRACE_ESCAPE = str.maketrans({"{": "{{", "}": "}}"})
+
+
+@lru_cache(maxsize=128)
+def _compile_prompt_template(tpl: str) -> tuple:
+    """
+    Quebra o template uma única vez: trechos literais (posições pares, já com
+    as chaves escapadas) intercalados com nomes de placeholder (ímpares).
+    """
+    parts = _RE_PROMPT_PLACEHOLDER.split(tpl)
+    parts[0::2] = [chunk.translate(_PROMPT_BRACE_ESCAPE) for chunk in parts[0::2]]
+    return tuple(parts)
+
+
 def render_prompt_template(tpl: str, product: str, marketplace: str, specs: str) -> str:
     """
     Protege chaves literais do template e expande apenas {product}, {marketplace}, {specs}.
     Não exige que você duplique chaves em exemplos de JSON.
     """
-    tok_product = "%%__PRODUCT__%%"
-    tok_marketplace = "%%__MARKETPLACE__%%"
-    tok_specs = "%%__SPECS__%%"
+    values = {"product": product, "marketplace": marketplace, "specs": specs}
+    parts = list(_compile_prompt_template(tpl))
+    parts[1::2] = [values[name] for name in parts[1::2]]
+    return "".join(parts)
+
 
-    # 1) Marcar placeholders reais
-    tmp = (tpl
-           .replace("{product}", tok_product)
-           .replace("{marketplace}", tok_marketplace)
-           .replace("{specs}", tok_specs))
+# O template padrão é usado em toda geração sem template do usuário: já sai compilado.
+_compile_prompt_template(DEFAULT_PROMPT_TEMPLATE)
 
-    # 2) Escapar TODAS as demais chaves literais do template
-    tmp = tmp.replace("{", "{{").replace("}", "}}")
 
-    # 3) Restaurar os placeholders com os valores
-    tmp = (tmp
-           .replace(tok_product, product)
-           .replace(tok_marketplace, marketplace)
-           .replace(tok_specs, specs))
-    return tmp
+# Padrões de limpeza de markdown da descrição (compilados uma vez)
+_DESC_STRIP_INLINE_MARKS = str.maketrans("", "", "*`_")
+# Cabeçalho e/ou bullet no início da linha; grupos 1/2 indicam bullet
+_RE_DESC_LINE_PREFIX = re.compile(r"^[ \t]*(?:#{1,6}[ \t]*([-•][ \t]+)?|([-•])[ \t]+)", re.MULTILINE)
+_RE_DESC_TRAILING_WS = re.compile(r"[^\S\n]+$", re.MULTILINE)
+_RE_DESC_BLANK_LINES = re.compile(r"\n{3,}")
+_RE_DESC_SPACES = re.compile(r"[ \t]{2,}")
+
+
+def _desc_line_prefix(m: "re.Match[str]") -> str:
+    return "• " if m.group(1) or m.group(2) else ""
 
 
 def ensure_plain_text_desc(text: str) -> str:
     if not text:
         return ""
-    text = re.sub(r"[*`_]{1,3}", "", text)
-    text = re.sub(r"^[ \t]*#{1,6}[ \t]*", "", text, flags=re.MULTILINE)
-    lines = []
-    for line in text.splitlines():
-        l = line.rstrip()
-        if re.match(r"^[ \t]*[-*•][ \t]+", l):
-            l = re.sub(r"^[ \t]*[-*•][ \t]+", "• ", l)
-        lines.append(l)
-    text = "\n".join(lines)
-    text = re.sub(r"\n{3,}", "\n\n", text)
-    text = re.sub(r"[ \t]{2,}", " ", text)
+    text = text.translate(_DESC_STRIP_INLINE_MARKS)
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = _RE_DESC_TRAILING_WS.sub("", text)
+    text = _RE_DESC_LINE_PREFIX.sub(_desc_line_prefix, text)
+    text = _RE_DESC_BLANK_LINES.sub("\n\n", text)
+    text = _RE_DESC_SPACES.sub(" ", text)
     return text.strip()
 
 
+# Conteúdo de exemplo (modo MOCK): constantes imutáveis criadas uma vez
+_MOCK_CARDS_BASE = (
+    ("Material durável", "Feito em PP/PVC resistente e fácil de limpar."),
+    ("Medida ideal", "80×60 cm: compatível com diferentes ambientes."),
+    ("Com peneira", "Facilita a remoção dos resíduos no dia a dia."),
+    ("Leve e prático", "Transporte e movimentação sem esforço."),
+    ("Design moderno", "Combina com a decoração da sua casa."),
+    ("Higiênico", "Use água e sabão neutro na limpeza."),
+    ("Versátil", "Compatível com padrões de uso de diversos pets."),
+    ("Conforto", "Acabamento liso e agradável ao toque."),
+    ("Garantia", "90 dias contra defeitos de fabricação."),
+    ("Suporte", "Dúvidas? Atendimento rápido pós‑compra."),
+    ("Compra segura", "Devolução conforme política do marketplace."),
+)
+
+_MOCK_FAQ_BASE = (
+    ("Serve para todos os gatos?", "Compatível com a maioria dos portes; verifique as medidas."),
+    ("Como faço a limpeza?", "Use água e sabão neutro. Evite abrasivos."),
+    ("Possui garantia?", "Sim, 90 dias contra defeitos de fabricação."),
+    ("O material é resistente?", "PP/PVC leve, resistente e fácil de limpar."),
+    ("Acompanha peneira?", "Sim, inclui bandeja com peneira."),
+    ("Qual o tamanho?", "Aproximadamente 80×60 cm."),
+    ("É escorregadio?", "Base com boa estabilidade em superfícies planas."),
+    ("Aceita devolução?", "Sim, conforme política do marketplace."),
+    ("Pode ficar ao ar livre?", "Prefira uso em ambiente interno coberto."),
+    ("Como é a montagem?", "Pronto para uso, com instruções simples."),
+)
+
+
 def mock_cards(term: str):
-    base = [
-        ("Material durável", "Feito em PP/PVC resistente e fácil de limpar."),
-        ("Medida ideal", "80×60 cm: compatível com diferentes ambientes."),
-        ("Com peneira", "Facilita a remoção dos resíduos no dia a dia."),
-        ("Leve e prático", "Transporte e movimentação sem esforço."),
-        ("Design moderno", "Combina com a decoração da sua casa."),
-        ("Higiênico", "Use água e sabão neutro na limpeza."),
-        ("Versátil", "Compatível com padrões de uso de diversos pets."),
-        ("Conforto", "Acabamento liso e agradável ao toque."),
-        ("Garantia", "90 dias contra defeitos de fabricação."),
-        ("Suporte", "Dúvidas? Atendimento rápido pós‑compra."),
-        ("Compra segura", "Devolução conforme política do marketplace."),
-    ]
-    random.shuffle(base)
-    return [{"title": t, "text": x} for t, x in base]
+    return [{"title": t, "text": x} for t, x in random.sample(_MOCK_CARDS_BASE, len(_MOCK_CARDS_BASE))]
 
 
 def mock_faq():
-    base = [
-        ("Serve para todos os gatos?", "Compatível com a maioria dos portes; verifique as medidas."),
-        ("Como faço a limpeza?", "Use água e sabão neutro. Evite abrasivos."),
-        ("Possui garantia?", "Sim, 90 dias contra defeitos de fabricação."),
-        ("O material é resistente?", "PP/PVC leve, resistente e fácil de limpar."),
-        ("Acompanha peneira?", "Sim, inclui bandeja com peneira."),
-        ("Qual o tamanho?", "Aproximadamente 80×60 cm."),
-        ("É escorregadio?", "Base com boa estabilidade em superfícies planas."),
-        ("Aceita devolução?", "Sim, conforme política do marketplace."),
-        ("Pode ficar ao ar livre?", "Prefira uso em ambiente interno coberto."),
-        ("Como é a montagem?", "Pronto para uso, com instruções simples."),
-    ]
-    return [{"q": q, "a": a} for q, a in base]
+    return [{"q": q, "a": a} for q, a in _MOCK_FAQ_BASE]
 
 
 def mock_generate(term: str, marketplace: str):
@@ -479,10 +558,43 @@ def have_gemini(opts: Options) -> bool:
     return bool(opts.gemini_api_key.strip())
 
 
-def call_openai(prompt: str, opts: Options, files_data: Optional[List[Dict[str, Any]]] = None) -> str:
+# Cliente HTTP compartilhado para as chamadas de LLM: reaproveita conexões
+# TLS (keep-alive + multiplexação HTTP/2) entre requisições.
+_LLM_HTTP_CLIENT: Optional[httpx.AsyncClient] = None
+
+
+def _get_llm_http_client() -> httpx.AsyncClient:
+    global _LLM_HTTP_CLIENT
+    if _LLM_HTTP_CLIENT is None or _LLM_HTTP_CLIENT.is_closed:
+        _LLM_HTTP_CLIENT = httpx.AsyncClient(
+            http2=True,
+            timeout=90,
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=50),
+        )
+    return _LLM_HTTP_CLIENT
+
+
+@app.on_event("shutdown")
+async def _shutdown_llm_http_client() -> None:
+    if _LLM_HTTP_CLIENT is not None:
+        await _LLM_HTTP_CLIENT.aclose()
+
+
+@app.on_event("shutdown")
+async def _shutdown_ml_shipping_http_client() -> None:
+    await ml_shipping.close_http_client()
+
+
+@app.on_event("shutdown")
+async def _shutdown_tiny_http_client() -> None:
+    await tiny_service.close_http_client()
+
+
+async def call_openai(prompt: str, opts: Options, files_data: Optional[List[Dict[str, Any]]] = None) -> str:
     base = opts.openai_base_url.strip() or "https://api.openai.com/v1"
     url = f"{base}/chat/completions"
     headers = {"Authorization": f"Bearer {opts.openai_api_key}", "Content-Type": "application/json"}
+    temperature = opts.temperature if opts.temperature is not None else 0.7
 
     # Construir conteúdo com arquivos se houver
     if files_data and len(files_data) > 0:
@@ -508,27 +620,29 @@ def call_openai(prompt: str, opts: Options, files_data: Optional[List[Dict[str,
                     "text": f"\n\n[Conteúdo do arquivo {file_info['filename']}]:\n{text_content}"
                 })
 
-        payload = {"model": "gpt-4o", "messages": [{"role": "user", "content": content_parts}], "temperature": 0.7,
-                   "max_tokens": 4096}
+        payload = {"model": "gpt-4o", "messages": [{"role": "user", "content": content_parts}],
+                   "temperature": temperature, "max_tokens": 4096}
     else:
-        payload = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": prompt}], "temperature": 0.7}
+        payload = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": prompt}], "temperature": temperature}
 
+    client = _get_llm_http_client()
     last_error = None
     for attempt in range(3):
         if attempt > 0:
-            time.sleep(attempt)
+            await asyncio.sleep(attempt)
         try:
-            with requests.Session() as session:
-                r = session.post(url, headers=headers, json=payload, timeout=90)
-                r.raise_for_status()
-                data = r.json()
-                return data["choices"][0]["message"]["content"]
-        except requests.exceptions.RequestException as e:
+            r = await client.post(url, headers=headers, json=payload)
+            r.raise_for_status()
+            data = r.json()
+            return data["choices"][0]["message"]["content"]
+        except (httpx.HTTPError, ValueError) as e:
+            # ValueError: corpo que não é JSON (ex.: página de erro do proxy com 200),
+            # retentado como no requests, onde JSONDecodeError é RequestException
             last_error = e
     raise HTTPException(status_code=502, detail=f"LLM gateway indisponível após 3 tentativas: {last_error}")
 
 
-def call_gemini(prompt: str, opts: Options, files_data: Optional[List[Dict[str, Any]]] = None) -> str:
+async def call_gemini(prompt: str, opts: Options, files_data: Optional[List[Dict[str, Any]]] = None) -> str:
     base = opts.gemini_base_url.strip() or "https://generativelanguage.googleapis.com"
     url = f"{base}/v1/models/gemini-1.5-flash:generateContent?key={opts.gemini_api_key}"
 
@@ -551,32 +665,71 @@ def call_gemini(prompt: str, opts: Options, files_data: Optional[List[Dict[str,
                 })
 
     payload = {"contents": [{"parts": parts}]}
+    if opts.temperature is not None:
+        payload["generationConfig"] = {"temperature": opts.temperature}
+    client = _get_llm_http_client()
     last_error = None
     for attempt in range(3):
         if attempt > 0:
-            time.sleep(attempt)
+            await asyncio.sleep(attempt)
         try:
-            with requests.Session() as session:
-                r = session.post(url, json=payload, timeout=90)
-                r.raise_for_status()
-                data = r.json()
-                try:
-                    return data["candidates"][0]["content"]["parts"][0]["text"]
-                except Exception:
-                    return json.dumps(data)
-        except requests.exceptions.RequestException as e:
+            r = await client.post(url, json=payload)
+            r.raise_for_status()
+            data = r.json()
+            try:
+                return data["candidates"][0]["content"]["parts"][0]["text"]
+            except Exception:
+                return _json_text(data)
+        except (httpx.HTTPError, ValueError) as e:  # ValueError: corpo não-JSON (ver call_openai)
             last_error = e
     raise HTTPException(status_code=502, detail=f"LLM gateway indisponível após 3 tentativas: {last_error}")
 
 
+# Caracteres estruturais para o scanner de objetos JSON (o resto é pulado em C)
+_RE_JSON_SCAN_TOKENS = re.compile(r'[{}"\\]')
+
+
+def _find_balanced_object(s: str, start: int) -> Optional[str]:
+    """Retorna o objeto {...} balanceado que começa em s[start], ignorando chaves dentro de strings."""
+    depth = 0
+    in_string = False
+    escaped_until = -1
+    for m in _RE_JSON_SCAN_TOKENS.finditer(s, start):
+        pos = m.start()
+        if pos <= escaped_until:
+            continue
+        ch = m.group()
+        if in_string:
+            if ch == "\\":
+                escaped_until = pos + 1
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return s[start:pos + 1]
+    return None
+
+
 def parse_json_loose(s: str) -> Dict[str, Any]:
-    # noinspection RegExpRedundantEscape
-    m = re.search(r"\{.*\}", s, flags=re.DOTALL)
-    if m:
+    start = s.find("{")
+    if start < 0:
+        return {}
+    # 1º objeto balanceado; se não decodificar, tenta do 1º "{" ao último "}"
+    candidates = (_find_balanced_object(s, start), s[start:s.rfind("}") + 1])
+    for candidate in candidates:
+        if not candidate:
+            continue
         try:
-            return json.loads(m.group(0))
-        except Exception:
-            pass
+            data = orjson.loads(candidate)
+        except orjson.JSONDecodeError:
+            continue
+        if isinstance(data, dict):
+            return data
     return {}
 
 
@@ -627,25 +780,87 @@ def build_field_prompt(base_prompt: str, field: str, previous: Optional[Dict[str
     if previous:
         if user_hint:
             # Se há prompt do usuário, deve MELHORAR e COMPLETAR com as novas informações
-            suffix += f"\nConteúdo atual a ser melhorado e completado: {json.dumps(previous, ensure_ascii=False)}"
+            suffix += f"\nConteúdo atual a ser melhorado e completado: {_json_text(previous)}"
         else:
             # Se não há prompt, gerar variação SIGNIFICATIVAMENTE diferente
-            suffix += f"\nVERSÃO ANTERIOR (NÃO repetir): {json.dumps(previous, ensure_ascii=False)}"
+            suffix += f"\nVERSÃO ANTERIOR (NÃO repetir): {_json_text(previous)}"
             suffix += "\nGere conteúdo OBRIGATORIAMENTE DIFERENTE da versão anterior. Use palavras, estrutura e ângulo completamente novos. NUNCA repita o mesmo texto."
     if user_hint:
         suffix += f"\nInstruções do usuário (use ESTAS informações para melhorar e completar o conteúdo atual): {user_hint}"
     return base_prompt + suffix
 
 
-def call_model_json(prompt: str, opts: Options, files_data: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
-    text = ""
+# Cache de respostas do LLM, usado só com temperatura 0 (saída determinística):
+# mesmo prompt + arquivos + provedor + chave de API não gera nova chamada nem gasto
+# de tokens. A chave entra só como hash e separa os tenants: uma resposta paga por
+# uma conta nunca é servida a quem usa outra.
+LLM_RESPONSE_CACHE: Dict[str, Dict[str, Any]] = {}
+LLM_RESPONSE_CACHE_TTL_SECONDS = 3600
+LLM_RESPONSE_CACHE_MAX_ENTRIES = 1000
+
+
+def _cleanup_llm_response_cache() -> None:
+    now = time.time()
+    expired = [k for k, v in LLM_RESPONSE_CACHE.items() if now - v["cached_at"] > LLM_RESPONSE_CACHE_TTL_SECONDS]
+    for k in expired:
+        del LLM_RESPONSE_CACHE[k]
+    while len(LLM_RESPONSE_CACHE) > LLM_RESPONSE_CACHE_MAX_ENTRIES:
+        LLM_RESPONSE_CACHE.pop(next(iter(LLM_RESPONSE_CACHE)))
+
+
+def _llm_cache_key(provider: str, base_url: str, api_key: str, prompt: str,
+                   files_data: Optional[List[Dict[str, Any]]]) -> str:
+    files_sig = [
+        (f.get("mime_type"), f.get("base64_data"), f.get("text_content"))
+        for f in (files_data or [])
+    ]
+    api_key_hash = hashlib.sha256(api_key.strip().encode()).hexdigest()[:16]
+    raw = orjson.dumps([provider, base_url.strip(), api_key_hash, prompt, files_sig])
+    return hashlib.sha256(raw).hexdigest()
+
+
+def _llm_provider(opts: Options) -> Optional[tuple]:
     if have_openai(opts):
-        text = call_openai(prompt, opts, files_data)
-    elif have_gemini(opts):
-        text = call_gemini(prompt, opts, files_data)
-    else:
+        return "openai", opts.openai_base_url, call_openai
+    if have_gemini(opts):
+        return "gemini", opts.gemini_base_url, call_gemini
+    return None
+
+
+def _deterministic_llm_cache_key(prompt: str, opts: Options,
+                                 files_data: Optional[List[Dict[str, Any]]] = None) -> Optional[str]:
+    """Chave do LLM_RESPONSE_CACHE para a chamada, ou None quando ela não é cacheável."""
+    provider = _llm_provider(opts)
+    if provider is None or opts.temperature != 0:
+        return None
+    api_key = opts.openai_api_key if provider[0] == "openai" else opts.gemini_api_key
+    return _llm_cache_key(provider[0], provider[1], api_key, prompt, files_data)
+
+
+def _llm_cached_response(cache_key: Optional[str]) -> Optional[Dict[str, Any]]:
+    cached = LLM_RESPONSE_CACHE.get(cache_key) if cache_key else None
+    if cached and time.time() - cached["cached_at"] <= LLM_RESPONSE_CACHE_TTL_SECONDS:
+        return cached["data"]
+    return None
+
+
+async def call_model_json(prompt: str, opts: Options, files_data: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    provider = _llm_provider(opts)
+    if provider is None:
         return {}
-    return parse_json_loose(text)
+    call = provider[2]
+
+    cache_key = _deterministic_llm_cache_key(prompt, opts, files_data)
+    cached = _llm_cached_response(cache_key)
+    if cached is not None:
+        return copy.deepcopy(cached)
+
+    data = parse_json_loose(await call(prompt, opts, files_data))
+
+    if cache_key and data:
+        LLM_RESPONSE_CACHE[cache_key] = {"data": copy.deepcopy(data), "cached_at": time.time()}
+        _cleanup_llm_response_cache()
+    return data
 
 
 async def process_uploaded_files(files: List[UploadFile]) -> tuple[List[Dict[str, Any]], List[str]]:
@@ -1571,7 +1786,7 @@ async def sku_workspace_version_detail(
     )
 
 
-@app.post("/api/generate")
+@app.post("/api/generate", response_model=None)
 async def generate(
         request: Request,
         json_data: Optional[str] = Form(None),
@@ -1585,16 +1800,14 @@ async def generate(
         # FormData com possíveis arquivos
         if not json_data:
             return JSONResponse(content={"error": "Missing json_data in FormData"}, status_code=400)
-        payload_dict = json.loads(json_data)
-        payload = GenerateIn(**payload_dict)
+        payload = GenerateIn.model_validate_json(json_data)
     else:
         # JSON puro (backward compatibility)
-        payload_dict = await request.json()
-        payload = GenerateIn(**payload_dict)
+        payload = GenerateIn.model_validate_json(await request.body())
         files = []  # Sem arquivos em JSON
 
     if not (have_openai(payload.options) or have_gemini(payload.options)):
-        return JSONResponse(content=mock_generate(payload.product_name, payload.marketplace))
+        return _OrjsonResponse(content=mock_generate(payload.product_name, payload.marketplace))
 
     # Processar arquivos se houver
     files_data = None
@@ -1608,7 +1821,8 @@ async def generate(
 
     # Construir prompt com instruções específicas sobre arquivos
     base_prompt = build_full_prompt_with_files(payload.product_name, payload.marketplace, payload.options, has_files)
-    data = call_model_json(base_prompt, payload.options, files_data)
+
+    data = await call_model_json(base_prompt, payload.options, files_data)
 
     title = str(data.get("title", "")).strip()
     description = ensure_plain_text_desc(str(data.get("description", "")))
@@ -1630,32 +1844,39 @@ async def generate(
     if has_files and files_data:
         response_data["files_processed"] = len(files_data)
 
-    return JSONResponse(content=response_data)
+    return _OrjsonResponse(content=response_data)
 
 
-@app.post("/api/regen")
-async def regen(payload: RegenIn, current_user: CurrentUser = Depends(get_current_user_master)):
+# Cada item vira uma chamada ao LLM, todas em paralelo: lote limitado (422 acima)
+REGEN_BATCH_MAX_ITEMS = 20
+
+
+class RegenBatchIn(BaseModel):
+    items: List[RegenIn] = Field(..., min_length=1, max_length=REGEN_BATCH_MAX_ITEMS)
+
+
+async def _regen_field(payload: RegenIn) -> Dict[str, Any]:
     field = payload.field.lower().strip()
 
     if not (have_openai(payload.options) or have_gemini(payload.options)):
         if field == "title":
             t = f"{payload.product_name} — {random.choice(['Qualidade superior', 'Uso prático diário', 'Resistência e design'])}"
-            return JSONResponse(content={"title": t, "sources_used": {"mock": True}})
+            return {"title": t, "sources_used": {"mock": True}}
         if field == "description":
             base = mock_generate(payload.product_name, payload.marketplace)
-            return JSONResponse(content={"description": base["description"], "sources_used": {"mock": True}})
+            return {"description": base["description"], "sources_used": {"mock": True}}
         if field == "faq_item":
             item = random.choice(mock_faq())
-            return JSONResponse(content={"faq": [item], "sources_used": {"mock": True}})
+            return {"faq": [item], "sources_used": {"mock": True}}
         if field == "card":
             item = random.choice(mock_cards(payload.product_name))
-            return JSONResponse(content={"cards": [item], "sources_used": {"mock": True}})
-        return JSONResponse(content={"ok": True, "sources_used": {"mock": True}})
+            return {"cards": [item], "sources_used": {"mock": True}}
+        return {"ok": True, "sources_used": {"mock": True}}
 
     base_prompt = build_full_prompt(payload.product_name, payload.marketplace, payload.options)
     prev = payload.context.get("previous") if payload.context else None
     part_prompt = build_field_prompt(base_prompt, field, previous=prev, user_hint=payload.prompt)
-    data = call_model_json(part_prompt, payload.options)
+    data = await call_model_json(part_prompt, payload.options)
 
     out: Dict[str, Any] = {"sources_used": {"mock": False}}
     if field == "title" and "title" in data:
@@ -1674,7 +1895,19 @@ async def regen(payload: RegenIn, current_user: CurrentUser = Depends(get_curren
         except Exception:
             item = {}
         out["cards"] = [item]
-    return JSONResponse(content=out)
+    return out
+
+
+@app.post("/api/regen", response_model=None)
+async def regen(payload: RegenIn, current_user: CurrentUser = Depends(get_current_user_master)):
+    return _OrjsonResponse(content=await _regen_field(payload))
+
+
+@app.post("/api/regen_batch", response_model=None)
+async def regen_batch(payload: RegenBatchIn, current_user: CurrentUser = Depends(get_current_user_master)):
+    """Regenera vários campos em paralelo; a resposta segue a ordem de `items`."""
+    results = await asyncio.gather(*(_regen_field(item) for item in payload.items))
+    return _OrjsonResponse(content=results)
 
 
 # ===== Tiny ERP Integration Endpoints =====
@@ -2128,6 +2361,29 @@ class PriceValidateRequest(BaseModel):
     channel: str
 
 
+# Conjunto de canais é estático: calculado uma vez na importação.
+_PRICING_CHANNELS = tuple(PriceCalculatorFactory.get_supported_channels())
+
+
+def _build_price_quote(calculator, request: PriceQuoteRequest) -> Dict[str, Any]:
+    """
+    Monta a cotação completa (preços, métricas e breakdown) de um item.
+
+    Retorna o dict já no formato de PriceQuoteResponse; os endpoints o enviam
+    direto (sem revalidar o modelo na saída).
+    """
+    # Preparar contexto: adicionar commission_percent se fornecido
+    ctx = request.ctx or {}
+    if request.commission_percent is not None:
+        ctx['commission_percent'] = request.commission_percent
+
+    # Calcular todos os preços COM MÉTRICAS (incluindo shipping_cost) numa única passada
+    quote = calculator.get_quote(request.cost_price, request.shipping_cost, ctx).model_dump()
+    quote["channel"] = request.channel
+    quote["policy_id"] = request.policy_id
+    return quote
+
+
 @app.post("/pricing/quote", response_model=PriceQuoteResponse)
 async def pricing_quote(
         request: PriceQuoteRequest,
@@ -2149,32 +2405,7 @@ async def pricing_quote(
     try:
         # Obter calculadora para o canal
         calculator = PriceCalculatorFactory.get(request.channel)
-
-        # Preparar contexto: adicionar commission_percent se fornecido
-        ctx = request.ctx or {}
-        if request.commission_percent is not None:
-            ctx['commission_percent'] = request.commission_percent
-
-        # Calcular todos os preços COM MÉTRICAS (incluindo shipping_cost)
-        listing_price_obj = calculator.get_listing_price_with_metrics(request.cost_price, request.shipping_cost, ctx)
-        wholesale_tiers = calculator.get_wholesale_tiers_with_metrics(request.cost_price, request.shipping_cost, ctx)
-        aggressive_price_obj = calculator.get_aggressive_price_with_metrics(request.cost_price, request.shipping_cost,
-                                                                            ctx)
-        promo_price_obj = calculator.get_promo_price_with_metrics(request.cost_price, request.shipping_cost, ctx)
-        breakdown = calculator.get_breakdown(request.cost_price, request.shipping_cost, ctx)
-
-        # Converter tiers para dict
-        tiers_dict = [tier.model_dump() for tier in wholesale_tiers]
-
-        return PriceQuoteResponse(
-            listing_price=listing_price_obj.model_dump(),
-            wholesale_tiers=tiers_dict,
-            aggressive_price=aggressive_price_obj.model_dump(),
-            promo_price=promo_price_obj.model_dump(),
-            breakdown=breakdown.model_dump(),
-            channel=request.channel,
-            policy_id=request.policy_id
-        )
+        return _OrjsonResponse(content=_build_price_quote(calculator, request))
 
     except ValueError as e:
         # Canal não suportado
@@ -2182,9 +2413,61 @@ async def pricing_quote(
             status_code=422,
             detail={
                 "message": str(e),
-                "supported_channels": PriceCalculatorFactory.get_supported_channels()
+                "supported_channels": list(_PRICING_CHANNELS)
+            }
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail={"message": f"Erro ao calcular preços: {str(e)}"}
+        )
+
+
+# Teto de itens por lote: o cálculo é síncrono no loop, então um lote sem limite
+# seguraria o worker; acima disso a validação responde 422
+PRICING_QUOTE_BATCH_MAX_ITEMS = 500
+
+
+class PriceQuoteBatchRequest(BaseModel):
+    """Request para cotação de preços em lote"""
+    items: List[PriceQuoteRequest] = Field(
+        ..., min_length=1, max_length=PRICING_QUOTE_BATCH_MAX_ITEMS,
+        description="Itens a cotar (mesmo formato de /pricing/quote)",
+    )
+
+
+@app.post("/pricing/quote-batch", response_model=List[PriceQuoteResponse])
+async def pricing_quote_batch(
+        request: PriceQuoteBatchRequest,
+        current_user: CurrentUser = Depends(get_current_user_master)
+):
+    """
+    Cotação de vários itens numa única requisição (evita N chamadas a /pricing/quote).
+
+    Returns:
+        Lista de PriceQuoteResponse na mesma ordem de request.items
+
+    Raises:
+        422: Algum item com canal não suportado (nenhum item é calculado)
+    """
+    unsupported = sorted({
+        item.channel for item in request.items
+        if not PriceCalculatorFactory.is_supported(item.channel)
+    })
+    if unsupported:
+        raise HTTPException(
+            status_code=422,
+            detail={
+                "message": f"Canais não suportados: {', '.join(unsupported)}",
+                "supported_channels": list(_PRICING_CHANNELS)
             }
         )
+
+    try:
+        return _OrjsonResponse(content=[
+            _build_price_quote(PriceCalculatorFactory.get(item.channel), item)
+            for item in request.items
+        ])
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -2220,18 +2503,11 @@ async def calculate_ml_shipping_endpoint(
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/pricing/policies")
-async def pricing_policies(current_user: CurrentUser = Depends(get_current_user_master)):
-    """
-    Lista políticas de preço disponíveis por canal.
-    
-    Retorna:
-        Dict com canais suportados e suas configurações padrão
-    """
-    supported_channels = PriceCalculatorFactory.get_supported_channels()
-
+@lru_cache(maxsize=1)
+def _pricing_policies_payload() -> Dict[str, Any]:
+    """Políticas só mudam com deploy (registro estático da factory): calcula uma vez."""
     policies = {}
-    for channel in supported_channels:
+    for channel in _PRICING_CHANNELS:
         try:
             calculator = PriceCalculatorFactory.get(channel)
             # Acessa atributos diretamente via hasattr (compatível com todas as implementações)
@@ -2246,11 +2522,22 @@ async def pricing_policies(current_user: CurrentUser = Depends(get_current_user_
             pass
 
     return {
-        "supported_channels": supported_channels,
+        "supported_channels": list(_PRICING_CHANNELS),
         "policies": policies
     }
 
 
+@app.get("/pricing/policies")
+async def pricing_policies(current_user: CurrentUser = Depends(get_current_user_master)):
+    """
+    Lista políticas de preço disponíveis por canal.
+    
+    Retorna:
+        Dict com canais suportados e suas configurações padrão
+    """
+    return _OrjsonResponse(content=_pricing_policies_payload())
+
+
 @app.post("/pricing/validate")
 async def pricing_validate(
         request: PriceValidateRequest,
@@ -2281,7 +2568,7 @@ async def pricing_validate(
     if not PriceCalculatorFactory.is_supported(request.channel):
         errors.append(
             f"Canal '{request.channel}' não suportado. "
-            f"Canais disponíveis: {', '.join(PriceCalculatorFactory.get_supported_channels())}"
+            f"Canais disponíveis: {', '.join(_PRICING_CHANNELS)}"
         )
 
     if errors:
@@ -2308,6 +2595,15 @@ class CalcMetricsResponse(BaseModel):
     value_amount: float
 
 
+def _generic_price_metrics(price: float, cost_total: float, pct_sum: float) -> tuple[float, float, float]:
+    """Aritmética pura do cálculo genérico: retorna (margin_percent, value_multiple, value_amount)."""
+    # Despesas proporcionais ao preço
+    value_amount = price - cost_total - price * pct_sum
+    margin_percent = (value_amount / price) * 100 if price > 0 else 0.0
+    value_multiple = (value_amount / cost_total) if cost_total > 0 else 0.0
+    return margin_percent, value_multiple, value_amount
+
+
 @app.post("/pricing/calculate-metrics", response_model=CalcMetricsResponse)
 async def pricing_calculate_metrics(
         request: CalcMetricsRequest,
@@ -2355,12 +2651,9 @@ async def pricing_calculate_metrics(
         mc_pct = float(ctx.get("margem_contribuicao", 0.0) or 0.0)
         lucro_pct = float(ctx.get("lucro", 0.0) or 0.0)
 
-        # Despesas proporcionais ao preço
-        variaveis_sobre_preco = price * (commission_pct + impostos_pct + tacos_pct + mc_pct + lucro_pct)
-
-        value_amount = price - cost_total - variaveis_sobre_preco
-        margin_percent = (value_amount / price) * 100 if price > 0 else 0.0
-        value_multiple = (value_amount / cost_total) if cost_total > 0 else 0.0
+        margin_percent, value_multiple, value_amount = _generic_price_metrics(
+            price, cost_total, commission_pct + impostos_pct + tacos_pct + mc_pct + lucro_pct
+        )
 
         return CalcMetricsResponse(
             margin_percent=margin_percent,
@@ -2382,7 +2675,6 @@ async def pricing_calculate_metrics(
 
 from io import BytesIO
 import json as _json
-import PIL.Image
 
 try:
     from googleapiclient.discovery import build
@@ -2407,18 +2699,28 @@ def _build_drive_service(credentials_json_str: str):
     return build("drive", "v3", credentials=creds, cache_discovery=False)
 
 
+# Escape de literais nas queries do Drive: barra invertida e aspas simples.
+_DRIVE_Q_ESCAPE_TABLE = str.maketrans({"\\": "\\\\", "'": "\\'"})
+
+
 def _escape_q(s: str) -> str:
-    """Escapa aspas simples para queries do Google Drive."""
-    return s.replace("'", "\\'")
+    """Escapa aspas simples (e barras invertidas) para queries do Google Drive."""
+    return s.translate(_DRIVE_Q_ESCAPE_TABLE)
 
-def _get_or_create_subfolder(service, parent_folder_id: str, folder_name: str) -> str:
-    """Get or create a subfolder inside parent_folder_id. Returns the subfolder ID."""
-    safe_name = _escape_q(folder_name)
-    query = (
-        f"name='{safe_name}' and "
+
+@lru_cache(maxsize=1024)
+def _drive_subfolder_query(parent_folder_id: str, folder_name: str) -> str:
+    """Query de busca de subpasta por nome; estável por (pasta pai, nome)."""
+    return (
+        f"name='{_escape_q(folder_name)}' and "
         f"'{parent_folder_id}' in parents and "
         "mimeType='application/vnd.google-apps.folder' and trashed=false"
     )
+
+
+def _get_or_create_subfolder(service, parent_folder_id: str, folder_name: str) -> str:
+    """Get or create a subfolder inside parent_folder_id. Returns the subfolder ID."""
+    query = _drive_subfolder_query(parent_folder_id, folder_name)
     results = service.files().list(
         q=query, 
         fields="files(id, name)",
@@ -2585,7 +2887,7 @@ async def validate_image_search_config(
     data = {"q": "teste", "num": 1}
 
     try:
-        r = requests.post(url, headers=headers, json=data, timeout=10)
+        r = await asyncio.to_thread(requests.post, url, headers=headers, json=data, timeout=10)
         if r.status_code == 200:
             return JSONResponse(content={"valid": True, "message": "Conectado ao Serper com sucesso!"})
         else:
@@ -2602,15 +2904,33 @@ class SearchImagesIn(BaseModel):
     start: int = 1
 
 
+# Cache em memória das respostas do Serper por (query, página).
+# Resultados não dependem da chave do usuário; repetir a mesma busca
+# (retry, paginação de volta) não gera nova chamada paga.
+IMAGE_SEARCH_CACHE: Dict[tuple, Dict[str, Any]] = {}
+IMAGE_SEARCH_CACHE_TTL_SECONDS = 12 * 3600
+IMAGE_SEARCH_CACHE_MAX_ENTRIES = 1000
+
+
+def _cleanup_image_search_cache() -> None:
+    now = time.time()
+    expired = [k for k, v in IMAGE_SEARCH_CACHE.items() if now - v["cached_at"] > IMAGE_SEARCH_CACHE_TTL_SECONDS]
+    for k in expired:
+        del IMAGE_SEARCH_CACHE[k]
+    # Dict preserva ordem de inserção: descarta as entradas mais antigas.
+    while len(IMAGE_SEARCH_CACHE) > IMAGE_SEARCH_CACHE_MAX_ENTRIES:
+        IMAGE_SEARCH_CACHE.pop(next(iter(IMAGE_SEARCH_CACHE)))
+
+
+def _image_search_cache_key(query: str, page: int) -> tuple:
+    return (" ".join(query.split()).lower(), page)
+
+
 @app.post("/api/images/search")
 async def search_images(
     payload: SearchImagesIn,
-    current_user: CurrentUser = Depends(get_current_user_master),
-    db: Session = Depends(get_db)
+    cfg: Optional[UserConfig] = Depends(get_user_config)
 ):
-    user_id = str(current_user.user_id)
-    cfg = db.query(UserConfig).filter(UserConfig.user_id == user_id).first()
-
     if not cfg or not cfg.data.get("image_search", {}).get("api_key"):
         raise HTTPException(status_code=400, detail="Serper API Key não configurada no Admin.")
 
@@ -2623,7 +2943,12 @@ async def search_images(
     }
     # Calculando a página baseada no 'start' do frontend (1, 13, 25...)
     page = (payload.start // 12) + 1
-    
+
+    cache_key = _image_search_cache_key(payload.query, page)
+    cached = IMAGE_SEARCH_CACHE.get(cache_key)
+    if cached and time.time() - cached["cached_at"] <= IMAGE_SEARCH_CACHE_TTL_SECONDS:
+        return JSONResponse(content=cached["payload"])
+
     data = {
         "q": payload.query,
         "page": page,
@@ -2631,7 +2956,7 @@ async def search_images(
     }
 
     try:
-        r = requests.post(url, headers=headers, json=data, timeout=10)
+        r = await asyncio.to_thread(requests.post, url, headers=headers, json=data, timeout=10)
         r.raise_for_status()
         res_data = r.json()
 
@@ -2647,16 +2972,42 @@ async def search_images(
             for item in items
         ]
 
-        return JSONResponse(content={
+        out = {
             "images": images,
             "total": 100 # Serper não envia total exato facilmente, fixamos um valor alto
-        })
+        }
+        IMAGE_SEARCH_CACHE[cache_key] = {"payload": out, "cached_at": time.time()}
+        _cleanup_image_search_cache()
+        return JSONResponse(content=out)
     except requests.exceptions.RequestException as e:
         raise HTTPException(status_code=500, detail=f"Erro na API Serper: {str(e)}")
 
 
 # ---- Save Images to Drive ----
 
+# Pool de processos para a conversão PNG (CPU-bound, segura o GIL); criado sob
+# demanda para não iniciar processos na importação do módulo.
+_IMAGE_PROCESS_POOL: Optional[ProcessPoolExecutor] = None
+
+
+def _get_image_process_pool() -> ProcessPoolExecutor:
+    global _IMAGE_PROCESS_POOL
+    if _IMAGE_PROCESS_POOL is None:
+        # Tarefa e initializer vêm de image_conversion (módulo enxuto): sob spawn,
+        # os workers não reimportam app.py com FastAPI, banco e clientes
+        _IMAGE_PROCESS_POOL = ProcessPoolExecutor(
+            max_workers=os.cpu_count() or 4,
+            initializer=image_conversion.init_worker,
+        )
+    return _IMAGE_PROCESS_POOL
+
+
+@app.on_event("shutdown")
+def _shutdown_image_process_pool() -> None:
+    if _IMAGE_PROCESS_POOL is not None:
+        _IMAGE_PROCESS_POOL.shutdown(wait=False, cancel_futures=True)
+
+
 class SaveToDriveIn(BaseModel):
     image_urls: List[str]
     product_name: str
@@ -2666,15 +3017,11 @@ class SaveToDriveIn(BaseModel):
 @app.post("/api/images/save-to-drive")
 async def save_to_drive(
     payload: SaveToDriveIn,
-    current_user: CurrentUser = Depends(get_current_user_master),
-    db: Session = Depends(get_db)
+    cfg: Optional[UserConfig] = Depends(get_user_config)
 ):
     if not GOOGLE_DRIVE_AVAILABLE:
         raise HTTPException(status_code=500, detail="Bibliotecas do Google Drive não instaladas no servidor.")
 
-    user_id = str(current_user.user_id)
-    cfg = db.query(UserConfig).filter(UserConfig.user_id == user_id).first()
-
     drive_cfg = cfg.data.get("google_drive", {}) if cfg else {}
     folder_id = drive_cfg.get("folder_id", "")
     credentials_json = drive_cfg.get("credentials_json", "")
@@ -2697,29 +3044,32 @@ async def save_to_drive(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao criar estrutura de pastas no Drive: {str(e)}")
 
-    saved_count = 0
-    errors = []
-
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
     }
 
-    print(f"DEBUG: Iniciando salvamento de {len(payload.image_urls)} imagens na pasta '{folder_name}'")
+    loop = asyncio.get_running_loop()
+    pool = _get_image_process_pool()
 
+    # Resultado por imagem, na ordem de entrada: None (salva) ou a exceção.
+    results: List[Optional[BaseException]] = [None] * len(payload.image_urls)
+
+    # Download sequencial; a conversão para PNG de cada imagem já é enviada ao
+    # pool de processos e roda em paralelo enquanto as próximas são baixadas.
+    pending = []
     for idx, url in enumerate(payload.image_urls):
-        filename = f"{folder_name}{idx + 1:03d}.png"
         try:
             # Download image with headers to avoid bot protection
-            resp = requests.get(url, timeout=15, headers=headers)
+            resp = await asyncio.to_thread(requests.get, url, timeout=15, headers=headers)
             resp.raise_for_status()
+            pending.append((idx, loop.run_in_executor(pool, image_conversion.reencode_to_png, resp.content)))
+        except Exception as e:
+            results[idx] = e
 
-            # Convert to PNG
-            img = PIL.Image.open(BytesIO(resp.content)).convert("RGBA")
-            out_buffer = BytesIO()
-            img.save(out_buffer, format="PNG")
-            out_buffer.seek(0)
-
-            media = MediaIoBaseUpload(out_buffer, mimetype="image/png", resumable=False)
+    for idx, png_future in pending:
+        filename = f"{folder_name}{idx + 1:03d}.png"
+        try:
+            media = MediaIoBaseUpload(BytesIO(await png_future), mimetype="image/png", resumable=False)
 
             # Check if file already exists → overwrite
             existing_id = _find_file_in_folder(service, subfolder_id, filename)
@@ -2729,7 +3079,6 @@ async def save_to_drive(
                     media_body=media,
                     supportsAllDrives=True
                 ).execute()
-                print(f"DEBUG: Arquivo atualizado: {filename}")
             else:
                 service.files().create(
                     body={"name": filename, "parents": [subfolder_id]},
@@ -2737,16 +3086,21 @@ async def save_to_drive(
                     fields="id",
                     supportsAllDrives=True
                 ).execute()
-                print(f"DEBUG: Arquivo criado: {filename}")
-
-            saved_count += 1
-
         except Exception as e:
-            error_msg = f"Erro na imagem {idx + 1} ({filename}): {str(e)}"
-            print(f"ERROR: {error_msg}")
-            errors.append(error_msg)
+            results[idx] = e
 
-    print(f"DEBUG: Fim do processo. Salvas: {saved_count}, Erros: {len(errors)}")
+    errors = [
+        f"Erro na imagem {idx + 1} ({folder_name}{idx + 1:03d}.png): {str(err)}"
+        for idx, err in enumerate(results)
+        if err is not None
+    ]
+    saved_count = len(results) - len(errors)
+    logger.info(
+        "save_to_drive folder=%s total=%d saved=%d errors=%d",
+        folder_name, len(results), saved_count, len(errors),
+    )
+    if errors:
+        logger.warning("save_to_drive folder=%s falhas: %s", folder_name, errors)
 
     return JSONResponse(content={
         "status": "partial" if errors else "success",
@@ -2762,18 +3116,18 @@ class LoadSkuFilesIn(BaseModel):
 @app.post("/api/drive/load-sku-files")
 async def load_sku_files(
     payload: LoadSkuFilesIn,
-    current_user: CurrentUser = Depends(get_current_user_master),
-    db: Session = Depends(get_db)
+    cfg: Optional[UserConfig] = Depends(get_user_config)
 ):
     """
     Localiza a pasta com o nome do SKU no Drive, baixa todos os arquivos, 
     ordena ({SKU}001 primeiro) e retorna como base64 (Data URI).
+
+    Resposta em NDJSON (application/x-ndjson): uma linha
+    {"name", "type", "data_uri"} por arquivo, na ordem acima.
     """
     if not GOOGLE_DRIVE_AVAILABLE:
         raise HTTPException(status_code=500, detail="Bibliotecas do Google Drive não instaladas no servidor.")
 
-    user_id = str(current_user.user_id)
-    cfg = db.query(UserConfig).filter(UserConfig.user_id == user_id).first()
     drive_cfg = cfg.data.get("google_drive", {}) if cfg else {}
     folder_id = drive_cfg.get("folder_id", "")
     credentials_json = drive_cfg.get("credentials_json", "")
@@ -2787,14 +3141,9 @@ async def load_sku_files(
         raise HTTPException(status_code=400, detail=f"Erro ao autenticar no Drive: {str(e)}")
 
     sku_nome = payload.sku.strip().replace('/', '-').replace('\\', '-')
-    safe_name = _escape_q(sku_nome)
-    
+
     # 1. Encontrar a pasta do SKU
-    query = (
-        f"name='{safe_name}' and "
-        f"'{folder_id}' in parents and "
-        "mimeType='application/vnd.google-apps.folder' and trashed=false"
-    )
+    query = _drive_subfolder_query(folder_id, sku_nome)
     
     try:
         results = service.files().list(
@@ -2866,31 +3215,33 @@ async def load_sku_files(
     # 5. Combinar listas: Imagens primeiro, depois KDB
     all_files = img_files + kdb_files
     
-    # 6. Baixar conteúdos
-    out_files = []
-    
-    for f in all_files:
-        try:
-            req = service.files().get_media(fileId=f["id"])
-            fh = BytesIO()
-            downloader = MediaIoBaseDownload(fh, req)
-            done = False
-            while not done:
-                _, done = downloader.next_chunk()
-            
-            b64_content = base64.b64encode(fh.getvalue()).decode("utf-8")
-            data_uri = f"data:{f['mimeType']};base64,{b64_content}"
-            
-            out_files.append({
+    # 6. Baixar conteúdos, enviando cada arquivo (NDJSON, uma linha por arquivo)
+    # assim que termina o download: memória limitada a um arquivo por vez e o
+    # frontend começa a processar sem esperar o lote inteiro.
+    def iter_files_ndjson():
+        for f in all_files:
+            try:
+                req = service.files().get_media(fileId=f["id"])
+                fh = BytesIO()
+                downloader = MediaIoBaseDownload(fh, req)
+                done = False
+                while not done:
+                    _, done = downloader.next_chunk()
+
+                b64_content = base64.b64encode(fh.getvalue()).decode("utf-8")
+                data_uri = f"data:{f['mimeType']};base64,{b64_content}"
+            except Exception as e:
+                print(f"ERROR: Falha ao baixar arquivo {f['name']} (ID: {f['id']}): {e}")
+                continue
+
+            yield orjson.dumps({
                 "name": f["name"],
                 "type": f["mimeType"],
                 "data_uri": data_uri
-            })
-        except Exception as e:
-            print(f"ERROR: Falha ao baixar arquivo {f['name']} (ID: {f['id']}): {e}")
-            continue
-            
-    return JSONResponse(content={"files": out_files})
+            }) + b"\n"
+
+    # Gerador síncrono: o Starlette o consome em threadpool, fora do event loop.
+    return StreamingResponse(iter_files_ndjson(), media_type="application/x-ndjson")
 
 
 # =============================================================================
@@ -5024,7 +5375,7 @@ async def ml_publish_events(
             events = job.get("events") or []
             emitted = False
             while sent_index < len(events):
-                event_data = json.dumps(events[sent_index], ensure_ascii=False)
+                event_data = _json_text(events[sent_index])
                 yield f"data: {event_data}\n\n"
                 step = events[sent_index].get("step")
                 sent_index += 1
@@ -5561,4 +5912,4 @@ async def ml_migrate_category_paths(
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run("app:app", host="127.0.0.1", port=5002, reload=True)
+    uvicorn.run("app:app", host="127.0.0.1", port=5002, reload=True, loop="uvloop", http="httptools")
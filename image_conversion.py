@@ -0,0 +1,25 @@
+"""
+Image re-encoding run inside the save-to-Drive process pool.
+
+Kept free of app-level imports: pool workers import this module (not app.py)
+when unpickling the task, so a spawned worker only loads Pillow instead of
+FastAPI, the DB layer and every service client.
+"""
+
+from io import BytesIO
+
+import PIL.Image
+
+
+def init_worker() -> None:
+    """Pool initializer: register Pillow's format plugins once per worker."""
+    PIL.Image.init()
+
+
+def reencode_to_png(raw: bytes) -> bytes:
+    """Convert downloaded image bytes to PNG (RGBA)."""
+    img = PIL.Image.open(BytesIO(raw)).convert("RGBA")
+    out_buffer = BytesIO()
+    # Minimal zlib compression: much faster and still lossless
+    img.save(out_buffer, format="PNG", compress_level=1)
+    return out_buffer.getvalue()
@@ -1,9 +1,10 @@
-from .interface import IPriceCalculator, PriceBreakdown, WholesaleTier
+from .interface import IPriceCalculator, PriceBreakdown, PriceQuote, WholesaleTier
 from .factory import PriceCalculatorFactory
 
 __all__ = [
     "IPriceCalculator",
     "PriceBreakdown",
+    "PriceQuote",
     "WholesaleTier",
     "PriceCalculatorFactory",
 ]
@@ -1,7 +1,17 @@
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Sequence, Iterator, Tuple, NamedTuple
 from pricing.interface import IPriceCalculator, WholesaleTier, PriceBreakdown
 
 
+class _Cfg(NamedTuple):
+    """Constantes do canal resolvidas uma vez por instância"""
+    markup: float
+    tax: float
+    minm: float
+    agg: float
+    promo: float
+    tiers: Tuple[Tuple[int, float], ...]
+
+
 class BasePriceCalculator(IPriceCalculator):
     """
     Classe base com lógica comum para todas as calculadoras.
@@ -14,6 +24,21 @@ class BasePriceCalculator(IPriceCalculator):
     MIN_MARGIN = 0.20  # 20% de margem mínima
     AGGRESSIVE_DISCOUNT = 0.10  # 10% de desconto no preço agressivo
     PROMO_DISCOUNT = 0.15  # 15% de desconto promocional
+    # Tiers padrão: 5-10-20 unidades com descontos crescentes
+    WHOLESALE_TIERS = ((5, 0.95), (10, 0.90), (20, 0.85))
+
+    def __init__(self, channel: str):
+        super().__init__(channel)
+        # Lidas uma vez aqui: os caminhos quentes acessam self._cfg em vez de
+        # resolver cada DEFAULT_* pela MRO a cada chamada
+        self._cfg = _Cfg(
+            markup=self.DEFAULT_MARKUP,
+            tax=self.DEFAULT_TAX_RATE,
+            minm=self.MIN_MARGIN,
+            agg=self.AGGRESSIVE_DISCOUNT,
+            promo=self.PROMO_DISCOUNT,
+            tiers=tuple(self.WHOLESALE_TIERS),
+        )
     
     def calculate_total_cost(self, cost_price: float, shipping_cost: float) -> float:
         """Calcula custo total (produto + frete)"""
@@ -24,8 +49,8 @@ class BasePriceCalculator(IPriceCalculator):
         return total_cost * (1 + markup) / (1 - tax_rate)
     
     def get_listing_price(self, cost_price: float, shipping_cost: float = 0.0, ctx: Optional[Dict[str, Any]] = None) -> float:
-        markup = ctx.get('markup', self.DEFAULT_MARKUP) if ctx else self.DEFAULT_MARKUP
-        tax_rate = ctx.get('tax_rate', self.DEFAULT_TAX_RATE) if ctx else self.DEFAULT_TAX_RATE
+        markup = ctx.get('markup', self._cfg.markup) if ctx else self._cfg.markup
+        tax_rate = ctx.get('tax_rate', self._cfg.tax) if ctx else self._cfg.tax
         
         total_cost = self.calculate_total_cost(cost_price, shipping_cost)
         base_price = self.calculate_base_price(total_cost, markup, tax_rate)
@@ -36,40 +61,57 @@ class BasePriceCalculator(IPriceCalculator):
     def get_wholesale_tiers(self, cost_price: float, shipping_cost: float = 0.0, ctx: Optional[Dict[str, Any]] = None) -> List[WholesaleTier]:
         listing_price = self.get_listing_price(cost_price, shipping_cost, ctx)
         
-        # Tiers padrão: 5-10-20 unidades com descontos crescentes
         tiers = [
-            WholesaleTier(tier=1, min_quantity=5, price=self.apply_rounding(listing_price * 0.95, ctx)),
-            WholesaleTier(tier=2, min_quantity=10, price=self.apply_rounding(listing_price * 0.90, ctx)),
-            WholesaleTier(tier=3, min_quantity=20, price=self.apply_rounding(listing_price * 0.85, ctx)),
+            WholesaleTier(tier=tier, min_quantity=min_quantity, price=self.apply_rounding(listing_price * factor, ctx))
+            for tier, (min_quantity, factor) in enumerate(self._cfg.tiers, start=1)
         ]
         
         return tiers
     
     def get_aggressive_price(self, cost_price: float, shipping_cost: float = 0.0, ctx: Optional[Dict[str, Any]] = None) -> float:
         listing_price = self.get_listing_price(cost_price, shipping_cost, ctx)
-        discount = ctx.get('aggressive_discount', self.AGGRESSIVE_DISCOUNT) if ctx else self.AGGRESSIVE_DISCOUNT
-        
-        aggressive = listing_price * (1 - discount)
-        rounded = self.apply_rounding(aggressive, ctx)
-        
-        return self.ensure_non_negative(rounded)
+        discount = ctx.get('aggressive_discount', self._cfg.agg) if ctx else self._cfg.agg
+        return self._discounted_price(listing_price, discount, ctx)
     
     def get_promo_price(self, cost_price: float, shipping_cost: float = 0.0, ctx: Optional[Dict[str, Any]] = None) -> float:
         listing_price = self.get_listing_price(cost_price, shipping_cost, ctx)
-        discount = ctx.get('promo_discount', self.PROMO_DISCOUNT) if ctx else self.PROMO_DISCOUNT
-        
-        promo = listing_price * (1 - discount)
-        rounded = self.apply_rounding(promo, ctx)
-        
-        return self.ensure_non_negative(rounded)
+        discount = ctx.get('promo_discount', self._cfg.promo) if ctx else self._cfg.promo
+        return self._discounted_price(listing_price, discount, ctx)
+
+    def _derives_from_listing(self) -> bool:
+        """Agressivo e promocional seguem a regra padrão (não sobrescritos pela subclasse)"""
+        cls = type(self)
+        return (cls.get_aggressive_price is BasePriceCalculator.get_aggressive_price
+                and cls.get_promo_price is BasePriceCalculator.get_promo_price)
+
+    def _discounted_price(self, listing_price: float, discount: float, ctx: Optional[Dict[str, Any]] = None) -> float:
+        """Aplica desconto sobre o preço de lista, com arredondamento e piso zero"""
+        return self.ensure_non_negative(self.apply_rounding(listing_price * (1 - discount), ctx))
+    
+    def _discounted_prices(self, listing_prices: Sequence[float], discount: float,
+                           ctx: Optional[Dict[str, Any]] = None) -> List[float]:
+        """_discounted_price para vários preços de lista (arredondamento em lote)"""
+        rounded = self.apply_rounding_many([listing * (1 - discount) for listing in listing_prices], ctx)
+        return [self.ensure_non_negative(price) for price in rounded]
     
     def get_breakdown(self, cost_price: float, shipping_cost: float = 0.0, ctx: Optional[Dict[str, Any]] = None) -> PriceBreakdown:
-        markup = ctx.get('markup', self.DEFAULT_MARKUP) if ctx else self.DEFAULT_MARKUP
-        tax_rate = ctx.get('tax_rate', self.DEFAULT_TAX_RATE) if ctx else self.DEFAULT_TAX_RATE
+        markup = ctx.get('markup', self._cfg.markup) if ctx else self._cfg.markup
+        tax_rate = ctx.get('tax_rate', self._cfg.tax) if ctx else self._cfg.tax
         
         total_cost = self.calculate_total_cost(cost_price, shipping_cost)
         base_price = total_cost * (1 + markup)
         final_price = base_price / (1 - tax_rate)
+        # Preço de lista calculado uma vez; agressivo e promocional derivam dele
+        # quando a calculadora usa a regra padrão (desconto sobre a lista)
+        listing_price = self.get_listing_price(cost_price, shipping_cost, ctx)
+        if self._derives_from_listing():
+            aggressive_discount = ctx.get('aggressive_discount', self._cfg.agg) if ctx else self._cfg.agg
+            promo_discount = ctx.get('promo_discount', self._cfg.promo) if ctx else self._cfg.promo
+            aggressive_price = self._discounted_price(listing_price, aggressive_discount, ctx)
+            promo_price = self._discounted_price(listing_price, promo_discount, ctx)
+        else:
+            aggressive_price = self.get_aggressive_price(cost_price, shipping_cost, ctx)
+            promo_price = self.get_promo_price(cost_price, shipping_cost, ctx)
         
         steps = [
             {"label": "Custo do produto", "value": cost_price},
@@ -77,14 +119,49 @@ class BasePriceCalculator(IPriceCalculator):
             {"label": "Custo total (produto + frete)", "value": total_cost},
             {"label": f"Markup ({markup*100:.0f}%)", "value": base_price},
             {"label": f"Impostos ({tax_rate*100:.0f}%)", "value": final_price},
-            {"label": "Preço de lista (arredondado)", "value": self.get_listing_price(cost_price, shipping_cost, ctx)},
-            {"label": "Preço agressivo", "value": self.get_aggressive_price(cost_price, shipping_cost, ctx)},
-            {"label": "Preço promocional", "value": self.get_promo_price(cost_price, shipping_cost, ctx)},
+            {"label": "Preço de lista (arredondado)", "value": listing_price},
+            {"label": "Preço agressivo", "value": aggressive_price},
+            {"label": "Preço promocional", "value": promo_price},
         ]
         
         notes = [
             f"Canal: {self.channel}",
-            f"Margem mínima configurada: {self.MIN_MARGIN*100:.0f}%"
+            f"Margem mínima configurada: {self._cfg.minm*100:.0f}%"
         ]
         
         return PriceBreakdown(steps=steps, notes=notes)
+
+    # ---- Lotes: mesmo ctx para vários produtos (ctx lido uma única vez) ----
+
+    @staticmethod
+    def _iter_batch(cost_prices: Sequence[float],
+                    shipping_costs: Optional[Sequence[float]] = None) -> Iterator[Tuple[float, float]]:
+        if shipping_costs is None:
+            return ((cost, 0.0) for cost in cost_prices)
+        if len(shipping_costs) != len(cost_prices):
+            raise ValueError("cost_prices e shipping_costs devem ter o mesmo tamanho")
+        return zip(cost_prices, shipping_costs)
+
+    def get_listing_prices(self, cost_prices: Sequence[float], shipping_costs: Optional[Sequence[float]] = None,
+                           ctx: Optional[Dict[str, Any]] = None) -> List[float]:
+        """Preços de lista de vários produtos (mesmo resultado de get_listing_price item a item)"""
+        markup = ctx.get('markup', self._cfg.markup) if ctx else self._cfg.markup
+        tax_rate = ctx.get('tax_rate', self._cfg.tax) if ctx else self._cfg.tax
+
+        base_prices = [
+            self.calculate_base_price(self.calculate_total_cost(cost, shipping), markup, tax_rate)
+            for cost, shipping in self._iter_batch(cost_prices, shipping_costs)
+        ]
+        return [self.ensure_non_negative(price) for price in self.apply_rounding_many(base_prices, ctx)]
+
+    def get_aggressive_prices(self, cost_prices: Sequence[float], shipping_costs: Optional[Sequence[float]] = None,
+                              ctx: Optional[Dict[str, Any]] = None) -> List[float]:
+        """Preços agressivos de vários produtos"""
+        discount = ctx.get('aggressive_discount', self._cfg.agg) if ctx else self._cfg.agg
+        return self._discounted_prices(self.get_listing_prices(cost_prices, shipping_costs, ctx), discount, ctx)
+
+    def get_promo_prices(self, cost_prices: Sequence[float], shipping_costs: Optional[Sequence[float]] = None,
+                         ctx: Optional[Dict[str, Any]] = None) -> List[float]:
+        """Preços promocionais de vários produtos"""
+        discount = ctx.get('promo_discount', self._cfg.promo) if ctx else self._cfg.promo
+        return self._discounted_prices(self.get_listing_prices(cost_prices, shipping_costs, ctx), discount, ctx)
@@ -1,9 +1,117 @@
-from typing import Dict, Any, Optional, List
+import math
+from bisect import bisect_right
+from dataclasses import dataclass, field, replace
+from typing import Dict, Any, Optional, List, Sequence, Tuple, Iterable
 
-from pricing.interface import WholesaleTier, PriceBreakdown
+from pricing.interface import WholesaleTier, PriceBreakdown, PriceQuote
 from .base import BasePriceCalculator
 
 
+# Núcleo numérico do preço ML em funções simples (floats puros, sem ctx nem
+# despacho de métodos): usado pelo cálculo unitário e pelos lotes.
+
+def _ml_fixed_commission_tax(price: float) -> float:
+    if price < 29:
+        return 6.25
+    elif price < 50:
+        return 6.5
+    elif price < 79:
+        return 6.75
+    return 0.0
+
+
+# Mesma escada em forma de tabela para os lotes: bisect_right devolve o índice
+# da faixa (preço igual ao limite cai na faixa seguinte, como no "<")
+_ML_FIXED_TAX_THRESHOLDS = (29.0, 50.0, 79.0)
+_ML_FIXED_TAXES = (6.25, 6.5, 6.75, 0.0)
+# Preço de lista = promocional / (1 - 15%)
+_ML_LISTING_DIVISOR = 1 - 0.15
+
+
+def _ml_total_cost(cost_price: float, shipping_cost: float) -> float:
+    estimated_list_price = cost_price * 1.7 if cost_price < 79 else cost_price
+    return cost_price + shipping_cost + _ml_fixed_commission_tax(estimated_list_price)
+
+
+def _ceil2(x: float) -> float:
+    # Equivale a roundup(x, 2) sem o despacho de método nem o 10 ** decimals;
+    # divide por 100 (e não multiplica por 0.01) para manter os mesmos floats
+    return math.ceil(x * 100) / 100
+
+
+def _ml_promo_from_total(custo_total: float, denominador: float) -> float:
+    # Preço = Custo / (1 - %taxa_comissao - %impostos - %tacos - %mc - %lucro), arredondado para cima.
+    # Divide (não multiplica pelo inverso): x * (1 / d) muda o centavo em alguns preços exatos
+    return _ceil2(custo_total / denominador)
+
+
+def _ml_promo_price(cost_price: float, shipping_cost: float, denominador: float) -> float:
+    return _ml_promo_from_total(_ml_total_cost(cost_price, shipping_cost), denominador)
+
+
+def _ml_listing_from_promo(promo_price: float) -> float:
+    return _ceil2(promo_price / _ML_LISTING_DIVISOR)  # Acresce 15% no preço promocional
+
+
+def _ml_promo_prices(items: Iterable[Tuple[float, float]], denominador: float) -> List[float]:
+    # Versão em lote de _ml_promo_price: taxa fixa por consulta à tabela e
+    # arredondamento em linha, sem uma chamada de função por etapa
+    prices = []
+    for cost_price, shipping_cost in items:
+        estimated_list_price = cost_price * 1.7 if cost_price < 79 else cost_price
+        fixed_tax = _ML_FIXED_TAXES[bisect_right(_ML_FIXED_TAX_THRESHOLDS, estimated_list_price)]
+        prices.append(math.ceil((cost_price + shipping_cost + fixed_tax) / denominador * 100) / 100)
+    return prices
+
+
+@dataclass(frozen=True, slots=True)
+class MLParams:
+    """Percentuais de precificação ML já convertidos do ctx (lidos uma vez por chamada pública)"""
+    commission_percent: float
+    impostos: float
+    tacos: float
+    margem_contribuicao: float
+    lucro: float
+    # Derivados, calculados uma vez na construção (também em replace)
+    soma_percentuais: float = field(init=False, repr=False)
+    denominador: float = field(init=False, repr=False)
+
+    def __post_init__(self):
+        soma = self.commission_percent + self.impostos + self.tacos + self.margem_contribuicao + self.lucro
+        object.__setattr__(self, 'soma_percentuais', soma)
+        object.__setattr__(self, 'denominador', 1 - soma)
+
+    @classmethod
+    def from_ctx(cls, ctx: Dict[str, Any]) -> "MLParams":
+        return cls(
+            commission_percent=float(ctx.get('commission_percent', 0.175)),  # Considera que é Premium por padrão
+            impostos=float(ctx.get('impostos', 0.12)),  # Padrão 12%
+            tacos=float(ctx.get('tacos', 0.05)),  # Investimento em publicidade: padrão 5%
+            margem_contribuicao=float(ctx.get('margem_contribuicao', 0.10)),  # M.C.: padrão 10%
+            lucro=float(ctx.get('lucro', 0.05)),  # Lucro: padrão 5%
+        )
+
+    @classmethod
+    def for_breakdown(cls, ctx: Dict[str, Any], pricing: Optional["MLParams"] = None) -> "MLParams":
+        """
+        Percentuais exibidos no breakdown, que historicamente têm defaults próprios.
+        Se o ctx traz todas as chaves, os valores são os mesmos da precificação e
+        `pricing` (já parseado) é reaproveitado.
+        """
+        if pricing is not None and all(key in ctx for key in _ML_PARAM_KEYS):
+            return pricing
+        return cls(
+            commission_percent=float(ctx.get('commission_percent', 0.15)),
+            impostos=float(ctx.get('impostos', 0.08)),
+            tacos=float(ctx.get('tacos', 0.05)),
+            margem_contribuicao=float(ctx.get('margem_contribuicao', 0.15)),
+            lucro=float(ctx.get('lucro', 0.10)),
+        )
+
+
+_ML_PARAM_KEYS = ('commission_percent', 'impostos', 'tacos', 'margem_contribuicao', 'lucro')
+
+
 class MercadoLivrePriceCalculator(BasePriceCalculator):
     """
     Calculadora de preços para Mercado Livre.
@@ -21,20 +129,11 @@ class MercadoLivrePriceCalculator(BasePriceCalculator):
     PROMO_DISCOUNT = 0.18  # 18% desconto promocional
 
     def calc_fixed_commission_tax(self, price: float):
-        if price < 29:
-            return 6.25
-        elif price < 50:
-            return 6.5
-        elif price < 79:
-            return 6.75
-        return 0.0
+        return _ml_fixed_commission_tax(price)
 
     def calculate_total_cost(self, cost_price: float, shipping_cost: float) -> float:
-        estimated_list_price = cost_price * 1.7 if cost_price < 79 else cost_price
-        fixed_tax = self.calc_fixed_commission_tax(estimated_list_price)
-
         """Calcula custo total (produto + frete + taxa fixa por venda)"""
-        return cost_price + shipping_cost + fixed_tax
+        return _ml_total_cost(cost_price, shipping_cost)
 
     def __init__(self):
         super().__init__(channel="mercadolivre")
@@ -44,9 +143,48 @@ class MercadoLivrePriceCalculator(BasePriceCalculator):
         """
         Calcula o preço de tabela/lista para Mercado Livre baseado em:
         """
-        promo_price = self.get_promo_price(cost_price, shipping_cost, ctx)
+        if not ctx:
+            return self._listing_from_promo(super().get_listing_price(cost_price, shipping_cost, ctx))
+
+        # Direto sobre os percentuais já parseados, sem passar por get_promo_price.
+        # O preço promocional continua arredondado antes do acréscimo de 15%: dividir
+        # uma única vez por (1 - soma) * 0.85 mudaria alguns preços em R$ 0,01.
+        return self._compute(cost_price, shipping_cost, MLParams.from_ctx(ctx))[0]
 
-        return self.roundup(promo_price / (1 - 0.15), 2)  # Acresce 15% no preço promocional
+    @staticmethod
+    def _compute(cost_price: float, shipping_cost: float, params: MLParams) -> Tuple[float, float]:
+        """Preço de lista e custo total numa passada (base de get_listing_price e do breakdown)"""
+        custo_total = _ml_total_cost(cost_price, shipping_cost)
+        return _ml_listing_from_promo(_ml_promo_from_total(custo_total, params.denominador)), custo_total
+
+    def _listing_from_promo(self, promo_price: float) -> float:
+        return _ml_listing_from_promo(promo_price)
+
+    def get_quote(self, cost_price: float, shipping_cost: float = 0.0,
+                  ctx: Optional[Dict[str, Any]] = None) -> PriceQuote:
+        """
+        Cotação completa calculando o preço promocional uma única vez.
+
+        A ordem importa: atacado e agressivo gravam defaults em ctx e o breakdown
+        (último) lê esses valores, como na sequência de chamadas individuais.
+        """
+        if not ctx:
+            return super().get_quote(cost_price, shipping_cost, ctx)
+
+        promo_price = self.get_promo_price(cost_price, shipping_cost, ctx)
+        listing_price = self._listing_from_promo(promo_price)
+        listing = self.price_with_metrics(listing_price, cost_price, shipping_cost, ctx)
+        wholesale_tiers = self.get_wholesale_tiers_with_metrics(cost_price, shipping_cost, ctx)
+        aggressive = self.get_aggressive_price_with_metrics(cost_price, shipping_cost, ctx)
+        promo = self.price_with_metrics(promo_price, cost_price, shipping_cost, ctx)
+
+        return PriceQuote(
+            listing_price=listing,
+            wholesale_tiers=wholesale_tiers,
+            aggressive_price=aggressive,
+            promo_price=promo,
+            breakdown=self._build_breakdown(cost_price, shipping_cost, MLParams.for_breakdown(ctx), listing_price),
+        )
 
     def get_wholesale_tiers(self, cost_price: float, shipping_cost: float = 0.0,
                             ctx: Optional[Dict[str, Any]] = None) -> List[WholesaleTier]:
@@ -56,37 +194,35 @@ class MercadoLivrePriceCalculator(BasePriceCalculator):
         if not ctx:
             return super().get_wholesale_tiers(cost_price, shipping_cost, ctx)
 
-        lucro = float(ctx.get('lucro', 0.05))  # Lucro: padrão 5%
-        tacos = float(ctx.get('tacos', 0.05))  # Investimento em publicidade: padrão 5%
-        margem_contribuicao = float(ctx.get('margem_contribuicao', 0.10))  # M.C.: padrão 10%
-
-        ctx['lucro'] = lucro / 3 if lucro > 0 else 0.0
-        ctx['tacos'] = tacos / 3 if tacos > 0 else 0.0
-        ctx['margem_contribuicao'] = margem_contribuicao / 3 if margem_contribuicao > 0 else 0.0
-        wholesale_tier1_price = self.get_promo_price(cost_price, shipping_cost, ctx)
-        wholesale_tier1_quant = self.get_promo_price_with_metrics(cost_price, shipping_cost, ctx).metrics.value_multiple
-
-        ctx['lucro'] = lucro / 5 if lucro > 0 else 0.0
-        ctx['tacos'] = tacos / 5 if tacos > 0 else 0.0
-        ctx['margem_contribuicao'] = margem_contribuicao / 5 if margem_contribuicao > 0 else 0.0
-        wholesale_tier2_price = self.get_promo_price(cost_price, shipping_cost, ctx)
-        wholesale_tier2_quant = self.get_promo_price_with_metrics(cost_price, shipping_cost, ctx).metrics.value_multiple
-
-        ctx['lucro'] = 0.0
-        ctx['tacos'] = tacos / 10 if tacos > 0 else 0.0
-        ctx['margem_contribuicao'] = margem_contribuicao / 10 if margem_contribuicao > 0 else 0.0
-        wholesale_tier3_price = self.get_promo_price(cost_price, shipping_cost, ctx)
-        wholesale_tier3_quant = self.get_promo_price_with_metrics(cost_price, shipping_cost, ctx).metrics.value_multiple
-
-        tiers = [
-            WholesaleTier(tier=1, min_quantity=self.roundup(wholesale_tier1_quant, 0),
-                          price=self.roundup(wholesale_tier1_price, 2)),
-            WholesaleTier(tier=2, min_quantity=self.roundup(wholesale_tier2_quant, 0),
-                          price=self.roundup(wholesale_tier2_price, 2)),
-            WholesaleTier(tier=3, min_quantity=self.roundup(wholesale_tier3_quant, 0),
-                          price=self.roundup(wholesale_tier3_price, 2)),
-        ]
+        params = MLParams.from_ctx(ctx)
+        lucro, tacos, margem_contribuicao = params.lucro, params.tacos, params.margem_contribuicao
+
+        # Cada faixa reduz lucro, TACOS e M.C. (1/3, 1/5, 1/10 sem lucro); custo e
+        # taxa fixa não mudam entre as faixas, então o custo total é calculado uma vez.
+        tier_params = (
+            replace(params,
+                    lucro=lucro / 3 if lucro > 0 else 0.0,
+                    tacos=tacos / 3 if tacos > 0 else 0.0,
+                    margem_contribuicao=margem_contribuicao / 3 if margem_contribuicao > 0 else 0.0),
+            replace(params,
+                    lucro=lucro / 5 if lucro > 0 else 0.0,
+                    tacos=tacos / 5 if tacos > 0 else 0.0,
+                    margem_contribuicao=margem_contribuicao / 5 if margem_contribuicao > 0 else 0.0),
+            replace(params,
+                    lucro=0.0,
+                    tacos=tacos / 10 if tacos > 0 else 0.0,
+                    margem_contribuicao=margem_contribuicao / 10 if margem_contribuicao > 0 else 0.0),
+        )
+        custo_total = self.calculate_total_cost(cost_price, shipping_cost)
+
+        tiers = []
+        for tier, tier_param in enumerate(tier_params, start=1):
+            tier_price, tier_quant = self._promo_and_metrics(custo_total, cost_price, shipping_cost, tier_param, ctx)
+            tiers.append(WholesaleTier(tier=tier, min_quantity=self.roundup(tier_quant, 0),
+                                       price=_ceil2(tier_price)))
 
+        # Mantém o efeito histórico: os percentuais normalizados ficam registrados
+        # no ctx (o breakdown de get_quote lê esses valores)
         ctx['lucro'] = lucro
         ctx['tacos'] = tacos
         ctx['margem_contribuicao'] = margem_contribuicao
@@ -101,12 +237,14 @@ class MercadoLivrePriceCalculator(BasePriceCalculator):
         if not ctx:
             return super().get_listing_price(cost_price, shipping_cost, ctx)
 
-        margem_contribuicao = float(ctx.get('margem_contribuicao', 0.10))
-        margem_contribuicao_agressiva = margem_contribuicao / 3 if margem_contribuicao > 0 else 0.0
-        ctx['margem_contribuicao'] = margem_contribuicao_agressiva
-
-        aggressive_price = self.get_promo_price(cost_price, shipping_cost, ctx)
+        params = MLParams.from_ctx(ctx)
+        margem_contribuicao = params.margem_contribuicao
+        aggressive_params = replace(
+            params, margem_contribuicao=margem_contribuicao / 3 if margem_contribuicao > 0 else 0.0
+        )
+        aggressive_price = self._promo(cost_price, shipping_cost, aggressive_params)
 
+        # Mantém o efeito histórico: a M.C. normalizada fica registrada no ctx
         ctx['margem_contribuicao'] = margem_contribuicao
 
         return aggressive_price
@@ -119,26 +257,65 @@ class MercadoLivrePriceCalculator(BasePriceCalculator):
         if not ctx:
             return super().get_listing_price(cost_price, shipping_cost, ctx)
 
-        # Obter dados de precificação do contexto
-        taxa_comissao = float(ctx.get('commission_percent', 0.175))  # Considera que é Premium por padrão
-        impostos = float(ctx.get('impostos', 0.12))  # Padrão 12%
-        tacos = float(ctx.get('tacos', 0.05))  # Investimento em publicidade: padrão 5%
-        margem_contribuicao = float(ctx.get('margem_contribuicao', 0.10))  # M.C.: padrão 10%
-        lucro = float(ctx.get('lucro', 0.05))  # Lucro: padrão 5%
+        return self._promo(cost_price, shipping_cost, MLParams.from_ctx(ctx))
 
-        # Calcular custo total (produto + frete)
-        custo_total = self.calculate_total_cost(cost_price, shipping_cost)
+    def _promo_and_metrics(self, custo_total: float, cost_price: float, shipping_cost: float,
+                           params: MLParams, ctx: Dict[str, Any]) -> Tuple[float, float]:
+        """Preço promocional e seu múltiplo de valor numa só passada (custo total já calculado)"""
+        price = _ml_promo_from_total(custo_total, params.denominador)
+        return price, self.calculate_metrics(price, cost_price, shipping_cost, ctx).value_multiple
 
-        # Calcular denominador (1 - soma de todos os percentuais)
-        # Preço = Custo / (1 - %taxa_comissao - %impostos - %tacos - %mc - %lucro)
-        soma_percentuais = taxa_comissao + impostos + tacos + margem_contribuicao + lucro
+    @staticmethod
+    def _promo(cost_price: float, shipping_cost: float, params: MLParams) -> float:
+        """Preço promocional a partir de parâmetros já convertidos"""
+        return _ml_promo_price(cost_price, shipping_cost, params.denominador)
 
-        denominador = 1 - soma_percentuais
+    def get_promo_prices(self, cost_prices: Sequence[float], shipping_costs: Optional[Sequence[float]] = None,
+                         ctx: Optional[Dict[str, Any]] = None) -> List[float]:
+        """Preços promocionais de vários produtos com o mesmo ctx (percentuais somados uma vez)"""
+        if not ctx:
+            return super().get_listing_prices(cost_prices, shipping_costs, ctx)
+
+        denominador = MLParams.from_ctx(ctx).denominador
+        return _ml_promo_prices(self._iter_batch(cost_prices, shipping_costs), denominador)
 
-        # Calcular preço base
-        preco_base = custo_total / denominador
+    def get_promo_prices_batch(self, cost_prices: Sequence[float], shipping_costs: Sequence[float],
+                               ctxs: Sequence[Optional[Dict[str, Any]]]) -> List[float]:
+        """
+        Preços promocionais de um catálogo em que cada SKU tem o próprio ctx
+        (comissão, impostos, TACOS etc.). Equivale a get_promo_price item a item.
+        """
+        if not (len(cost_prices) == len(shipping_costs) == len(ctxs)):
+            raise ValueError("cost_prices, shipping_costs e ctxs devem ter o mesmo tamanho")
+
+        promo_prices: List[float] = []
+        for cost, shipping, ctx in zip(cost_prices, shipping_costs, ctxs):
+            if not ctx:
+                promo_prices.append(super().get_listing_price(cost, shipping, ctx))
+                continue
+            promo_prices.append(self._promo(cost, shipping, MLParams.from_ctx(ctx)))
+        return promo_prices
+
+    def get_listing_prices(self, cost_prices: Sequence[float], shipping_costs: Optional[Sequence[float]] = None,
+                           ctx: Optional[Dict[str, Any]] = None) -> List[float]:
+        """Preços de lista de vários produtos (derivados do promocional, como em get_listing_price)"""
+        if not ctx:
+            promo_prices = super().get_listing_prices(cost_prices, shipping_costs, ctx)
+        else:
+            denominador = MLParams.from_ctx(ctx).denominador
+            promo_prices = _ml_promo_prices(self._iter_batch(cost_prices, shipping_costs), denominador)
+        return list(map(_ml_listing_from_promo, promo_prices))
+
+    def get_aggressive_prices(self, cost_prices: Sequence[float], shipping_costs: Optional[Sequence[float]] = None,
+                              ctx: Optional[Dict[str, Any]] = None) -> List[float]:
+        """Preços agressivos de vários produtos (M.C. reduzida a 1/3, sem alterar o ctx recebido)"""
+        if not ctx:
+            return super().get_listing_prices(cost_prices, shipping_costs, ctx)
 
-        return self.roundup(preco_base, 2)
+        margem_contribuicao = float(ctx.get('margem_contribuicao', 0.10))
+        aggressive_ctx = dict(ctx)
+        aggressive_ctx['margem_contribuicao'] = margem_contribuicao / 3 if margem_contribuicao > 0 else 0.0
+        return self.get_promo_prices(cost_prices, shipping_costs, aggressive_ctx)
 
     def get_breakdown(self, cost_price: float, shipping_cost: float = 0.0,
                       ctx: Optional[Dict[str, Any]] = None) -> PriceBreakdown:
@@ -149,17 +326,26 @@ class MercadoLivrePriceCalculator(BasePriceCalculator):
         if not ctx:
             return super().get_breakdown(cost_price, shipping_cost, ctx)
 
+        # ctx parseado uma vez: o mesmo MLParams serve ao preço e, quando o ctx
+        # é completo, também ao breakdown
+        params = MLParams.from_ctx(ctx)
+        preco_final, custo_total = self._compute(cost_price, shipping_cost, params)
+        return self._build_breakdown(cost_price, shipping_cost, MLParams.for_breakdown(ctx, params), preco_final,
+                                     custo_total)
+
+    def _build_breakdown(self, cost_price: float, shipping_cost: float, params: MLParams,
+                         preco_final: float, custo_total: Optional[float] = None) -> PriceBreakdown:
         # Usar comissão diretamente informada
-        comissao = float(ctx.get('commission_percent', 0.15))
+        comissao = params.commission_percent
         tipo_anuncio = f"{comissao * 100:.1f}%"  # Exibir percentual no breakdown
 
         # Obter configurações
-        impostos = ctx.get('impostos', 0.08)
-        tacos = ctx.get('tacos', 0.05)
-        margem_contribuicao = ctx.get('margem_contribuicao', 0.15)
-        lucro = ctx.get('lucro', 0.10)
-        custo_total = self.calculate_total_cost(cost_price, shipping_cost)
-        preco_final = self.get_listing_price(cost_price, shipping_cost, ctx)
+        impostos = params.impostos
+        tacos = params.tacos
+        margem_contribuicao = params.margem_contribuicao
+        lucro = params.lucro
+        if custo_total is None:
+            custo_total = self.calculate_total_cost(cost_price, shipping_cost)
         fixed_commission_tax_cost = custo_total - cost_price - shipping_cost
 
         # Calcular valores absolutos
@@ -169,13 +355,16 @@ class MercadoLivrePriceCalculator(BasePriceCalculator):
         valor_mc = preco_final * margem_contribuicao
         valor_lucro = preco_final * lucro
 
+        # Literais com f-string: rótulos fixos são constantes compiladas e só os
+        # percentuais são formatados (mais rápido que template único + split)
+        tipo_anuncio = tipo_anuncio.title()
         steps = [
             {"label": "💰 Custo do produto", "value": cost_price},
             {"label": "📦 Custo de frete", "value": shipping_cost},
             {"label": "🏪 Taxa fixa de comissão", "value": fixed_commission_tax_cost},
             {"label": "➕ Custo total (produto + frete)", "value": custo_total},
             {"label": "─────────────────────", "value": 0},
-            {"label": f"🏪 Comissão ML {tipo_anuncio.title()}", "value": valor_comissao},
+            {"label": f"🏪 Comissão ML {tipo_anuncio}", "value": valor_comissao},
             {"label": f"🧾 Impostos ({impostos * 100:.1f}%)", "value": valor_impostos},
             {"label": f"📢 Investimento Publicidade/TACOS ({tacos * 100:.1f}%)", "value": valor_tacos},
             {"label": f"📊 Margem de Contribuição ({margem_contribuicao * 100:.1f}%)", "value": valor_mc},
@@ -185,8 +374,8 @@ class MercadoLivrePriceCalculator(BasePriceCalculator):
         ]
 
         notes = [
-            f"Canal: Mercado Livre ({tipo_anuncio.title()})",
-            f"Soma de percentuais: {(comissao + impostos + tacos + margem_contribuicao + lucro) * 100:.1f}%",
+            f"Canal: Mercado Livre ({tipo_anuncio})",
+            f"Soma de percentuais: {params.soma_percentuais * 100:.1f}%",
             f"Markup aplicado: {((preco_final / custo_total - 1) * 100):.1f}%",
             "Clássico ML: 10-14% comissão | Premium ML: 15-19% comissão"
         ]
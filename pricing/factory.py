@@ -30,10 +30,16 @@ class PriceCalculatorFactory:
         "telemarketing": TelemarketingPriceCalculator,
     }
     
+    # Uma instância por canal: as calculadoras não guardam estado por chamada
+    # (só self.channel e constantes), então podem ser compartilhadas. Novas
+    # calculadoras devem continuar sem estado mutável.
+    _INSTANCES: Dict[str, IPriceCalculator] = {}
+
     @classmethod
     def get(cls, channel: str) -> IPriceCalculator:
         """
-        Retorna a calculadora apropriada para o canal especificado.
+        Retorna a calculadora apropriada para o canal especificado
+        (instância compartilhada por canal).
         
         Args:
             channel: Nome do canal (case-insensitive)
@@ -44,8 +50,17 @@ class PriceCalculatorFactory:
         Raises:
             ValueError: Se o canal não for suportado
         """
+        # Caminho rápido: nome já canônico (minúsculo, sem espaços) dispensa normalizar
+        calculator = cls._INSTANCES.get(channel)
+        if calculator is not None:
+            return calculator
+
         channel_lower = channel.lower().strip()
-        
+
+        calculator = cls._INSTANCES.get(channel_lower)
+        if calculator is not None:
+            return calculator
+
         calculator_class = cls._CALCULATORS.get(channel_lower)
         
         if not calculator_class:
@@ -55,8 +70,9 @@ class PriceCalculatorFactory:
                 f"Canais disponíveis: {supported}"
             )
         
-        return calculator_class()
-    
+        calculator = cls._INSTANCES[channel_lower] = calculator_class()
+        return calculator
+
     @classmethod
     def get_supported_channels(cls) -> list:
         """Retorna lista de canais suportados"""
@@ -65,4 +81,4 @@ class PriceCalculatorFactory:
     @classmethod
     def is_supported(cls, channel: str) -> bool:
         """Verifica se um canal é suportado"""
-        return channel.lower().strip() in cls._CALCULATORS
+        return channel in cls._CALCULATORS or channel.lower().strip() in cls._CALCULATORS
@@ -1,8 +1,29 @@
 import math
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Sequence, Tuple
 from pydantic import BaseModel
 
+__all__ = [
+    "PriceMetrics",
+    "PriceWithMetrics",
+    "WholesaleTier",
+    "PriceBreakdown",
+    "PriceQuote",
+    "IPriceCalculator",
+]
+
+
+def _apply_rounding(price: float, ctx: Optional[Dict[str, Any]] = None) -> float:
+    """Regra de arredondamento de apply_rounding, sem depender de instância"""
+    if ctx and ctx.get('rounding') == 'none':
+        return math.ceil(price * 100) / 100
+
+    # Default: arredonda para .99
+    if price < 1.0:
+        return math.ceil(price * 100) / 100
+
+    return float(int(price)) + 0.99
+
 
 class PriceMetrics(BaseModel):
     """Métricas financeiras de um preço"""
@@ -32,6 +53,26 @@ class PriceBreakdown(BaseModel):
     steps: List[Dict[str, Any]]
     notes: Optional[List[str]] = None
 
+    # Visão em colunas dos passos (rótulos e valores em tuplas paralelas) para
+    # agregações entre produtos, ex.: sum(bd.values[5:10]). São propriedades,
+    # não campos: o JSON da API continua só com steps/notes.
+    @property
+    def labels(self) -> Tuple[str, ...]:
+        return tuple(step["label"] for step in self.steps)
+
+    @property
+    def values(self) -> Tuple[float, ...]:
+        return tuple(step["value"] for step in self.steps)
+
+
+class PriceQuote(BaseModel):
+    """Cotação completa: todos os preços derivados com métricas e breakdown"""
+    listing_price: PriceWithMetrics
+    wholesale_tiers: List[WholesaleTier]
+    aggressive_price: PriceWithMetrics
+    promo_price: PriceWithMetrics
+    breakdown: PriceBreakdown
+
 
 class IPriceCalculator(ABC):
     """
@@ -141,17 +182,27 @@ class IPriceCalculator(ABC):
         Returns:
             PriceMetrics com todas as métricas calculadas
         """
-        total_cost = cost_price + shipping_cost + self.calc_fixed_commission_tax(price)
-
         # Obter taxas do contexto ou usar defaults
         if ctx is None:
             ctx = {}
 
         impostos_pct = ctx.get('impostos', 0.0)
         commission_pct = ctx.get('commission_percent', 0.0)
-        tacos_pct = ctx.get('tacos', 0.0)
-        margem_contrib_pct = ctx.get('margem_contribuicao', 0.0)
-        lucro_pct = ctx.get('lucro', 0.0)
+        return self._metrics(price, cost_price, shipping_cost, impostos_pct, commission_pct)
+
+    def calculate_metrics_many(self, prices: Sequence[float], cost_price: float, shipping_cost: float = 0.0,
+                               ctx: Optional[Dict[str, Any]] = None) -> List[PriceMetrics]:
+        """Métricas de vários preços do mesmo produto (ex: tiers), com as taxas lidas do ctx uma vez"""
+        if ctx is None:
+            ctx = {}
+
+        impostos_pct = ctx.get('impostos', 0.0)
+        commission_pct = ctx.get('commission_percent', 0.0)
+        return [self._metrics(price, cost_price, shipping_cost, impostos_pct, commission_pct) for price in prices]
+
+    def _metrics(self, price: float, cost_price: float, shipping_cost: float,
+                 impostos_pct: float, commission_pct: float) -> PriceMetrics:
+        total_cost = cost_price + shipping_cost + self.calc_fixed_commission_tax(price)
 
         # Calcular impostos e comissões
         taxes = price * impostos_pct
@@ -175,36 +226,56 @@ class IPriceCalculator(ABC):
             commissions=round(commissions_taxes, 2)
         )
 
+    def price_with_metrics(self, price: float, cost_price: float, shipping_cost: float = 0.0,
+                           ctx: Optional[Dict[str, Any]] = None) -> PriceWithMetrics:
+        """Anexa métricas a um preço já calculado"""
+        metrics = self.calculate_metrics(price, cost_price, shipping_cost, ctx)
+        return PriceWithMetrics(price=price, metrics=metrics)
+
     def get_listing_price_with_metrics(self, cost_price: float, shipping_cost: float = 0.0,
                                        ctx: Optional[Dict[str, Any]] = None) -> PriceWithMetrics:
         """Retorna preço de lista com métricas"""
         price = self.get_listing_price(cost_price, shipping_cost, ctx)
-        metrics = self.calculate_metrics(price, cost_price, shipping_cost, ctx)
-        return PriceWithMetrics(price=price, metrics=metrics)
+        return self.price_with_metrics(price, cost_price, shipping_cost, ctx)
 
     def get_aggressive_price_with_metrics(self, cost_price: float, shipping_cost: float = 0.0,
                                           ctx: Optional[Dict[str, Any]] = None) -> PriceWithMetrics:
         """Retorna preço agressivo com métricas"""
         price = self.get_aggressive_price(cost_price, shipping_cost, ctx)
-        metrics = self.calculate_metrics(price, cost_price, shipping_cost, ctx)
-        return PriceWithMetrics(price=price, metrics=metrics)
+        return self.price_with_metrics(price, cost_price, shipping_cost, ctx)
 
     def get_promo_price_with_metrics(self, cost_price: float, shipping_cost: float = 0.0,
                                      ctx: Optional[Dict[str, Any]] = None) -> PriceWithMetrics:
         """Retorna preço promocional com métricas"""
         price = self.get_promo_price(cost_price, shipping_cost, ctx)
-        metrics = self.calculate_metrics(price, cost_price, shipping_cost, ctx)
-        return PriceWithMetrics(price=price, metrics=metrics)
+        return self.price_with_metrics(price, cost_price, shipping_cost, ctx)
 
     def get_wholesale_tiers_with_metrics(self, cost_price: float, shipping_cost: float = 0.0,
                                          ctx: Optional[Dict[str, Any]] = None) -> List[WholesaleTier]:
         """Retorna tiers de atacado com métricas"""
         tiers = self.get_wholesale_tiers(cost_price, shipping_cost, ctx)
         # Adicionar métricas para cada tier
-        for tier in tiers:
-            tier.metrics = self.calculate_metrics(tier.price, cost_price, shipping_cost, ctx)
+        metrics = self.calculate_metrics_many([tier.price for tier in tiers], cost_price, shipping_cost, ctx)
+        for tier, tier_metrics in zip(tiers, metrics):
+            tier.metrics = tier_metrics
         return tiers
 
+    def get_quote(self, cost_price: float, shipping_cost: float = 0.0,
+                  ctx: Optional[Dict[str, Any]] = None) -> PriceQuote:
+        """
+        Calcula a cotação completa (lista, atacado, agressivo, promocional e breakdown).
+
+        A implementação padrão delega aos métodos individuais; calculadoras
+        podem sobrescrever para reaproveitar cálculos intermediários.
+        """
+        return PriceQuote(
+            listing_price=self.get_listing_price_with_metrics(cost_price, shipping_cost, ctx),
+            wholesale_tiers=self.get_wholesale_tiers_with_metrics(cost_price, shipping_cost, ctx),
+            aggressive_price=self.get_aggressive_price_with_metrics(cost_price, shipping_cost, ctx),
+            promo_price=self.get_promo_price_with_metrics(cost_price, shipping_cost, ctx),
+            breakdown=self.get_breakdown(cost_price, shipping_cost, ctx),
+        )
+
     @staticmethod
     def roundup(n, decimals=0):
         fator = 10 ** decimals
@@ -221,14 +292,16 @@ class IPriceCalculator(ABC):
         Returns:
             Preço arredondado
         """
-        if ctx and ctx.get('rounding') == 'none':
-            return self.roundup(price, 2)
-
-        # Default: arredonda para .99
-        if price < 1.0:
-            return self.roundup(price, 2)
+        return _apply_rounding(price, ctx)
 
-        return float(int(price)) + 0.99
+    def apply_rounding_many(self, prices: Sequence[float], ctx: Optional[Dict[str, Any]] = None) -> List[float]:
+        """
+        apply_rounding para uma lista de preços (mesma regra, _apply_rounding).
+        Calculadoras que sobrescrevem apply_rounding continuam com a própria regra.
+        """
+        if type(self).apply_rounding is not IPriceCalculator.apply_rounding:
+            return [self.apply_rounding(price, ctx) for price in prices]
+        return [_apply_rounding(price, ctx) for price in prices]
 
     @staticmethod
     def ensure_non_negative(price: float) -> float:
@@ -1,12 +1,18 @@
 """Mercado Livre shipping table scraping and lookup."""
 
+import asyncio
+import bisect
+import functools
+import json
 import logging
+import os
 import re
 from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional, Tuple
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
 
 import httpx
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
 
 # Scraper settings
 ML_SHIPPING_URL = "https://www.mercadolivre.com.br/ajuda/40538"
@@ -16,17 +22,85 @@ USER_AGENT = (
 )
 
 # Cache
-_shipping_cache: Dict[str, Any] = {"data": None, "last_fetched": None}
+# etag/last_modified: validators of the page behind "data", for conditional GETs.
+_shipping_cache: Dict[str, Any] = {"data": None, "last_fetched": None, "etag": None, "last_modified": None}
 CACHE_TTL = timedelta(hours=12)
+# How long past CACHE_TTL expired tables may still be served while a background
+# refresh runs; older than that, lookups wait for the fetch and fail if it fails.
+CACHE_MAX_STALE = timedelta(hours=36)
+# Hard cap on the downloaded page; the real one is a few hundred KB.
+MAX_PAGE_BYTES = 4_000_000
+
+# On-disk copy of the cache, shared by workers and kept across restarts.
+DISK_CACHE_PATH = Path(
+    os.getenv("ML_SHIPPING_CACHE_PATH")
+    or Path.home() / ".cache" / "ads-generator" / "ml_shipping.json"
+)
+
+# Single-flight refresh: one scrape at a time; once data exists, an expired
+# cache is served as-is while a background task refreshes it. The lock is
+# created on first use, inside the running loop (see _get_refresh_lock).
+_refresh_lock: Optional[asyncio.Lock] = None
+_refresh_task: Optional["asyncio.Task[None]"] = None
+# Warm start from DISK_CACHE_PATH happens on the first _ensure_shipping_cache,
+# not at import (importing the module must not touch the filesystem).
+_disk_cache_checked = False
+
+
+class _PriceBand(NamedTuple):
+    """Frozen lookup form of one cached table: tiers as parallel tuples (SoA)."""
+
+    min_price: float
+    max_price: float
+    max_weights: Tuple[float, ...]
+    prices: Tuple[float, ...]
+
+
+# Lookup index over _shipping_cache["data"] (band min prices + _PriceBand per
+# band) for bisect; rebuilt when the list changes. The cached dicts stay the
+# JSON-friendly format used by the disk tier and the layout validation.
+_shipping_index: Dict[str, Any] = {
+    "source": None,
+    "version": 0,
+    "min_prices": [],
+    "tables": [],
+    "disjoint": True,
+}
 
 logger = logging.getLogger(__name__)
 _NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)?")
+_GRAMS_RE = re.compile(r"\bg\b")
+# Single-pass accent folding for _normalize_text (was one str.replace per letter).
+_ACCENT_TRANS = str.maketrans("áàâãéêíóôõúç", "aaaaeeiooouc")
 
 
 class MLShippingError(Exception):
     pass
 
 
+# Shared client for the scrape: keeps the TLS connection (HTTP/2 keep-alive)
+# alive between refreshes instead of a new handshake per fetch.
+_HTTP_CLIENT: Optional[httpx.AsyncClient] = None
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is None or _HTTP_CLIENT.is_closed:
+        _HTTP_CLIENT = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(15.0, connect=3.0, write=5.0, pool=5.0),
+            limits=httpx.Limits(max_connections=8, max_keepalive_connections=4),
+            headers={"User-Agent": USER_AGENT},
+        )
+    return _HTTP_CLIENT
+
+
+async def close_http_client() -> None:
+    """Close the shared client; register on app shutdown."""
+    if _HTTP_CLIENT is not None:
+        await _HTTP_CLIENT.aclose()
+
+
 def _is_valid_numeric(value: Any) -> bool:
     return isinstance(value, (int, float))
 
@@ -75,23 +149,7 @@ def _is_shipping_tables_layout_valid(tables: Any) -> bool:
 
 
 def _normalize_text(value: str) -> str:
-    text = (value or "").lower().strip()
-    replacements = {
-        "á": "a",
-        "à": "a",
-        "â": "a",
-        "ã": "a",
-        "é": "e",
-        "ê": "e",
-        "í": "i",
-        "ó": "o",
-        "ô": "o",
-        "õ": "o",
-        "ú": "u",
-        "ç": "c",
-    }
-    for src, dst in replacements.items():
-        text = text.replace(src, dst)
+    text = (value or "").lower().translate(_ACCENT_TRANS)
     return " ".join(text.split())
 
 
@@ -121,8 +179,7 @@ def _extract_numbers(text: str) -> List[float]:
 
 def _parse_weight(weight_str: str) -> float:
     """Convert a weight range string to max weight (kg)."""
-    raw = str(weight_str or "").strip()
-    normalized = _normalize_text(raw)
+    normalized = _normalize_text(str(weight_str or ""))
     if not normalized:
         return 0.0
 
@@ -137,7 +194,7 @@ def _parse_weight(weight_str: str) -> float:
     max_val = numbers[1] if len(numbers) >= 2 else numbers[0]
 
     # Convert grams to kg only when unit is explicitly g (not kg)
-    has_grams = bool(re.search(r"\bg\b", normalized)) and "kg" not in normalized
+    has_grams = "kg" not in normalized and _GRAMS_RE.search(normalized) is not None
     if has_grams:
         return max_val / 1000.0
 
@@ -171,17 +228,16 @@ def _parse_price_range_header(header_str: str) -> Optional[Tuple[float, float]]:
     return None
 
 
-def _parse_matrix_table(table) -> List[Dict[str, Any]]:
-    rows = table.find_all("tr")
+def _parse_matrix_table(rows: List[List[str]]) -> List[Dict[str, Any]]:
+    """Parse one table given as rows of cell texts (see _extract_tables)."""
     if len(rows) < 2:
         return []
 
-    header_cells = rows[0].find_all(["th", "td"])
-    if len(header_cells) < 2:
+    header_values = rows[0]
+    if len(header_values) < 2:
         return []
 
-    header_values = [c.get_text(" ", strip=True) for c in header_cells]
-    if "peso" not in _normalize_text(header_values[0]):
+    if not _is_weight_header(header_values[0]):
         return []
 
     column_ranges: List[Optional[Tuple[float, float]]] = [
@@ -196,11 +252,9 @@ def _parse_matrix_table(table) -> List[Dict[str, Any]]:
         min_price, max_price = parsed_range
         per_range.append({"min_price": min_price, "max_price": max_price, "tiers": []})
 
-    for row in rows[1:]:
-        cols = row.find_all(["th", "td"])
-        if len(cols) < 2:
+    for values in rows[1:]:
+        if len(values) < 2:
             continue
-        values = [c.get_text(" ", strip=True) for c in cols]
         max_weight = _parse_weight(values[0])
         if max_weight <= 0 and max_weight != float("inf"):
             continue
@@ -222,24 +276,45 @@ def _parse_matrix_table(table) -> List[Dict[str, Any]]:
     return parsed
 
 
-async def _fetch_shipping_tables() -> List[Dict[str, Any]]:
-    """Fetch and parse Mercado Livre shipping ranges by sale-price bands."""
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.get(
-                ML_SHIPPING_URL,
-                headers={"User-Agent": USER_AGENT},
-                timeout=15.0,
-            )
-            resp.raise_for_status()
-        except Exception as exc:
-            logger.error("Error fetching Mercado Livre shipping table: %s", exc)
-            raise MLShippingError(f"Communication failure: {exc}") from exc
+def _is_weight_header(text: str) -> bool:
+    return "peso" in _normalize_text(text)
+
+
+def _extract_tables(html: str) -> List[List[List[str]]]:
+    """
+    Return the candidate <table>s in the page as rows of th/td texts.
 
-    soup = BeautifulSoup(resp.text, "html.parser")
+    Parsed with lexbor (selectolax), several times faster than BeautifulSoup
+    on the help page. Only the first header cell is read to discard tables
+    that are not a weight matrix (same check as _parse_matrix_table), so the
+    page's other tables are never walked row by row.
+    """
+    extracted: List[List[List[str]]] = []
+    for table in LexborHTMLParser(html).css("table"):
+        first_row = table.css_first("tr")
+        first_cell = None
+        if first_row is not None:
+            first_cell = next((cell for cell in first_row.traverse() if cell.tag in ("th", "td")), None)
+        if first_cell is None or not _is_weight_header(first_cell.text(separator=" ", strip=True)):
+            continue
+        extracted.append(
+            [
+                [
+                    cell.text(separator=" ", strip=True)
+                    for cell in row.traverse()
+                    if cell.tag in ("th", "td")
+                ]
+                for row in table.css("tr")
+            ]
+        )
+    return extracted
+
+
+def _parse_html(html: str) -> List[Dict[str, Any]]:
+    """Parse the help page into price bands sorted by (min_price, max_price)."""
     parsed_tables: List[Dict[str, Any]] = []
-    for table in soup.find_all("table"):
-        parsed_tables.extend(_parse_matrix_table(table))
+    for rows in _extract_tables(html):
+        parsed_tables.extend(_parse_matrix_table(rows))
 
     parsed_tables.sort(
         key=lambda item: (
@@ -250,30 +325,178 @@ async def _fetch_shipping_tables() -> List[Dict[str, Any]]:
     return parsed_tables
 
 
-async def is_shipping_layout_valid() -> bool:
+async def _fetch_shipping_tables() -> List[Dict[str, Any]]:
+    """
+    Fetch and parse Mercado Livre shipping ranges by sale-price bands.
+
+    With tables already cached, the request is conditional (ETag /
+    Last-Modified); on 304 the cached list is returned as-is, unparsed.
+    """
+    headers: Dict[str, str] = {}
+    if _shipping_cache["data"]:
+        if _shipping_cache["etag"]:
+            headers["If-None-Match"] = _shipping_cache["etag"]
+        if _shipping_cache["last_modified"]:
+            headers["If-Modified-Since"] = _shipping_cache["last_modified"]
+
+    try:
+        # Streamed so an oversized body is cut at MAX_PAGE_BYTES instead of
+        # being buffered whole.
+        async with _get_http_client().stream("GET", ML_SHIPPING_URL, headers=headers) as resp:
+            if resp.status_code == 304 and _shipping_cache["data"]:
+                logger.info("Mercado Livre shipping page not modified; keeping cached tables.")
+                return _shipping_cache["data"]
+            resp.raise_for_status()
+            chunks: List[bytes] = []
+            total = 0
+            async for chunk in resp.aiter_bytes(65536):
+                total += len(chunk)
+                if total > MAX_PAGE_BYTES:
+                    raise MLShippingError(f"Shipping page larger than {MAX_PAGE_BYTES} bytes")
+                chunks.append(chunk)
+            html = b"".join(chunks).decode(resp.encoding or "utf-8", errors="replace")
+    except MLShippingError as exc:
+        logger.error("Error fetching Mercado Livre shipping table: %s", exc)
+        raise
+    except Exception as exc:
+        logger.error("Error fetching Mercado Livre shipping table: %s", exc)
+        raise MLShippingError(f"Communication failure: {exc}") from exc
+
+    # Parsing is CPU-bound (tens of ms on the full page): keep it off the loop.
+    parsed_tables = await asyncio.to_thread(_parse_html, html)
+    # Validators only once the page they describe has been parsed.
+    _shipping_cache["etag"] = resp.headers.get("ETag")
+    _shipping_cache["last_modified"] = resp.headers.get("Last-Modified")
+    return parsed_tables
+
+
+def _load_disk_cache() -> bool:
+    """Load the on-disk tables into memory when they are newer than ours."""
+    try:
+        payload = json.loads(DISK_CACHE_PATH.read_text(encoding="utf-8"))
+        data = payload["data"]
+        last_fetched = datetime.fromisoformat(payload["last_fetched"])
+        validators = {key: payload.get(key) for key in ("etag", "last_modified")}
+    except FileNotFoundError:
+        return False
+    except Exception as exc:
+        logger.warning("Ignoring unreadable shipping cache file %s: %s", DISK_CACHE_PATH, exc)
+        return False
+
+    if not isinstance(data, list) or not data:
+        return False
+    current = _shipping_cache["last_fetched"]
+    if _shipping_cache["data"] is not None and current is not None and current >= last_fetched:
+        return False
+    _shipping_cache["data"] = data
+    _shipping_cache["last_fetched"] = last_fetched
+    _shipping_cache.update(validators)
+    return True
+
+
+def _save_disk_cache() -> None:
+    """Write the in-memory tables to disk atomically (tmp file + os.replace)."""
+    if not _shipping_cache["data"]:
+        return
+    payload = {
+        "data": _shipping_cache["data"],
+        "last_fetched": _shipping_cache["last_fetched"].isoformat(),
+        "etag": _shipping_cache["etag"],
+        "last_modified": _shipping_cache["last_modified"],
+    }
+    tmp_path = DISK_CACHE_PATH.with_name(f"{DISK_CACHE_PATH.name}.{os.getpid()}.tmp")
+    try:
+        DISK_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path.write_text(json.dumps(payload), encoding="utf-8")
+        os.replace(tmp_path, DISK_CACHE_PATH)
+    except OSError as exc:
+        logger.warning("Unable to persist shipping cache to %s: %s", DISK_CACHE_PATH, exc)
+
+
+def _cache_age() -> Optional[timedelta]:
+    """Age of the cached tables, or None when there are none."""
+    last_fetched = _shipping_cache["last_fetched"]
+    if _shipping_cache["data"] is None or last_fetched is None:
+        return None
+    return datetime.now() - last_fetched
+
+
+def _is_cache_fresh() -> bool:
+    age = _cache_age()
+    return age is not None and age <= CACHE_TTL
+
+
+def _get_refresh_lock() -> asyncio.Lock:
+    global _refresh_lock
+    if _refresh_lock is None:
+        _refresh_lock = asyncio.Lock()
+    return _refresh_lock
+
+
+async def _refresh_shipping_cache() -> None:
+    """Fetch the tables unless a concurrent refresh already did (single-flight)."""
+    async with _get_refresh_lock():
+        # Another worker may have scraped already; its file is as good as ours.
+        if _is_cache_fresh() or (_load_disk_cache() and _is_cache_fresh()):
+            return
+        logger.info("Refreshing Mercado Livre shipping ranges cache...")
+        now = datetime.now()
+        _shipping_cache["data"] = await _fetch_shipping_tables()
+        _shipping_cache["last_fetched"] = now
+        _save_disk_cache()
+
+
+async def _background_refresh() -> None:
+    try:
+        await _refresh_shipping_cache()
+    except Exception as exc:
+        # Stale data keeps being served; the next request retries the refresh.
+        logger.error("Background refresh of Mercado Livre shipping table failed: %s", exc)
+
+
+async def _ensure_shipping_cache(allow_stale: bool = True) -> None:
+    """
+    Make cached tables available: a cold cache waits for the fetch; an expired
+    cache up to CACHE_MAX_STALE past its TTL is kept (stale-while-revalidate)
+    and refreshed in the background. Past that, or with ``allow_stale=False``,
+    the fetch is awaited and its MLShippingError propagates.
+    """
+    global _refresh_task, _disk_cache_checked
+    if not _disk_cache_checked:
+        # Warm start: reuse the last scrape from any worker instead of hitting ML again.
+        _disk_cache_checked = True
+        _load_disk_cache()
+    if _is_cache_fresh():
+        return
+    age = _cache_age()
+    if not allow_stale or age is None or age > CACHE_TTL + CACHE_MAX_STALE:
+        await _refresh_shipping_cache()
+        return
+    if not _get_refresh_lock().locked() and (_refresh_task is None or _refresh_task.done()):
+        _refresh_task = asyncio.create_task(_background_refresh())
+
+
+async def is_shipping_layout_valid(allow_stale: bool = True) -> bool:
     """
     Validate if the Mercado Livre shipping page layout is still parseable.
 
+    By default this checks the tables quotes are actually priced from, so
+    within CACHE_MAX_STALE it answers from expired tables and leaves the
+    refresh to the background. ``allow_stale=False`` is for explicit health
+    checks: past CACHE_TTL the page is fetched again, and a failed fetch
+    reports False.
+
     Returns:
         bool: True when parsed structure is compatible with the expected format.
     """
-    now = datetime.now()
-    need_refresh = (
-        _shipping_cache["data"] is None
-        or _shipping_cache["last_fetched"] is None
-        or (now - _shipping_cache["last_fetched"]) > CACHE_TTL
-    )
-
-    if need_refresh:
-        try:
-            _shipping_cache["data"] = await _fetch_shipping_tables()
-            _shipping_cache["last_fetched"] = now
-        except MLShippingError as exc:
-            logger.error("Unable to validate Mercado Livre shipping layout: %s", exc)
-            return False
-        except Exception as exc:
-            logger.error("Unexpected error while validating shipping layout: %s", exc)
-            return False
+    try:
+        await _ensure_shipping_cache(allow_stale=allow_stale)
+    except MLShippingError as exc:
+        logger.error("Unable to validate Mercado Livre shipping layout: %s", exc)
+        return False
+    except Exception as exc:
+        logger.error("Unexpected error while validating shipping layout: %s", exc)
+        return False
 
     tables = _shipping_cache.get("data") or []
     is_valid = _is_shipping_tables_layout_valid(tables)
@@ -282,6 +505,75 @@ async def is_shipping_layout_valid() -> bool:
     return is_valid
 
 
+def _get_shipping_index(tables: List[Dict[str, Any]]) -> Dict[str, Any]:
+    if _shipping_index["source"] is not tables:
+        indexed = [
+            _PriceBand(
+                float(table["min_price"]),
+                float(table["max_price"]),
+                tuple(float(tier["max_weight"]) for tier in table["tiers"]),
+                tuple(float(tier["price"]) for tier in table["tiers"]),
+            )
+            for table in tables
+        ]
+        _shipping_index["min_prices"] = [band.min_price for band in indexed]
+        _shipping_index["tables"] = indexed
+        _shipping_index["disjoint"] = all(
+            prev.max_price < cur.min_price for prev, cur in zip(indexed, indexed[1:])
+        )
+        _shipping_index["source"] = tables
+        _shipping_index["version"] += 1
+    return _shipping_index
+
+
+def _find_price_band(index: Dict[str, Any], base_price: float) -> Optional[_PriceBand]:
+    tables: List[_PriceBand] = index["tables"]
+    if index["disjoint"]:
+        # Sorted, non-overlapping bands: only the last band starting at or
+        # below the price can contain it.
+        idx = bisect.bisect_right(index["min_prices"], base_price) - 1
+        if idx >= 0 and base_price <= tables[idx].max_price:
+            return tables[idx]
+    else:
+        for table in tables:
+            if table.min_price <= base_price <= table.max_price:
+                return table
+
+    # Final open-ended tier
+    for table in tables:
+        if table.max_price == float("inf") and base_price >= table.min_price:
+            return table
+    return None
+
+
+@functools.lru_cache(maxsize=4096)
+def _lookup(base_price: float, weight_kg: float, cache_version: int) -> float:
+    """
+    Shipping price for a (base price, weight) pair in the current index.
+
+    ``cache_version`` only keys the LRU: it changes whenever the tables are
+    replaced, so entries computed from older tables are never hit again.
+    """
+    target_table = _find_price_band(_shipping_index, base_price)
+    if target_table is None:
+        return 0.0
+
+    prices = target_table.prices
+    if not prices:
+        return 0.0
+    idx = bisect.bisect_left(target_table.max_weights, weight_kg)
+    # If no upper bound matched, use the last tier as fallback.
+    return prices[idx] if idx < len(prices) else prices[-1]
+
+
+def _base_price(cost_price: float, reference_price: Optional[float]) -> float:
+    return (
+        float(reference_price)
+        if reference_price is not None and float(reference_price) > 0
+        else (float(cost_price) * 2.0)
+    )
+
+
 async def get_shipping_cost(
     cost_price: float,
     weight_kg: float,
@@ -294,51 +586,38 @@ async def get_shipping_cost(
     - reference_price (if > 0) OR
     - cost_price * 2
     """
-    base_price = (
-        float(reference_price)
-        if reference_price is not None and float(reference_price) > 0
-        else (float(cost_price) * 2.0)
-    )
+    costs = await get_shipping_costs([cost_price], [weight_kg], [reference_price])
+    return costs[0]
 
+
+async def get_shipping_costs(
+    cost_prices: Sequence[float],
+    weights_kg: Sequence[float],
+    reference_prices: Optional[Sequence[Optional[float]]] = None,
+) -> List[float]:
+    """
+    Bulk version of get_shipping_cost: one cache check for the whole batch,
+    then an indexed lookup per item. Results keep the input order.
+    """
+    if reference_prices is None:
+        reference_prices = [None] * len(cost_prices)
+    if not (len(cost_prices) == len(weights_kg) == len(reference_prices)):
+        raise ValueError("cost_prices, weights_kg and reference_prices must have the same length")
+
+    base_prices = [_base_price(cost, ref) for cost, ref in zip(cost_prices, reference_prices)]
     # Business rule: below threshold, shipping subsidy is not applied.
-    if base_price <= 78.99:
-        return 0.0
+    if all(base_price <= 78.99 for base_price in base_prices):
+        return [0.0] * len(base_prices)
 
-    now = datetime.now()
-    if (
-        _shipping_cache["data"] is None
-        or _shipping_cache["last_fetched"] is None
-        or (now - _shipping_cache["last_fetched"]) > CACHE_TTL
-    ):
-        logger.info("Refreshing Mercado Livre shipping ranges cache...")
-        _shipping_cache["data"] = await _fetch_shipping_tables()
-        _shipping_cache["last_fetched"] = now
+    await _ensure_shipping_cache()
 
     tables = _shipping_cache["data"] or []
     if not tables:
         logger.warning("Shipping table parse failed; returning 0.0 as fallback.")
-        return 0.0
-
-    target_table: Optional[Dict[str, Any]] = None
-    for table in tables:
-        if table["min_price"] <= base_price <= table["max_price"]:
-            target_table = table
-            break
-
-    if target_table is None:
-        # Final open-ended tier
-        for table in tables:
-            if table["max_price"] == float("inf") and base_price >= table["min_price"]:
-                target_table = table
-                break
-
-    if not target_table:
-        return 0.0
+        return [0.0] * len(base_prices)
 
-    target_weight = max(float(weight_kg or 0.0), 0.0)
-    for tier in target_table["tiers"]:
-        if target_weight <= tier["max_weight"]:
-            return float(tier["price"])
-
-    # If no upper bound matched, use the last tier as fallback.
-    return float(target_table["tiers"][-1]["price"]) if target_table["tiers"] else 0.0
+    version = _get_shipping_index(tables)["version"]
+    return [
+        _lookup(base_price, max(float(weight_kg or 0.0), 0.0), version) if base_price > 78.99 else 0.0
+        for base_price, weight_kg in zip(base_prices, weights_kg)
+    ]
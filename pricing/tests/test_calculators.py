@@ -2,9 +2,14 @@ import pytest
 from pricing import PriceCalculatorFactory
 
 
-def test_listing_price_is_greater_than_cost():
+@pytest.fixture(scope="module", params=PriceCalculatorFactory.get_supported_channels())
+def calc(request):
+    """Calculadora de cada canal suportado (invariantes valem para todos)"""
+    return PriceCalculatorFactory.get(request.param)
+
+
+def test_listing_price_is_greater_than_cost(calc):
     """Testa se preço de lista é sempre maior que custo total"""
-    calc = PriceCalculatorFactory.get("mercadolivre")
     cost = 100.0
     shipping = 10.0
     
@@ -13,9 +18,8 @@ def test_listing_price_is_greater_than_cost():
     assert listing_price > (cost + shipping)
 
 
-def test_prices_are_non_negative():
+def test_prices_are_non_negative(calc):
     """Testa se todos os preços são não-negativos"""
-    calc = PriceCalculatorFactory.get("shopee")
     cost = 50.0
     shipping = 5.0
     
@@ -24,33 +28,19 @@ def test_prices_are_non_negative():
     assert calc.get_promo_price(cost, shipping) >= 0
 
 
-def test_aggressive_price_is_less_than_listing():
-    """Testa se preço agressivo é menor que preço de lista"""
-    calc = PriceCalculatorFactory.get("amazon")
+def test_aggressive_and_promo_are_less_than_listing(calc):
+    """Testa se preços agressivo e promocional são menores que o de lista"""
     cost = 100.0
     shipping = 15.0
     
     listing = calc.get_listing_price(cost, shipping)
-    aggressive = calc.get_aggressive_price(cost, shipping)
     
-    assert aggressive < listing
+    assert calc.get_aggressive_price(cost, shipping) < listing
+    assert calc.get_promo_price(cost, shipping) < listing
 
 
-def test_promo_price_is_less_than_listing():
-    """Testa se preço promocional é menor que preço de lista"""
-    calc = PriceCalculatorFactory.get("magalu")
-    cost = 100.0
-    shipping = 10.0
-    
-    listing = calc.get_listing_price(cost, shipping)
-    promo = calc.get_promo_price(cost, shipping)
-    
-    assert promo < listing
-
-
-def test_wholesale_tiers_are_monotonic():
+def test_wholesale_tiers_are_monotonic(calc):
     """Testa se tiers de atacado têm preços decrescentes"""
-    calc = PriceCalculatorFactory.get("ecommerce")
     cost = 100.0
     shipping = 12.0
     
@@ -79,6 +69,17 @@ def test_different_channels_produce_different_prices():
     assert ml_price != shopee_price
 
 
+def test_ml_listing_price_uses_percentage_formula_with_ctx():
+    """Testa se o ML com ctx usa a fórmula por percentuais (e não o markup padrão)"""
+    calc = PriceCalculatorFactory.get("mercadolivre")
+    ctx = {"commission_percent": 0.165, "impostos": 0.12, "tacos": 0.05, "margem_contribuicao": 0.10, "lucro": 0.05}
+
+    # Custo total 110 (sem taxa fixa acima de R$ 79) / (1 - 48,5%) = 213,60; lista = 213,60 / 0,85
+    assert calc.get_promo_price(100.0, 10.0, dict(ctx)) == 213.60
+    assert calc.get_listing_price(100.0, 10.0, dict(ctx)) == 251.30
+    assert calc.get_listing_price(100.0, 10.0, dict(ctx)) != calc.get_listing_price(100.0, 10.0)
+
+
 def test_rounding_applies_99_cents():
     """Testa se arredondamento aplica .99 por padrão"""
     calc = PriceCalculatorFactory.get("telemarketing")
@@ -105,6 +106,18 @@ def test_breakdown_contains_all_steps():
     assert len(breakdown.notes) >= 1
 
 
+def test_breakdown_column_view_matches_steps():
+    """Testa a visão em colunas (labels/values) sem alterar a serialização"""
+    calc = PriceCalculatorFactory.get("mercadolivre")
+    ctx = {"commission_percent": 0.165, "impostos": 0.12, "tacos": 0.05, "margem_contribuicao": 0.10, "lucro": 0.05}
+
+    breakdown = calc.get_breakdown(80.0, 12.0, ctx)
+
+    assert breakdown.labels == tuple(step["label"] for step in breakdown.steps)
+    assert breakdown.values == tuple(step["value"] for step in breakdown.steps)
+    assert set(breakdown.model_dump()) == {"steps", "notes"}
+
+
 def test_custom_context_changes_pricing():
     """Testa se contexto customizado altera precificação"""
     calc = PriceCalculatorFactory.get("shopee")  # Usar Shopee que usa lógica padrão
@@ -118,9 +131,8 @@ def test_custom_context_changes_pricing():
     assert custom_price > default_price
 
 
-def test_shipping_cost_increases_final_price():
+def test_shipping_cost_increases_final_price(calc):
     """Testa se custo de frete aumenta o preço final"""
-    calc = PriceCalculatorFactory.get("amazon")
     cost = 100.0
     
     price_without_shipping = calc.get_listing_price(cost, 0.0)
@@ -128,3 +140,86 @@ def test_shipping_cost_increases_final_price():
     
     # Preço com frete deve ser maior
     assert price_with_shipping > price_without_shipping
+
+
+@pytest.mark.parametrize("channel, ctx", [
+    ("shopee", None),
+    ("mercadolivre", None),
+    ("mercadolivre", {"commission_percent": 0.165, "impostos": 0.12}),
+    ("mercadolivre", {"commission_percent": 0.12, "impostos": 0.1, "tacos": 0.03,
+                      "margem_contribuicao": 0.08, "lucro": 0.04}),
+])
+def test_get_quote_matches_individual_calls(channel, ctx):
+    """Testa se get_quote produz o mesmo resultado das chamadas individuais em sequência"""
+    calc = PriceCalculatorFactory.get(channel)
+    cost = 42.0
+    shipping = 12.5
+
+    sequential_ctx = dict(ctx) if ctx is not None else None
+    expected = {
+        "listing_price": calc.get_listing_price_with_metrics(cost, shipping, sequential_ctx).model_dump(),
+        "wholesale_tiers": [t.model_dump() for t in calc.get_wholesale_tiers_with_metrics(cost, shipping, sequential_ctx)],
+        "aggressive_price": calc.get_aggressive_price_with_metrics(cost, shipping, sequential_ctx).model_dump(),
+        "promo_price": calc.get_promo_price_with_metrics(cost, shipping, sequential_ctx).model_dump(),
+        "breakdown": calc.get_breakdown(cost, shipping, sequential_ctx).model_dump(),
+    }
+
+    quote_ctx = dict(ctx) if ctx is not None else None
+    assert calc.get_quote(cost, shipping, quote_ctx).model_dump() == expected
+    assert quote_ctx == sequential_ctx
+
+
+@pytest.mark.parametrize("channel, ctx", [
+    ("shopee", None),
+    ("amazon", {"markup": 1.5, "tax_rate": 0.1, "rounding": "none"}),
+    ("mercadolivre", None),
+    ("mercadolivre", {"commission_percent": 0.165, "impostos": 0.12}),
+])
+def test_batch_prices_match_single_calls(channel, ctx):
+    """Testa se os métodos em lote reproduzem as chamadas individuais, na mesma ordem"""
+    calc = PriceCalculatorFactory.get(channel)
+    costs = [9.9, 42.0, 78.5, 150.0]
+    shippings = [0.0, 12.5, 20.0, 35.0]
+
+    for batch_method, single_method in (
+        (calc.get_listing_prices, calc.get_listing_price),
+        (calc.get_aggressive_prices, calc.get_aggressive_price),
+        (calc.get_promo_prices, calc.get_promo_price),
+    ):
+        expected = [single_method(c, s, dict(ctx) if ctx else None) for c, s in zip(costs, shippings)]
+        assert batch_method(costs, shippings, dict(ctx) if ctx else None) == expected
+
+
+def test_batch_prices_require_matching_lengths():
+    calc = PriceCalculatorFactory.get("shopee")
+
+    with pytest.raises(ValueError):
+        calc.get_listing_prices([10.0, 20.0], [1.0])
+
+
+def test_ml_promo_prices_batch_with_per_sku_ctx():
+    """Testa o lote do ML com ctx diferente por SKU (inclusive sem ctx)"""
+    calc = PriceCalculatorFactory.get("mercadolivre")
+    costs = [9.9, 42.0, 150.0]
+    shippings = [0.0, 12.5, 35.0]
+    ctxs = [
+        {"commission_percent": 0.12, "impostos": 0.04},
+        None,
+        {"commission_percent": 0.19, "impostos": 0.12, "tacos": 0.02, "margem_contribuicao": 0.05, "lucro": 0.0},
+    ]
+
+    expected = [calc.get_promo_price(c, s, ctx) for c, s, ctx in zip(costs, shippings, ctxs)]
+
+    assert calc.get_promo_prices_batch(costs, shippings, ctxs) == expected
+
+
+def test_ml_listing_price_depends_only_on_inputs():
+    """Testa o preço de lista ML: mesmas entradas, mesmo preço; ctx diferente recalcula"""
+    calc = PriceCalculatorFactory.get("mercadolivre")
+    ctx = {"commission_percent": 0.165, "impostos": 0.12, "tacos": 0.05, "margem_contribuicao": 0.10, "lucro": 0.05}
+
+    first = calc.get_listing_price(100.0, 10.0, dict(ctx))
+    assert calc.get_listing_price(100.0, 10.0, dict(ctx)) == first == 251.30
+    assert calc.get_listing_price(100.0, 10.0, {**ctx, "lucro": 0.10}) > first
+    # Chaves extras no ctx (mesmo não hasheáveis) não mudam o preço
+    assert calc.get_listing_price(100.0, 10.0, {**ctx, "tags": ["a"]}) == first
@@ -39,6 +39,12 @@ def test_factory_is_case_insensitive():
     assert calc1.channel == calc2.channel == calc3.channel == "mercadolivre"
 
 
+def test_factory_reuses_instance_per_channel():
+    """Testa se Factory devolve a mesma instância (sem estado) por canal"""
+    assert PriceCalculatorFactory.get("shopee") is PriceCalculatorFactory.get(" Shopee ")
+    assert PriceCalculatorFactory.get("shopee") is not PriceCalculatorFactory.get("amazon")
+
+
 def test_factory_get_supported_channels():
     """Testa se get_supported_channels retorna lista correta"""
     channels = PriceCalculatorFactory.get_supported_channels()
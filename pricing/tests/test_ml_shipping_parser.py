@@ -1,6 +1,9 @@
 import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
 from typing import Any
 
+import httpx
 import pytest
 
 from pricing import ml_shipping
@@ -78,15 +81,29 @@ ML_MATRIX_HTML = """
 
 
 class _FakeResponse:
-    status_code = 200
-
-    def __init__(self, text: str):
+    def __init__(self, text: str, status_code: int = 200, headers: dict[str, str] | None = None):
         self.text = text
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.encoding = "utf-8"
+
+    async def aiter_bytes(self, chunk_size: int | None = None):
+        yield self.text.encode("utf-8")
 
     def raise_for_status(self) -> None:
         return None
 
 
+def _patch_get(monkeypatch, fake_get) -> None:
+    """Serve fake_get responses through AsyncClient.stream (used by the fetch)."""
+
+    @asynccontextmanager
+    async def fake_stream(self, method, url, headers=None, timeout=None):  # noqa: ANN001
+        yield await fake_get(self, url, headers=headers)
+
+    monkeypatch.setattr("httpx.AsyncClient.stream", fake_stream)
+
+
 def _find_range(tables: list[dict[str, Any]], min_price: float, max_price: float) -> dict[str, Any]:
     for table in tables:
         if table["min_price"] == pytest.approx(min_price) and table["max_price"] == pytest.approx(max_price):
@@ -94,11 +111,24 @@ def _find_range(tables: list[dict[str, Any]], min_price: float, max_price: float
     raise AssertionError(f"Range {min_price}-{max_price} not found")
 
 
+@pytest.fixture(autouse=True)
+def _isolated_shipping_cache(tmp_path, monkeypatch):
+    """Fresh module state per test (restored afterwards); each test runs its own
+    event loop, so the lock and task must not carry over either."""
+    monkeypatch.setattr(ml_shipping, "DISK_CACHE_PATH", tmp_path / "ml_shipping.json")
+    monkeypatch.setattr(
+        ml_shipping, "_shipping_cache", {"data": None, "last_fetched": None, "etag": None, "last_modified": None}
+    )
+    monkeypatch.setattr(ml_shipping, "_refresh_lock", None)
+    monkeypatch.setattr(ml_shipping, "_refresh_task", None)
+    monkeypatch.setattr(ml_shipping, "_disk_cache_checked", False)
+
+
 def test_fetch_shipping_tables_parses_matrix_layout(monkeypatch):
     async def fake_get(self, url, headers=None, timeout=None):  # noqa: ANN001
         return _FakeResponse(ML_MATRIX_HTML)
 
-    monkeypatch.setattr("httpx.AsyncClient.get", fake_get)
+    _patch_get(monkeypatch, fake_get)
 
     tables = asyncio.run(ml_shipping._fetch_shipping_tables())
 
@@ -121,14 +151,11 @@ def test_fetch_shipping_tables_parses_matrix_layout(monkeypatch):
 
 
 def test_get_shipping_cost_uses_parsed_ranges(monkeypatch):
-    # Reset cache to avoid bleed from other tests.
-    ml_shipping._shipping_cache["data"] = None
-    ml_shipping._shipping_cache["last_fetched"] = None
 
     async def fake_get(self, url, headers=None, timeout=None):  # noqa: ANN001
         return _FakeResponse(ML_MATRIX_HTML)
 
-    monkeypatch.setattr("httpx.AsyncClient.get", fake_get)
+    _patch_get(monkeypatch, fake_get)
 
     # Base <= 78.99 still follows business rule and returns zero.
     assert asyncio.run(ml_shipping.get_shipping_cost(cost_price=24.9, weight_kg=0.2)) == pytest.approx(0.0)
@@ -146,26 +173,196 @@ def test_get_shipping_cost_uses_parsed_ranges(monkeypatch):
 
 
 def test_is_shipping_layout_valid_returns_true_for_expected_matrix(monkeypatch):
-    ml_shipping._shipping_cache["data"] = None
-    ml_shipping._shipping_cache["last_fetched"] = None
 
     async def fake_get(self, url, headers=None, timeout=None):  # noqa: ANN001
         return _FakeResponse(ML_MATRIX_HTML)
 
-    monkeypatch.setattr("httpx.AsyncClient.get", fake_get)
+    _patch_get(monkeypatch, fake_get)
 
     assert asyncio.run(ml_shipping.is_shipping_layout_valid()) is True
 
 
 def test_is_shipping_layout_valid_returns_false_when_layout_changes(monkeypatch):
-    ml_shipping._shipping_cache["data"] = None
-    ml_shipping._shipping_cache["last_fetched"] = None
 
     html_without_shipping_matrix = "<html><body><div>layout changed</div></body></html>"
 
     async def fake_get(self, url, headers=None, timeout=None):  # noqa: ANN001
         return _FakeResponse(html_without_shipping_matrix)
 
-    monkeypatch.setattr("httpx.AsyncClient.get", fake_get)
+    _patch_get(monkeypatch, fake_get)
 
     assert asyncio.run(ml_shipping.is_shipping_layout_valid()) is False
+
+
+def test_get_shipping_cost_serves_stale_cache_while_refreshing(monkeypatch):
+    stale_tables = [{"min_price": 79.0, "max_price": float("inf"), "tiers": [{"max_weight": float("inf"), "price": 99.0}]}]
+    ml_shipping._shipping_cache["data"] = stale_tables
+    ml_shipping._shipping_cache["last_fetched"] = datetime.now() - ml_shipping.CACHE_TTL - timedelta(minutes=1)
+
+    async def fake_get(self, url, headers=None, timeout=None):  # noqa: ANN001
+        return _FakeResponse(ML_MATRIX_HTML)
+
+    _patch_get(monkeypatch, fake_get)
+
+    async def _run():
+        stale_cost = await ml_shipping.get_shipping_cost(cost_price=49.8, weight_kg=0.4)
+        await ml_shipping._refresh_task
+        return stale_cost, await ml_shipping.get_shipping_cost(cost_price=49.8, weight_kg=0.4)
+
+    stale_cost, fresh_cost = asyncio.run(_run())
+
+    # Expired data answers immediately; the background refresh replaces it.
+    assert stale_cost == pytest.approx(99.0)
+    assert fresh_cost == pytest.approx(13.25)
+
+
+def test_get_shipping_cost_fails_once_cache_is_past_max_stale(monkeypatch):
+    ml_shipping._shipping_cache["data"] = [
+        {"min_price": 79.0, "max_price": float("inf"), "tiers": [{"max_weight": float("inf"), "price": 99.0}]}
+    ]
+    ml_shipping._shipping_cache["last_fetched"] = (
+        datetime.now() - ml_shipping.CACHE_TTL - ml_shipping.CACHE_MAX_STALE - timedelta(minutes=1)
+    )
+
+    async def failing_get(self, url, headers=None, timeout=None):  # noqa: ANN001
+        raise httpx.ConnectError("ML down")
+
+    _patch_get(monkeypatch, failing_get)
+
+    with pytest.raises(ml_shipping.MLShippingError):
+        asyncio.run(ml_shipping.get_shipping_cost(cost_price=49.8, weight_kg=0.4))
+
+
+def test_is_shipping_layout_valid_checks_served_stale_tables_when_fetch_fails(monkeypatch):
+    ml_shipping._shipping_cache["data"] = [
+        {"min_price": 79.0, "max_price": float("inf"), "tiers": [{"max_weight": float("inf"), "price": 99.0}]}
+    ]
+    ml_shipping._shipping_cache["last_fetched"] = datetime.now() - ml_shipping.CACHE_TTL - timedelta(minutes=1)
+
+    async def failing_get(self, url, headers=None, timeout=None):  # noqa: ANN001
+        raise httpx.ConnectError("ML down")
+
+    _patch_get(monkeypatch, failing_get)
+
+    async def _run():
+        served_ok = await ml_shipping.is_shipping_layout_valid()
+        await ml_shipping._refresh_task
+        # Stale tables still price quotes, but don't vouch for the live page.
+        return served_ok, await ml_shipping.is_shipping_layout_valid(allow_stale=False)
+
+    assert asyncio.run(_run()) == (True, False)
+
+
+def test_concurrent_cold_cache_fetches_once(monkeypatch):
+    calls = []
+
+    async def fake_get(self, url, headers=None, timeout=None):  # noqa: ANN001
+        calls.append(url)
+        await asyncio.sleep(0.01)
+        return _FakeResponse(ML_MATRIX_HTML)
+
+    _patch_get(monkeypatch, fake_get)
+
+    async def _run():
+        return await asyncio.gather(*(ml_shipping.get_shipping_cost(cost_price=49.8, weight_kg=0.4) for _ in range(5)))
+
+    assert asyncio.run(_run()) == [pytest.approx(13.25)] * 5
+    assert len(calls) == 1
+
+
+def test_refresh_persists_tables_and_restart_loads_them(monkeypatch):
+    async def fake_get(self, url, headers=None, timeout=None):  # noqa: ANN001
+        return _FakeResponse(ML_MATRIX_HTML)
+
+    _patch_get(monkeypatch, fake_get)
+    asyncio.run(ml_shipping.get_shipping_cost(cost_price=49.8, weight_kg=0.4))
+    assert ml_shipping.DISK_CACHE_PATH.exists()
+
+    # Simulate a fresh process: empty memory, the file alone answers the quote,
+    # read on the first lookup rather than at import.
+    monkeypatch.setattr(
+        ml_shipping, "_shipping_cache", {"data": None, "last_fetched": None, "etag": None, "last_modified": None}
+    )
+    monkeypatch.setattr(ml_shipping, "_refresh_lock", None)
+    monkeypatch.setattr(ml_shipping, "_disk_cache_checked", False)
+
+    async def failing_get(self, url, headers=None, timeout=None):  # noqa: ANN001
+        raise AssertionError("should not scrape with a fresh disk cache")
+
+    _patch_get(monkeypatch, failing_get)
+    cost = asyncio.run(ml_shipping.get_shipping_cost(cost_price=200.0, weight_kg=2000.0))
+    assert cost == pytest.approx(ml_shipping._shipping_cache["data"][-1]["tiers"][-1]["price"])
+
+
+def test_get_shipping_costs_batch_matches_single_calls(monkeypatch):
+    calls = []
+
+    async def fake_get(self, url, headers=None, timeout=None):  # noqa: ANN001
+        calls.append(url)
+        return _FakeResponse(ML_MATRIX_HTML)
+
+    _patch_get(monkeypatch, fake_get)
+
+    costs = [10.0, 49.8, 60.0, 120.0, 30.0]
+    weights = [0.2, 0.4, 0.8, 200.0, 1.0]
+    refs = [None, None, 150.0, None, 0.0]
+
+    async def _run():
+        batch = await ml_shipping.get_shipping_costs(costs, weights, refs)
+        singles = [await ml_shipping.get_shipping_cost(c, w, r) for c, w, r in zip(costs, weights, refs)]
+        return batch, singles
+
+    batch, singles = asyncio.run(_run())
+
+    assert batch == singles
+    assert batch[0] == 0.0
+    assert len(calls) == 1
+
+    with pytest.raises(ValueError):
+        asyncio.run(ml_shipping.get_shipping_costs([10.0, 20.0], [1.0]))
+
+
+def test_refresh_uses_conditional_get_and_keeps_tables_on_304(monkeypatch):
+    sent_headers = []
+
+    async def fake_get(self, url, headers=None, timeout=None):  # noqa: ANN001
+        sent_headers.append(dict(headers or {}))
+        if headers and headers.get("If-None-Match") == '"v1"':
+            return _FakeResponse("", status_code=304)
+        return _FakeResponse(ML_MATRIX_HTML, headers={"ETag": '"v1"', "Last-Modified": "Wed, 01 Jan 2025 00:00:00 GMT"})
+
+    _patch_get(monkeypatch, fake_get)
+
+    first = asyncio.run(ml_shipping._fetch_shipping_tables())
+    ml_shipping._shipping_cache["data"] = first
+    second = asyncio.run(ml_shipping._fetch_shipping_tables())
+
+    assert sent_headers[0] == {}
+    assert sent_headers[1] == {"If-None-Match": '"v1"', "If-Modified-Since": "Wed, 01 Jan 2025 00:00:00 GMT"}
+    assert second is first
+
+
+def test_fetch_shipping_tables_rejects_oversized_page(monkeypatch):
+    monkeypatch.setattr(ml_shipping, "MAX_PAGE_BYTES", 100)
+
+    async def fake_get(self, url, headers=None, timeout=None):  # noqa: ANN001
+        return _FakeResponse(ML_MATRIX_HTML)
+
+    _patch_get(monkeypatch, fake_get)
+
+    with pytest.raises(ml_shipping.MLShippingError):
+        asyncio.run(ml_shipping._fetch_shipping_tables())
+
+
+def test_extract_tables_keeps_only_weight_matrices():
+    html = """
+    <table><tr><th>Categoria</th><th>Taxa</th></tr><tr><td>Livros</td><td>R$ 6,00</td></tr></table>
+    <table>
+      <tr><th><span>Peso</span>*</th><th>R$ 79 a <b>R$ 99,99</b></th></tr>
+      <tr><td> Até 0,3 kg </td><td>R$ 12,35</td></tr>
+    </table>
+    """
+
+    assert ml_shipping._extract_tables(html) == [
+        [["Peso *", "R$ 79 a R$ 99,99"], ["Até 0,3 kg", "R$ 12,35"]],
+    ]
@@ -34,42 +34,45 @@ def main():
     cur = conn.cursor()
 
     # --- Cria DB se não existir ---
+    # CREATE DATABASE não roda dentro de DO/transação: tenta direto e trata o
+    # "já existe" (uma ida ao servidor em vez de SELECT + CREATE).
     print(f"📦 Criando database '{app_db_name}' (se não existir)…")
-    cur.execute("SELECT 1 FROM pg_database WHERE datname = %s;", (app_db_name,))
-    if cur.fetchone() is None:
+    try:
         cur.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(app_db_name)))
         print("   ✔ Database criado.")
-    else:
+    except psycopg.errors.DuplicateDatabase:
         print("   ✔ Database já existe.")
 
-    # --- Cria usuário se não existir / atualiza senha ---
+    # --- Cria usuário se não existir / atualiza senha + privilégios ---
+    # Criação condicional no servidor (bloco DO, sem senha) e o GRANT vão juntos no
+    # mesmo pipeline, sem esperar a resposta de cada comando.
     print(f"👤 Criando usuário '{app_db_user}' (se não existir)…")
-    cur.execute("SELECT 1 FROM pg_roles WHERE rolname = %s;", (app_db_user,))
-    if cur.fetchone() is None:
-        # psycopg3: DDL não aceita parâmetros tipo %s → usar sql.Literal
-        cur.execute(
-            sql.SQL("CREATE USER {} WITH PASSWORD {}").format(
-                sql.Identifier(app_db_user),
-                sql.Literal(app_db_password),
-            )
-        )
-        print("   ✔ Usuário criado.")
-    else:
-        print("   ✔ Usuário já existe, atualizando senha…")
+    create_user = sql.SQL(
+        "DO $setup$ BEGIN "
+        "IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = {name}) THEN "
+        "EXECUTE format('CREATE USER %I', {name}); "
+        "END IF; END $setup$"
+    ).format(name=sql.Literal(app_db_user))
+
+    print("🔐 Ajustando privilégios no DATABASE…")
+    with conn.pipeline():
+        cur.execute(create_user)
         cur.execute(
-            sql.SQL("ALTER USER {} WITH PASSWORD {}").format(
+            sql.SQL("GRANT ALL PRIVILEGES ON DATABASE {} TO {}").format(
+                sql.Identifier(app_db_name),
                 sql.Identifier(app_db_user),
-                sql.Literal(app_db_password),
             )
         )
 
-    print("🔐 Ajustando privilégios no DATABASE…")
-    cur.execute(
-        sql.SQL("GRANT ALL PRIVILEGES ON DATABASE {} TO {}").format(
-            sql.Identifier(app_db_name),
-            sql.Identifier(app_db_user),
+    # Senha num comando próprio e parametrizado, fora do bloco DO. DDL não aceita
+    # parâmetros do servidor ($1), então o ClientCursor faz o binding no cliente.
+    print("🔑 Definindo senha do usuário…")
+    with psycopg.ClientCursor(conn) as pw_cur:
+        pw_cur.execute(
+            sql.SQL("ALTER ROLE {} WITH PASSWORD %s").format(sql.Identifier(app_db_user)),
+            (app_db_password,),
         )
-    )
+    print("   ✔ Usuário, senha e privilégios ajustados.")
 
     cur.close()
     conn.close()
@@ -87,19 +90,20 @@ def main():
     )
     cur_app = conn_app.cursor()
 
-    # Permissão para criar objetos no schema public
-    cur_app.execute(
-        sql.SQL("GRANT USAGE, CREATE ON SCHEMA public TO {}").format(
-            sql.Identifier(app_db_user)
+    with conn_app.pipeline():
+        # Permissão para criar objetos no schema public
+        cur_app.execute(
+            sql.SQL("GRANT USAGE, CREATE ON SCHEMA public TO {}").format(
+                sql.Identifier(app_db_user)
+            )
         )
-    )
 
-    # (Opcional, mas deixa tudo “pertencendo” ao user do app)
-    cur_app.execute(
-        sql.SQL("ALTER SCHEMA public OWNER TO {}").format(
-            sql.Identifier(app_db_user)
+        # (Opcional, mas deixa tudo “pertencendo” ao user do app)
+        cur_app.execute(
+            sql.SQL("ALTER SCHEMA public OWNER TO {}").format(
+                sql.Identifier(app_db_user)
+            )
         )
-    )
 
     cur_app.close()
     conn_app.close()
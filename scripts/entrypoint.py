@@ -18,5 +18,6 @@ if __name__ == "__main__":
     print("[entrypoint] Starting uvicorn")
     os.execvp(
         "uvicorn",
-        ["uvicorn", "app:app", "--host", "0.0.0.0", "--port", "3000"],
+        ["uvicorn", "app:app", "--host", "0.0.0.0", "--port", "3000",
+         "--loop", "uvloop", "--http", "httptools"],
     )
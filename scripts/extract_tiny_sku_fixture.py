@@ -132,7 +132,7 @@ async def _collect_products(token: str, skus: List[str], include_raw: bool) -> D
     errors: Dict[str, Any] = {}
     for sku in skus:
         try:
-            payload = await tiny_service.get_product_by_sku(token=token, sku=sku)
+            payload = await tiny_service.get_product_by_sku(token=token, sku=sku, include_raw=include_raw)
             products[sku] = _compact_product_payload(payload, include_raw=include_raw)
         except Exception as exc:  # noqa: BLE001
             errors[sku] = {"error": str(exc), "type": exc.__class__.__name__}
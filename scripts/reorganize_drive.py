@@ -2,15 +2,38 @@
 import os
 import re
 import json
+import time
+import random
 import argparse
+import logging
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 from sqlalchemy import create_engine, Column, Integer, String, DateTime
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+logger = logging.getLogger("reorganize_drive")
+
+# Lotes de requisições ao Drive (/batch/drive/v3): o limite é 100 por lote, mas
+# lotes menores evitam os 500 que o Drive devolve em lotes cheios.
+DRIVE_BATCH_SIZE = 50
+# Retentativas para 429/5xx e 403 de cota (limite de escrita do Drive), com
+# backoff exponencial "full jitter" limitado a DRIVE_BACKOFF_MAX segundos
+DRIVE_MAX_RETRIES = 5
+DRIVE_BACKOFF_MAX = 60.0
+RETRYABLE_STATUS = {429, 500, 502, 503}
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+FOLDER_MIME = "application/vnd.google-apps.folder"
+RAW_LEGACY_NAMES = ("RAW", "raw", "Raw")
+TARGET_SUBFOLDERS = ("RAW_IMG", "RAW_MOV", "RAW_KDB")
 
 # Database Setup (sync with app.py)
 DATABASE_URL = os.getenv(
@@ -27,102 +50,353 @@ class UserConfig(Base):
     data = Column(JSONB)
     updated_at = Column(DateTime)
 
+_engine = None
+_Session = None
+
+def _get_session():
+    """Sessão do banco; engine e sessionmaker são criados uma única vez (lazy)."""
+    global _engine, _Session
+    if _Session is None:
+        _engine = create_engine(DATABASE_URL, pool_size=2, pool_pre_ping=True)
+        _Session = sessionmaker(bind=_engine)
+    return _Session()
+
 def get_drive_config():
-    engine = create_engine(DATABASE_URL)
-    Session = sessionmaker(bind=engine)
-    session = Session()
+    session = _get_session()
     try:
         # Assuming we take the first config found or a specific user_id if needed
         # For simplicity in this standalone script, we'll take the most recently updated one
-        config = session.query(UserConfig).order_by(UserConfig.updated_at.desc()).first()
-        if not config:
-            return None
-        return config.data.get("google_drive", {})
+        # Só data->'google_drive' (extraído no Postgres), não o JSONB inteiro da config
+        drive_cfg = (
+            session.query(UserConfig.data["google_drive"])
+            .order_by(UserConfig.updated_at.desc())
+            .limit(1)
+            .scalar()
+        )
+        return drive_cfg or None
     finally:
         session.close()
 
+@functools.lru_cache(maxsize=4)
+def _creds_from_json(credentials_json):
+    # Parse do JSON + carga da chave RSA uma única vez; as credenciais são compartilhadas entre threads
+    creds_dict = json.loads(credentials_json)
+    return service_account.Credentials.from_service_account_info(
+        creds_dict, scopes=["https://www.googleapis.com/auth/drive"]
+    )
+
+
 def build_drive_service(credentials_json):
+    # O service (httplib2) não é thread-safe, então cada worker ainda constrói o seu;
+    # cache_discovery=False evita o file cache de discovery (usa o documento estático empacotado)
     try:
-        creds_dict = json.loads(credentials_json)
-        creds = service_account.Credentials.from_service_account_info(
-            creds_dict, scopes=["https://www.googleapis.com/auth/drive"]
-        )
-        return build("drive", "v3", credentials=creds)
+        creds = _creds_from_json(credentials_json)
+        return build("drive", "v3", credentials=creds, cache_discovery=False)
     except Exception as e:
-        print(f"Erro ao construir serviço Drive: {e}")
+        logger.error("Erro ao construir serviço Drive: %s", e)
         return None
 
-def is_sku_pattern(filename, sku):
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tiff', '.avif', '.svg')
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv', '.wmv', '.flv', '.webm', '.m4v')
+
+def is_sku_pattern(filename_lower, sku_lower):
     """
     Check if filename starts with the SKU radical.
     Everything starting with the SKU should remain in the root.
+    Both arguments are expected already lowercased.
     """
-    return filename.lower().startswith(sku.lower())
+    return filename_lower.startswith(sku_lower)
 
-def is_image(filename, mime_type):
-    image_extensions = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tiff', '.avif', '.svg')
-    return mime_type.startswith("image/") or filename.lower().endswith(image_extensions)
+# Extensão -> subpasta de destino; o que não estiver aqui (nem tiver MIME de mídia) vai para RAW_KDB
+_EXT_TARGET = {
+    **{ext: "RAW_IMG" for ext in IMAGE_EXTENSIONS},
+    **{ext: "RAW_MOV" for ext in VIDEO_EXTENSIONS},
+}
 
-def is_video(filename, mime_type):
-    video_extensions = ('.mp4', '.mov', '.avi', '.mkv', '.wmv', '.flv', '.webm', '.m4v')
-    return mime_type.startswith("video/") or filename.lower().endswith(video_extensions) or mime_type == "application/vnd.google-apps.video"
+def classify_target(filename_lower, mime_type):
+    """Subpasta de destino de um arquivo (imagem tem precedência sobre vídeo)."""
+    if mime_type.startswith("image/"):
+        return "RAW_IMG"
+    ext_target = _EXT_TARGET.get(filename_lower[filename_lower.rfind("."):])
+    if ext_target == "RAW_IMG":
+        return ext_target
+    if mime_type.startswith("video/") or mime_type == "application/vnd.google-apps.video":
+        return "RAW_MOV"
+    return ext_target or "RAW_KDB"
 
 def _escape_q(s: str) -> str:
     """Escapa aspas simples para queries do Google Drive."""
     return s.replace("'", "\\'")
 
-def _find_file_in_folder(service, folder_id: str, filename: str, mime_type: str = None) -> Optional[str]:
-    """Find a file or folder by name in a folder. Returns ID or None."""
-    safe_filename = _escape_q(filename)
-    query = f"name='{safe_filename}' and '{folder_id}' in parents and trashed=false"
-    if mime_type:
-        query += f" and mimeType='{mime_type}'"
+def _is_retryable(exc: Exception) -> bool:
+    if not isinstance(exc, HttpError):
+        return False
+    if exc.resp.status in RETRYABLE_STATUS:
+        return True
+    # 403 também é falta de permissão; só a de cota vale repetir
+    return exc.resp.status == 403 and any(
+        d.get("reason") in RATE_LIMIT_REASONS for d in (exc.error_details or []) if isinstance(d, dict)
+    )
+
+def _backoff_delay(attempt: int, exc: Optional[Exception] = None) -> float:
+    """Espera antes da retentativa `attempt` (0-based): full jitter + Retry-After, se houver."""
+    delay = random.uniform(0, min(DRIVE_BACKOFF_MAX, 2 ** attempt))
+    if isinstance(exc, HttpError):
+        try:
+            delay += float(exc.resp.get("retry-after", 0))
+        except (TypeError, ValueError):
+            pass
+    return delay
+
+def with_retry(request):
+    """Executa um HttpRequest do Drive repetindo falhas transitórias com backoff."""
+    for attempt in range(DRIVE_MAX_RETRIES + 1):
+        try:
+            return request.execute()
+        except HttpError as e:
+            if attempt == DRIVE_MAX_RETRIES or not _is_retryable(e):
+                raise
+            time.sleep(_backoff_delay(attempt, e))
+
+def _execute_batched(service, requests: List[Tuple[str, Any]], on_result: Callable[[str, Any, Optional[Exception]], None]) -> None:
+    """
+    Executa requisições do Drive em lotes de DRIVE_BATCH_SIZE.
+    requests: lista de (request_id único, HttpRequest); on_result(request_id, resposta, exceção)
+    é chamado uma vez por requisição. Falhas transitórias são reenviadas com backoff.
+    """
+    pending = list(requests)
+    for attempt in range(DRIVE_MAX_RETRIES + 1):
+        retry: List[Tuple[str, Any]] = []
+        retry_errors: List[Exception] = []
+        for start in range(0, len(pending), DRIVE_BATCH_SIZE):
+            chunk = dict(pending[start:start + DRIVE_BATCH_SIZE])
+
+            def _callback(request_id, response, exception):
+                if exception is not None and _is_retryable(exception) and attempt < DRIVE_MAX_RETRIES:
+                    retry.append((request_id, chunk[request_id]))
+                    retry_errors.append(exception)
+                    return
+                on_result(request_id, response, exception)
+
+            batch = service.new_batch_http_request(callback=_callback)
+            for request_id, request in chunk.items():
+                batch.add(request, request_id=request_id)
+            with_retry(batch)
+
+        if not retry:
+            return
+        time.sleep(max(_backoff_delay(attempt, e) for e in retry_errors))
+        pending = retry
+
+def list_all(service, q: str, fields: str = "files(id, name, mimeType)") -> Iterator[Dict[str, Any]]:
+    """Itera todos os resultados de uma consulta do Drive, paginando de 1000 em 1000."""
+    page_token = None
+    while True:
+        results = with_retry(service.files().list(
+            q=q,
+            fields=f"nextPageToken, {fields}",
+            supportsAllDrives=True,
+            includeItemsFromAllDrives=True,
+            pageSize=1000,
+            pageToken=page_token
+        ))
+        yield from results.get("files", [])
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            return
+
+def _list_children(service, folder_id: str) -> List[Dict[str, Any]]:
+    """Itens não excluídos de uma pasta: id, name, mimeType, parents."""
+    return list(list_all(
+        service,
+        f"'{folder_id}' in parents and trashed=false",
+        fields="files(id, name, mimeType, parents)",
+    ))
+
+def create_subfolders(service, parent_id: str, names: List[str], dry_run: bool) -> Dict[str, str]:
+    """Cria, num único lote, as subpastas `names` em parent_id. Retorna {nome: id}."""
+    if dry_run:
+        logger.debug("[DRY-RUN] Criaria pastas %s em %s", ", ".join(names), parent_id)
+        return {name: "DRY_RUN_ID" for name in names}
+
+    created: Dict[str, str] = {}
+
+    def _on_created(name, response, exception):
+        if exception is not None:
+            raise exception
+        created[name] = response["id"]
+
+    _execute_batched(service, [
+        (name, service.files().create(
+            body={"name": name, "mimeType": FOLDER_MIME, "parents": [parent_id]},
+            fields="id",
+            supportsAllDrives=True
+        ))
+        for name in names
+    ], _on_created)
+    return created
+
+def process_sku_folder(service, folder, dry_run: bool) -> bool:
+    """
+    Reorganiza uma pasta de SKU e retorna se houve ação. Loga uma linha de resumo
+    (INFO) por pasta; o detalhe por arquivo fica em DEBUG (--verbose).
+    """
+    had_action = False
+
+    sku = folder["name"].strip()
+    folder_id = folder["id"]
+    
+    # 1. Uma listagem da raiz traz os arquivos e as subpastas; a pasta legada "RAW"
+    #    (variações de nome, nesta ordem de preferência) sai daí sem consultas extras
+    root_children = _list_children(service, folder_id)
+    raw_by_name = {
+        f["name"]: f["id"] for f in root_children
+        if f["mimeType"] == FOLDER_MIME and f["name"] in RAW_LEGACY_NAMES
+    }
+    raw_legacy_id = next((raw_by_name[name] for name in RAW_LEGACY_NAMES if name in raw_by_name), None)
     
-    results = service.files().list(
-        q=query, 
-        fields="files(id)",
-        supportsAllDrives=True,
-        includeItemsFromAllDrives=True
-    ).execute()
-    files = results.get("files", [])
-    return files[0]["id"] if files else None
-
-def get_or_create_subfolder(service, parent_id, name, dry_run=False):
-    query = f"name='{name}' and '{parent_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
-    results = service.files().list(q=query, fields="files(id, name)", supportsAllDrives=True, includeItemsFromAllDrives=True).execute()
-    folders = results.get("files", [])
-    if folders:
-        return folders[0]["id"]
+    # 2. Coletar arquivos da raiz e da pasta RAW
+    all_candidate_files = [] # List of (f_id, f_name, f_mime, current_parent_id)
+    # Todos os pais de cada arquivo (vêm da própria listagem): o move remove todos,
+    # como antes, e um arquivo com vários pais não fica preso fora da subpasta alvo
+    parents_by_id: Dict[str, str] = {}
     
-    if dry_run:
-        print(f"  [DRY-RUN] Criaria pasta '{name}' em {parent_id}")
-        return "DRY_RUN_ID"
+    # Arquivos da raiz
+    for f in root_children:
+        if f["mimeType"] != FOLDER_MIME:
+            all_candidate_files.append((f["id"], f["name"].strip(), f["mimeType"], folder_id))
+            parents_by_id[f["id"]] = ",".join(f.get("parents") or [folder_id])
+    
+    # Buscar da pasta RAW legada (se existir)
+    if raw_legacy_id:
+        for f in _list_children(service, raw_legacy_id):
+            if f["mimeType"] != FOLDER_MIME:
+                all_candidate_files.append((f["id"], f["name"].strip(), f["mimeType"], raw_legacy_id))
+                parents_by_id[f["id"]] = ",".join(f.get("parents") or [raw_legacy_id])
+
+    # Subpastas alvo já existentes vêm da mesma listagem da raiz (primeira ocorrência)
+    target_subfolders = {} # Cache de IDs: {"RAW_IMG": id, ...}
+    for f in root_children:
+        if f["mimeType"] == FOLDER_MIME and f["name"] in TARGET_SUBFOLDERS:
+            target_subfolders.setdefault(f["name"], f["id"])
+
+    classified = [] # Lista de (file_id, file_name, current_parent_id, target_name)
+    sku_lower = sku.lower()
+
+    for f_id, f_name, f_mime, current_parent_id in all_candidate_files:
+        f_name_lower = f_name.lower()
+        # Regra ajustada:
+        # 1. Se o arquivo está na RAIZ (folder_id) E segue o padrão do SKU, MANTÉM na RAIZ.
+        # 2. Se o arquivo está na pasta legada "RAW", SEMPRE será reclassificado (independente de padrão).
+        if current_parent_id == folder_id and is_sku_pattern(f_name_lower, sku_lower):
+            continue
         
-    body = {
-        "name": name,
-        "mimeType": "application/vnd.google-apps.folder",
-        "parents": [parent_id]
-    }
-    folder = service.files().create(body=body, fields="id", supportsAllDrives=True).execute()
-    return folder["id"]
+        # Se não é o caso acima, decide a subpasta (reclassificação)
+        target_name = classify_target(f_name_lower, f_mime)
+        classified.append((f_id, f_name, current_parent_id, target_name))
+
+    # Cria de uma vez só as subpastas alvo que faltam
+    needed = {target_name for _, _, _, target_name in classified}
+    missing = [name for name in TARGET_SUBFOLDERS if name in needed and name not in target_subfolders]
+    if missing:
+        target_subfolders.update(create_subfolders(service, folder_id, missing, dry_run))
+
+    moves = [] # Lista de (file_id, file_name, target_folder_id, target_name_for_log)
+    # Um arquivo com vários pais (raiz e RAW) aparece nas duas listagens; move uma vez só.
+    # O id também é o request_id do lote, que precisa ser único.
+    seen_ids = set()
+    for f_id, f_name, current_parent_id, target_name in classified:
+        target_id = target_subfolders[target_name]
+        if current_parent_id != target_id and f_id not in seen_ids:
+            seen_ids.add(f_id)
+            moves.append((f_id, f_name, target_id, target_name))
+
+    if moves:
+        had_action = True
+
+        if dry_run:
+            for f_id, f_name, _, target_name in moves:
+                logger.debug("[DRY-RUN] %s: moveria %s -> %s", sku, f_name, target_name)
+            logger.info("[DRY-RUN] %s: %d arquivos para organizar", sku, len(moves))
+        else:
+            names_by_id = {f_id: (f_name, target_name) for f_id, f_name, _, target_name in moves}
+            moved_ok = 0
+
+            def _on_moved(f_id, response, exception):
+                nonlocal moved_ok
+                f_name, target_name = names_by_id[f_id]
+                if exception is not None:
+                    logger.warning("%s: erro ao mover %s: %s", sku, f_name, exception)
+                else:
+                    moved_ok += 1
+                    logger.debug("%s: movido %s -> %s", sku, f_name, target_name)
+
+            # Os pais atuais já vêm da listagem: sem get() por arquivo
+            _execute_batched(service, [
+                (f_id, service.files().update(
+                    fileId=f_id,
+                    addParents=target_id,
+                    removeParents=parents_by_id[f_id],
+                    fields="id, parents",
+                    supportsAllDrives=True
+                ))
+                for f_id, _, target_id, _ in moves
+            ], _on_moved)
+            logger.info("%s: movidos %d/%d arquivos", sku, moved_ok, len(moves))
+
+    # 3. Se a pasta RAW legada existir, verificar se ficou vazia e deletar
+    if raw_legacy_id and not dry_run:
+        try:
+            # Verifica se está vazia
+            check_empty = with_retry(service.files().list(
+                q=f"'{raw_legacy_id}' in parents and trashed=false", 
+                fields="files(id)", 
+                supportsAllDrives=True, 
+                includeItemsFromAllDrives=True,
+                pageSize=1
+            ))
+            
+            if not check_empty.get("files"):
+                # Tenta mover para lixeira (update trashed=True) que é mais permissivo que delete()
+                with_retry(service.files().update(fileId=raw_legacy_id, body={'trashed': True}, supportsAllDrives=True))
+                logger.info("%s: pasta legada 'RAW' enviada para a lixeira.", sku)
+        except Exception as e:
+            # Se falhar aqui, provavelmente é restrição do Drive Compartilhado (Content Manager não apaga pastas)
+            logger.warning(
+                "%s: pasta 'RAW' (%s) está vazia mas não pôde ser removida. Dica: para o script apagar pastas, "
+                "a conta de serviço precisa ser 'Administrador' (Manager) em vez de 'Administrador de Conteúdo'.",
+                sku, raw_legacy_id,
+            )
+
+    return had_action
+
 
 def main():
     parser = argparse.ArgumentParser(description="Reorganiza arquivos do Google Drive por SKU.")
     parser.add_argument("--dry-run", action="store_true", help="Apenas simula as ações sem mover arquivos.")
+    parser.add_argument("--workers", type=int, default=8, help="Pastas de SKU processadas em paralelo (padrão: 8).")
+    parser.add_argument("--verbose", action="store_true", help="Loga cada arquivo movido (nível DEBUG).")
     args = parser.parse_args()
 
-    print(f"--- Iniciando Reorganização do Drive ({'SIMULÇÃO' if args.dry_run else 'EXECUÇÃO'}) ---")
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+    # googleapiclient loga cada requisição em INFO/DEBUG; só interessa o nosso logger
+    logging.getLogger("googleapiclient").setLevel(logging.WARNING)
+
+    logger.info("--- Iniciando Reorganização do Drive (%s) ---", "SIMULAÇÃO" if args.dry_run else "EXECUÇÃO")
     
     drive_cfg = get_drive_config()
     if not drive_cfg:
-        print("Erro: Nenhuma configuração de Drive encontrada no banco de dados.")
+        logger.error("Nenhuma configuração de Drive encontrada no banco de dados.")
         return
 
     root_folder_id = drive_cfg.get("folder_id")
     credentials_json = drive_cfg.get("credentials_json")
 
     if not root_folder_id or not credentials_json:
-        print("Erro: Configuração de Drive incompleta.")
+        logger.error("Configuração de Drive incompleta.")
         return
 
     service = build_drive_service(credentials_json)
@@ -130,129 +404,31 @@ def main():
         return
 
     # Listar subpastas da raiz (pastas de SKU) com suporte a paginação
-    query = f"'{root_folder_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
-    sku_folders = []
-    page_token = None
-    
-    while True:
-        results = service.files().list(
-            q=query, 
-            fields="nextPageToken, files(id, name)", 
-            supportsAllDrives=True, 
-            includeItemsFromAllDrives=True,
-            pageSize=1000,
-            pageToken=page_token
-        ).execute()
-        
-        sku_folders.extend(results.get("files", []))
-        page_token = results.get("nextPageToken")
-        if not page_token:
-            break
+    query = f"'{root_folder_id}' in parents and mimeType='{FOLDER_MIME}' and trashed=false"
+    sku_folders = list(list_all(service, query, fields="files(id, name)"))
 
     total_folders_processed = 0
     folders_with_action = 0
 
-    for folder in sku_folders:
-        sku = folder["name"].strip()
-        folder_id = folder["id"]
-        
-        # 1. Verificar se existe a pasta legada "RAW" (tentando variações de nome)
-        raw_legacy_id = None
-        for name_variation in ["RAW", "raw", "Raw"]:
-            raw_legacy_id = _find_file_in_folder(service, folder_id, name_variation, "application/vnd.google-apps.folder")
-            if raw_legacy_id:
-                break
-        
-        # 2. Coletar arquivos da raiz e da pasta RAW
-        all_candidate_files = [] # List of (f_id, f_name, f_mime, current_parent_id)
-        
-        # Buscar da raiz
-        res_root = service.files().list(q=f"'{folder_id}' in parents and trashed=false", fields="files(id, name, mimeType)", supportsAllDrives=True, includeItemsFromAllDrives=True).execute()
-        for f in res_root.get("files", []):
-            if f["mimeType"] != "application/vnd.google-apps.folder":
-                all_candidate_files.append((f["id"], f["name"].strip(), f["mimeType"], folder_id))
-        
-        # Buscar da pasta RAW legada (se existir)
-        if raw_legacy_id:
-            res_raw = service.files().list(q=f"'{raw_legacy_id}' in parents and trashed=false", fields="files(id, name, mimeType)", supportsAllDrives=True, includeItemsFromAllDrives=True).execute()
-            for f in res_raw.get("files", []):
-                if f["mimeType"] != "application/vnd.google-apps.folder":
-                    all_candidate_files.append((f["id"], f["name"].strip(), f["mimeType"], raw_legacy_id))
-
-        moves = [] # Lista de (file_id, file_name, target_folder_id_or_none, target_name_for_log)
-        
-        target_subfolders = {} # Cache de IDs: {"RAW_IMG": id, ...}
-
-        for f_id, f_name, f_mime, current_parent_id in all_candidate_files:
-            # Regra ajustada:
-            # 1. Se o arquivo está na RAIZ (folder_id) E segue o padrão do SKU, MANTÉM na RAIZ.
-            # 2. Se o arquivo está na pasta legada "RAW", SEMPRE será reclassificado (independente de padrão).
-            if current_parent_id == folder_id and is_sku_pattern(f_name, sku):
-                continue
-            
-            # Se não é o caso acima, decide a subpasta (reclassificação)
-            target_name = "RAW_KDB"
-            if is_image(f_name, f_mime):
-                target_name = "RAW_IMG"
-            elif is_video(f_name, f_mime):
-                target_name = "RAW_MOV"
-            
-            # Verificar ID da pasta alvo
-            if target_name not in target_subfolders:
-                target_subfolders[target_name] = get_or_create_subfolder(service, folder_id, target_name, args.dry_run)
-            
-            target_id = target_subfolders[target_name]
-            if current_parent_id != target_id:
-                moves.append((f_id, f_name, target_id, target_name))
+    # Pastas de SKU são independentes: processa em paralelo (I/O de rede). O cliente
+    # do Drive (httplib2) não é thread-safe, então cada thread constrói o seu.
+    thread_state = threading.local()
 
-        if moves:
-            folders_with_action += 1
-            print(f"Pasta: {sku} ({len(moves)} arquivos para organizar)")
-            
-            for f_id, f_name, target_id, target_name in moves:
-                if args.dry_run:
-                    print(f"  [DRY-RUN] Moveria {f_name} -> {target_name}")
-                else:
-                    try:
-                        file = service.files().get(fileId=f_id, fields="parents", supportsAllDrives=True).execute()
-                        previous_parents = ",".join(file.get("parents"))
-                        service.files().update(
-                            fileId=f_id,
-                            addParents=target_id,
-                            removeParents=previous_parents,
-                            fields="id, parents",
-                            supportsAllDrives=True
-                        ).execute()
-                        print(f"  Movido: {f_name} -> {target_name}")
-                    except Exception as e:
-                        print(f"  Erro ao mover {f_name}: {e}")
-
-        # 3. Se a pasta RAW legada existir, verificar se ficou vazia e deletar
-        if raw_legacy_id and not args.dry_run:
-            try:
-                # Verifica se está vazia
-                check_empty = service.files().list(
-                    q=f"'{raw_legacy_id}' in parents and trashed=false", 
-                    fields="files(id)", 
-                    supportsAllDrives=True, 
-                    includeItemsFromAllDrives=True,
-                    pageSize=1
-                ).execute()
-                
-                if not check_empty.get("files"):
-                    # Tenta mover para lixeira (update trashed=True) que é mais permissivo que delete()
-                    service.files().update(fileId=raw_legacy_id, body={'trashed': True}, supportsAllDrives=True).execute()
-                    print(f"  Pasta legada 'RAW' enviada para a lixeira.")
-            except Exception as e:
-                # Se falhar aqui, provavelmente é restrição do Drive Compartilhado (Content Manager não apaga pastas)
-                print(f"  Aviso: Pasta 'RAW' ({raw_legacy_id}) está vazia mas não pôde ser removida.")
-                print(f"  Dica: Para o script apagar pastas, a conta de serviço precisa ser 'Administrador' (Manager) em vez de 'Administrador de Conteúdo'.")
-
-        total_folders_processed += 1
-
-    print(f"\nReorganização concluída.")
-    print(f"Total de pastas processadas: {total_folders_processed}")
-    print(f"Total de pastas com ações: {folders_with_action}")
+    def _process(folder):
+        if getattr(thread_state, "service", None) is None:
+            thread_state.service = build_drive_service(credentials_json)
+        return process_sku_folder(thread_state.service, folder, args.dry_run)
+
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        for had_action in executor.map(_process, sku_folders):
+            if had_action:
+                folders_with_action += 1
+            total_folders_processed += 1
+
+    logger.info(
+        "Reorganização concluída. Pastas processadas: %d; com ações: %d",
+        total_folders_processed, folders_with_action,
+    )
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,87 @@
+import asyncio
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import app as app_module
+from appgtw_auth import CurrentUser
+
+
+def _build_current_user() -> CurrentUser:
+    return CurrentUser(
+        user_id="test-user",
+        email="test@example.com",
+        raw_claims={},
+    )
+
+
+def _post_generate(payloads: List[Dict[str, Any]], headers: Optional[Dict[str, str]] = None) -> List[httpx.Response]:
+    async def _run() -> List[httpx.Response]:
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            return [await client.post("/api/generate", json=payload, headers=headers) for payload in payloads]
+
+    app_module.app.dependency_overrides[app_module.get_current_user_master] = _build_current_user
+    try:
+        return asyncio.run(_run())
+    finally:
+        app_module.app.dependency_overrides.clear()
+
+
+def _payload(temperature: Optional[float]) -> Dict[str, Any]:
+    return {
+        "product_name": "Garrafa Térmica 1L",
+        "marketplace": "mercadolivre",
+        "options": {"llm": "openai", "openai_api_key": "sk-test", "temperature": temperature},
+    }
+
+
+def test_generate_serves_deterministic_repeat_from_cache_without_etag(monkeypatch):
+    calls = []
+
+    async def fake_call_openai(prompt, opts, files_data=None):
+        calls.append(prompt)
+        return '{"title": "Garrafa", "description": "Texto", "faq": [], "cards": []}'
+
+    monkeypatch.setattr(app_module, "call_openai", fake_call_openai)
+    monkeypatch.setattr(app_module, "LLM_RESPONSE_CACHE", {})
+
+    first, second = _post_generate([_payload(0), _payload(0)])
+
+    # POST não participa de revalidação: sem ETag e nunca 304, mas o LLM não é chamado de novo
+    assert first.status_code == second.status_code == 200
+    assert "etag" not in first.headers
+    assert second.json() == first.json()
+    assert len(calls) == 1
+
+
+def test_generate_ignores_if_none_match(monkeypatch):
+    async def fake_call_openai(prompt, opts, files_data=None):
+        return '{"title": "Garrafa", "description": "Texto", "faq": [], "cards": []}'
+
+    monkeypatch.setattr(app_module, "call_openai", fake_call_openai)
+
+    (response,) = _post_generate([_payload(0)], headers={"If-None-Match": "*"})
+
+    assert response.status_code == 200
+
+
+def test_llm_response_cache_is_separated_per_api_key(monkeypatch):
+    calls = []
+
+    async def fake_call_openai(prompt, opts, files_data=None):
+        calls.append(opts.openai_api_key)
+        return '{"title": "Garrafa", "description": "Texto", "faq": [], "cards": []}'
+
+    monkeypatch.setattr(app_module, "call_openai", fake_call_openai)
+    monkeypatch.setattr(app_module, "LLM_RESPONSE_CACHE", {})
+
+    other_tenant = _payload(0)
+    other_tenant["options"]["openai_api_key"] = "sk-other"
+    _post_generate([_payload(0), other_tenant, _payload(0)])
+
+    assert calls == ["sk-test", "sk-other"]
@@ -0,0 +1,29 @@
+import os
+import subprocess
+import sys
+from io import BytesIO
+
+import PIL.Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from image_conversion import reencode_to_png
+
+
+def test_reencode_to_png_returns_rgba_png():
+    src = BytesIO()
+    PIL.Image.new("RGB", (4, 3), (255, 0, 0)).save(src, format="JPEG")
+
+    img = PIL.Image.open(BytesIO(reencode_to_png(src.getvalue())))
+
+    assert img.format == "PNG"
+    assert img.mode == "RGBA"
+    assert img.size == (4, 3)
+
+
+def test_image_conversion_does_not_import_app():
+    # Workers do pool importam só este módulo ao desserializar a tarefa (spawn)
+    code = "import sys, image_conversion; print('app' in sys.modules, 'fastapi' in sys.modules)"
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    out = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True)
+    assert out.stdout.split() == ["False", "False"]
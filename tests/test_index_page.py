@@ -0,0 +1,26 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import app as app_module
+
+
+def test_index_page_reloads_when_file_changes(tmp_path, monkeypatch):
+    page = tmp_path / "main.html"
+    page.write_bytes(b"<html>v1</html>")
+    monkeypatch.setattr(app_module, "INDEX_PAGE_PATH", str(page))
+    app_module._load_index_page.cache_clear()
+
+    content_v1, etag_v1 = app_module._index_page()
+    assert content_v1 == b"<html>v1</html>"
+    assert app_module._index_page() == (content_v1, etag_v1)
+
+    page.write_bytes(b"<html>v2</html>")
+    stat = page.stat()
+    os.utime(page, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    content_v2, etag_v2 = app_module._index_page()
+    assert content_v2 == b"<html>v2</html>"
+    assert etag_v2 != etag_v1
+    app_module._load_index_page.cache_clear()
@@ -0,0 +1,52 @@
+import asyncio
+import os
+import sys
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import app as app_module
+
+
+def _run_with_transport(monkeypatch, handler, call):
+    async def no_sleep(delay):
+        return None
+
+    async def _run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            monkeypatch.setattr(app_module, "_LLM_HTTP_CLIENT", client)
+            monkeypatch.setattr(app_module.asyncio, "sleep", no_sleep)
+            return await call()
+
+    return asyncio.run(_run())
+
+
+def test_call_openai_retries_non_json_body(monkeypatch):
+    bodies = [b"<html>502 Bad Gateway</html>", b'{"choices": [{"message": {"content": "ok"}}]}']
+
+    def handler(request):
+        return httpx.Response(200, content=bodies.pop(0))
+
+    opts = app_module.Options(llm="openai", openai_api_key="sk-test")
+
+    assert _run_with_transport(monkeypatch, handler, lambda: app_module.call_openai("prompt", opts)) == "ok"
+    assert bodies == []
+
+
+def test_call_gemini_gives_up_with_502_after_non_json_bodies(monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, content=b"not json")
+
+    opts = app_module.Options(llm="gemini", gemini_api_key="g-test")
+
+    with pytest.raises(HTTPException) as exc_info:
+        _run_with_transport(monkeypatch, handler, lambda: app_module.call_gemini("prompt", opts))
+
+    assert exc_info.value.status_code == 502
+    assert len(calls) == 3
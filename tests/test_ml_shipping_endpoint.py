@@ -0,0 +1,60 @@
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+
+import httpx
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import app as app_module
+from appgtw_auth import CurrentUser
+from pricing import ml_shipping
+
+
+def _build_current_user() -> CurrentUser:
+    return CurrentUser(
+        user_id="test-user",
+        email="test@example.com",
+        raw_claims={},
+    )
+
+
+def test_calculate_ml_shipping_serves_expired_tables_when_refresh_fails(tmp_path, monkeypatch):
+    monkeypatch.setattr(ml_shipping, "DISK_CACHE_PATH", tmp_path / "ml_shipping.json")
+    monkeypatch.setattr(ml_shipping, "_shipping_cache", {
+        "data": [{"min_price": 79.0, "max_price": float("inf"), "tiers": [{"max_weight": float("inf"), "price": 99.0}]}],
+        "last_fetched": datetime.now() - ml_shipping.CACHE_TTL - timedelta(minutes=1),
+        "etag": None,
+        "last_modified": None,
+    })
+    monkeypatch.setattr(ml_shipping, "_refresh_lock", None)
+    monkeypatch.setattr(ml_shipping, "_refresh_task", None)
+    monkeypatch.setattr(ml_shipping, "_disk_cache_checked", True)
+    fetches = []
+
+    async def failing_fetch():
+        fetches.append(1)
+        raise ml_shipping.MLShippingError("ML fora do ar")
+
+    monkeypatch.setattr(ml_shipping, "_fetch_shipping_tables", failing_fetch)
+
+    async def _run():
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            response = await client.post(
+                "/api/shipping/calculate_ml", json={"cost_price": 49.8, "weight_kg": 0.4}
+            )
+        await ml_shipping._refresh_task
+        return response
+
+    app_module.app.dependency_overrides[app_module.get_current_user_master] = _build_current_user
+    try:
+        response = asyncio.run(_run())
+    finally:
+        app_module.app.dependency_overrides.clear()
+
+    # Tabela vencida (dentro de CACHE_MAX_STALE) responde na hora; o refresh falha em segundo plano
+    assert response.status_code == 200
+    assert response.json() == {"shipping_cost": 99.0}
+    assert fetches == [1]
@@ -0,0 +1,81 @@
+import asyncio
+import os
+import sys
+from typing import Any, Dict, List, Tuple
+
+import httpx
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import app as app_module
+from appgtw_auth import CurrentUser
+
+
+def _build_current_user() -> CurrentUser:
+    return CurrentUser(
+        user_id="test-user",
+        email="test@example.com",
+        raw_claims={},
+    )
+
+
+def _post_many(requests: List[Tuple[str, Dict[str, Any]]]) -> List[httpx.Response]:
+    # Um único loop/cliente para todas as chamadas do teste.
+    async def _run() -> List[httpx.Response]:
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            return [await client.post(path, json=payload) for path, payload in requests]
+
+    app_module.app.dependency_overrides[app_module.get_current_user_master] = _build_current_user
+    try:
+        return asyncio.run(_run())
+    finally:
+        app_module.app.dependency_overrides.clear()
+
+
+def _post(path: str, payload: Dict[str, Any]) -> httpx.Response:
+    return _post_many([(path, payload)])[0]
+
+
+def test_quote_batch_matches_single_quotes_in_order():
+    ml_ctx = {"impostos": 0.12, "tacos": 0.05, "margem_contribuicao": 0.10, "lucro": 0.05}
+    items = [
+        {"cost_price": 42.0, "shipping_cost": 12.5, "channel": "mercadolivre",
+         "commission_percent": 0.165, "ctx": dict(ml_ctx)},
+        {"cost_price": 100.0, "shipping_cost": 8.0, "channel": "shopee"},
+        {"cost_price": 15.0, "channel": "amazon", "policy_id": "p1"},
+    ]
+
+    response, *singles = _post_many(
+        [("/pricing/quote-batch", {"items": items})] + [("/pricing/quote", item) for item in items]
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert [quote["channel"] for quote in data] == ["mercadolivre", "shopee", "amazon"]
+    for quote, single in zip(data, singles):
+        assert single.status_code == 200
+        assert quote == single.json()
+
+
+def test_quote_batch_rejects_unsupported_channel():
+    response = _post(
+        "/pricing/quote-batch",
+        {"items": [
+            {"cost_price": 10.0, "channel": "shopee"},
+            {"cost_price": 10.0, "channel": "canal_inexistente"},
+        ]},
+    )
+
+    assert response.status_code == 422
+    detail = response.json()["detail"]
+    assert "canal_inexistente" in detail["message"]
+    assert "shopee" in detail["supported_channels"]
+
+
+def test_quote_batch_rejects_oversized_batch():
+    items = [{"cost_price": 10.0, "channel": "shopee"}] * (app_module.PRICING_QUOTE_BATCH_MAX_ITEMS + 1)
+
+    response = _post("/pricing/quote-batch", {"items": items})
+
+    assert response.status_code == 422
@@ -0,0 +1,81 @@
+import asyncio
+import os
+import sys
+from typing import Any, Dict
+
+import httpx
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import app as app_module
+from appgtw_auth import CurrentUser
+
+
+def _build_current_user() -> CurrentUser:
+    return CurrentUser(
+        user_id="test-user",
+        email="test@example.com",
+        raw_claims={},
+    )
+
+
+def _post(path: str, payload: Dict[str, Any]) -> httpx.Response:
+    async def _run() -> httpx.Response:
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            return await client.post(path, json=payload)
+
+    app_module.app.dependency_overrides[app_module.get_current_user_master] = _build_current_user
+    try:
+        return asyncio.run(_run())
+    finally:
+        app_module.app.dependency_overrides.clear()
+
+
+def test_regen_batch_runs_fields_concurrently_and_keeps_order(monkeypatch):
+    in_flight = 0
+    max_in_flight = 0
+
+    async def fake_call_model_json(prompt, opts, files_data=None):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.05)
+        in_flight -= 1
+        return {
+            "title": "Novo título",
+            "description": "**Nova** descrição",
+            "faq": [{"q": "Pergunta?", "a": "Resposta."}],
+            "cards": [{"title": "Card", "text": "Texto"}],
+        }
+
+    monkeypatch.setattr(app_module, "call_model_json", fake_call_model_json)
+
+    options = {"llm": "openai", "openai_api_key": "sk-test"}
+    fields = ["title", "description", "faq_item", "card"]
+    items = [
+        {"product_name": "Garrafa Térmica", "marketplace": "mercadolivre", "field": f, "options": options}
+        for f in fields
+    ]
+
+    response = _post("/api/regen_batch", {"items": items})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert [next(k for k in out if k != "sources_used") for out in data] == ["title", "description", "faq", "cards"]
+    assert data[1]["description"] == "Nova descrição"
+    assert max_in_flight == len(fields)
+
+
+def test_regen_batch_rejects_empty_items():
+    response = _post("/api/regen_batch", {"items": []})
+
+    assert response.status_code == 422
+
+
+def test_regen_batch_rejects_oversized_batch():
+    item = {"field": "title", "product_name": "Garrafa", "marketplace": "mercadolivre"}
+
+    response = _post("/api/regen_batch", {"items": [item] * (app_module.REGEN_BATCH_MAX_ITEMS + 1)})
+
+    assert response.status_code == 422
@@ -0,0 +1,69 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app import ensure_plain_text_desc, parse_json_loose, render_prompt_template
+
+
+def test_ensure_plain_text_desc_strips_markdown():
+    raw = (
+        "## **Destaques**\n"
+        "- Material *resistente*\n"
+        "  - Fácil de `limpar`\n"
+        "• Já formatado\n"
+        "\n\n\n"
+        "Texto   com    espaços\t\textras.   \n"
+    )
+
+    assert ensure_plain_text_desc(raw) == (
+        "Destaques\n"
+        "• Material resistente\n"
+        "• Fácil de limpar\n"
+        "• Já formatado\n"
+        "\n"
+        "Texto com espaços extras."
+    )
+
+
+def test_ensure_plain_text_desc_keeps_plain_lines_and_hyphens():
+    raw = "Linha simples\n-sem espaço não é bullet\nMedida 80-60 cm"
+
+    assert ensure_plain_text_desc(raw) == raw
+
+
+def test_ensure_plain_text_desc_empty():
+    assert ensure_plain_text_desc("") == ""
+    assert ensure_plain_text_desc(None) == ""
+
+
+def test_parse_json_loose_extracts_object_from_fenced_text():
+    raw = 'Claro! Segue:\n```json\n{"title": "Bola {azul}", "faq": [{"q": "a\\"}", "a": "b"}]}\n```\nObs: {nada}'
+
+    assert parse_json_loose(raw) == {"title": "Bola {azul}", "faq": [{"q": 'a"}', "a": "b"}]}
+
+
+def test_parse_json_loose_returns_first_object_when_text_has_more_braces():
+    raw = '{"title": "x"} e um exemplo extra: {"title": "y"}'
+
+    assert parse_json_loose(raw) == {"title": "x"}
+
+
+def test_parse_json_loose_unbalanced_object():
+    assert parse_json_loose('{"title": "x", "description": "y"') == {}
+
+
+def test_parse_json_loose_without_object():
+    assert parse_json_loose("sem json aqui") == {}
+
+
+def test_render_prompt_template_expands_placeholders_and_escapes_braces():
+    tpl = 'Produto: "{product}" em {marketplace}\nSpecs: {specs}\nFormato: { "title": "..." } {outro}'
+
+    assert render_prompt_template(tpl, "Garrafa {1L}", "shopee", "{}") == (
+        'Produto: "Garrafa {1L}" em shopee\nSpecs: {}\nFormato: {{ "title": "..." }} {{outro}}'
+    )
+
+
+def test_ensure_plain_text_desc_heading_before_bullet_and_cr_line_endings():
+    assert ensure_plain_text_desc("Intro\r## - Item\r### Seção") == "Intro\n• Item\nSeção"
@@ -0,0 +1,658 @@
+import asyncio
+import functools
+import os
+import sys
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import tiny_service
+
+
+SEARCH_ITEM = {
+    "id": "123",
+    "nome": "Garrafa Térmica 1L",
+    "codigo": "GT001",
+    "gtin": "7890000000001",
+    "unidade": "UN",
+    "categoria": "Utilidades",
+    "classe_produto": "S",
+    "preco": "89,90",
+    "preco_promocional": "0",
+    "preco_custo": "30,00",
+    "marca": "Termix",
+    "peso_bruto": "0,6",
+    "peso_liquido": "0,5",
+    "alturaEmbalagem": "30",
+    "larguraEmbalagem": "10",
+    "comprimentoEmbalagem": "10",
+}
+
+
+@pytest.fixture(autouse=True)
+def _empty_tiny_caches(monkeypatch):
+    monkeypatch.setattr(tiny_service, "PRODUCT_CACHE", {})
+    monkeypatch.setattr(tiny_service, "TOKEN_VALIDATION_CACHE", {})
+    monkeypatch.setattr(tiny_service, "PURCHASE_COST_CACHE", {})
+
+
+def _patch_tiny(monkeypatch, search_item):
+    calls = []
+
+    async def fake_validate_token(token):
+        return True, None
+
+    async def fake_call_tiny_api(url, payload, timeout=15.0, max_retries=2):
+        calls.append(url)
+        if url == tiny_service.TINY_SEARCH_URL:
+            return {"retorno": {"status": "OK", "produtos": [{"produto": dict(search_item)}]}}
+        return {"retorno": {"status": "OK", "produto": dict(SEARCH_ITEM, kit=[])}}
+
+    async def fake_purchase_cost(token, sku, timeout=15.0):
+        return 0.0
+
+    monkeypatch.setattr(tiny_service, "validate_token", fake_validate_token)
+    monkeypatch.setattr(tiny_service, "_call_tiny_api", fake_call_tiny_api)
+    monkeypatch.setattr(tiny_service, "_find_most_recent_purchase_cost", fake_purchase_cost)
+    return calls
+
+
+def test_get_product_by_sku_skips_full_fetch_when_search_is_complete(monkeypatch):
+    calls = _patch_tiny(monkeypatch, SEARCH_ITEM)
+
+    product = asyncio.run(tiny_service.get_product_by_sku("token", "GT001"))
+
+    assert calls == [tiny_service.TINY_SEARCH_URL]
+    assert product["sku"] == "GT001"
+    assert product["weight_kg"] == pytest.approx(0.6)
+    assert product["cost_price"] == pytest.approx(30.0)
+    # Só os campos brutos que a UI lê (marca, pesos, embalagem...), não a resposta inteira
+    assert set(product["raw_data"]) == set(tiny_service._TINY_RAW_UI_FIELDS)
+    assert product["raw_data"]["marca"] == "Termix"
+    assert "preco_custo" not in product["raw_data"]
+
+
+def test_get_product_by_sku_includes_raw_data_on_request(monkeypatch):
+    _patch_tiny(monkeypatch, SEARCH_ITEM)
+
+    product = asyncio.run(tiny_service.get_product_by_sku("token", "GT001", include_raw=True))
+
+    assert product["raw_data"]["preco_custo"] == "30,00"
+
+
+@pytest.mark.parametrize("search_item, force_full", [
+    ({k: v for k, v in SEARCH_ITEM.items() if k != "peso_bruto"}, False),
+    ({k: v for k, v in SEARCH_ITEM.items() if k != "marca"}, False),  # lido pela UI em raw_data
+    (dict(SEARCH_ITEM, classe_produto="K"), False),
+    (SEARCH_ITEM, True),
+])
+def test_get_product_by_sku_fetches_full_product_otherwise(monkeypatch, search_item, force_full):
+    calls = _patch_tiny(monkeypatch, search_item)
+
+    product = asyncio.run(tiny_service.get_product_by_sku("token", "GT001", force_full=force_full))
+
+    assert calls == [tiny_service.TINY_SEARCH_URL, tiny_service.TINY_GET_URL]
+    assert product["weight_kg"] == pytest.approx(0.6)
+
+
+def test_get_products_by_skus_validates_once_and_keeps_per_sku_errors(monkeypatch):
+    validations = []
+
+    async def fake_validate_token(token):
+        validations.append(token)
+        return True, None
+
+    async def fake_get_product_by_sku(token, sku, timeout=15.0, check_token=True):
+        assert check_token is False
+        await asyncio.sleep(0)
+        if sku == "MISSING":
+            raise tiny_service.TinyNotFoundError(f"SKU '{sku}' não encontrado no Tiny ERP")
+        return {"sku": sku}
+
+    monkeypatch.setattr(tiny_service, "validate_token", fake_validate_token)
+    monkeypatch.setattr(tiny_service, "get_product_by_sku", fake_get_product_by_sku)
+
+    result = asyncio.run(tiny_service.get_products_by_skus(" token ", ["GT001", "MISSING", "GT002"], concurrency=2))
+
+    assert validations == ["token"]
+    assert result["GT001"] == {"sku": "GT001"}
+    assert result["GT002"] == {"sku": "GT002"}
+    assert isinstance(result["MISSING"], tiny_service.TinyNotFoundError)
+
+
+def test_get_product_by_sku_serves_repeated_lookups_from_cache(monkeypatch):
+    calls = _patch_tiny(monkeypatch, SEARCH_ITEM)
+
+    first = asyncio.run(tiny_service.get_product_by_sku("token", "GT001"))
+    first["title"] = "alterado pelo chamador"
+    second = asyncio.run(tiny_service.get_product_by_sku("token", "gt001"))
+
+    assert calls == [tiny_service.TINY_SEARCH_URL]
+    assert second["title"] == "Garrafa Térmica 1L"
+    assert all("token" not in key for key in tiny_service.PRODUCT_CACHE)
+
+    tiny_service.invalidate_product_cache("GT001")
+    asyncio.run(tiny_service.get_product_by_sku("token", "GT001"))
+    assert calls == [tiny_service.TINY_SEARCH_URL] * 2
+
+
+def test_validate_token_caches_only_successful_validations(monkeypatch):
+    responses = [
+        {"retorno": {"status": "Erro", "erros": [{"erro": "API Bloqueada temporariamente"}]}},
+        {"retorno": {"status": "OK"}},
+    ]
+
+    async def fake_call_tiny_api(url, payload, timeout=15.0, max_retries=2):
+        return responses.pop(0)
+
+    monkeypatch.setattr(tiny_service, "_call_tiny_api", fake_call_tiny_api)
+
+    assert asyncio.run(tiny_service.validate_token("token"))[0] is False
+    assert asyncio.run(tiny_service.validate_token("token")) == (True, None)
+    assert asyncio.run(tiny_service.validate_token("token")) == (True, None)
+    assert responses == []
+
+
+def test_map_tiny_to_product_data_converts_fields_with_fallbacks():
+    mapped = tiny_service.map_tiny_to_product_data({
+        "nome": " Garrafa ",
+        "codigo": "SKU1",
+        "categoria": {"descricao": "Casa"},
+        "alturaEmbalagem": "10,5",
+        "larguraEmbalagem": 7,
+        "peso_bruto": "abc",
+        "preco_custo": "12,30",
+        "preco": 49.9,
+    })
+
+    assert mapped["title"] == "Garrafa"
+    assert mapped["gtin"] == ""
+    assert mapped["categoria"] == "Casa"
+    assert mapped["height_cm"] == 10.5
+    assert mapped["width_cm"] == 7.0
+    assert mapped["length_cm"] == 0.0
+    assert mapped["weight_kg"] == 0.0
+    assert mapped["cost_price"] == 12.3
+    assert mapped["list_price"] == 49.9
+    assert mapped["promo_price"] == 0.0
+
+
+def test_get_product_by_sku_resolves_kit_components_concurrently(monkeypatch):
+    kit = [{"item": {"id_produto": str(i), "quantidade": "2"}} for i in range(8)]
+    in_flight = 0
+    max_in_flight = 0
+
+    async def fake_validate_token(token):
+        return True, None
+
+    async def fake_call_tiny_api(url, payload, timeout=15.0, max_retries=2):
+        if url == tiny_service.TINY_SEARCH_URL:
+            return {"retorno": {"status": "OK", "produtos": [{"produto": dict(SEARCH_ITEM, classe_produto="K")}]}}
+        if payload["id"] == "123":
+            return {"retorno": {"status": "OK", "produto": dict(SEARCH_ITEM, kit=kit)}}
+        return {"retorno": {"status": "OK", "produto": {"codigo": f"C{payload['id']}", "preco_custo": "1,5"}}}
+
+    async def fake_purchase_cost(token, sku, timeout=15.0):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return 0.0
+
+    monkeypatch.setattr(tiny_service, "validate_token", fake_validate_token)
+    monkeypatch.setattr(tiny_service, "_call_tiny_api", fake_call_tiny_api)
+    monkeypatch.setattr(tiny_service, "_find_most_recent_purchase_cost", fake_purchase_cost)
+
+    product = asyncio.run(tiny_service.get_product_by_sku("token", "GT001"))
+
+    assert product["cost_price"] == pytest.approx(8 * 2 * 1.5)
+    assert max_in_flight == tiny_service.KIT_COMPONENT_CONCURRENCY
+
+
+def test_search_in_date_window_fetches_pages_and_notes_concurrently(monkeypatch):
+    in_flight = 0
+    max_in_flight = 0
+
+    async def fake_call_tiny_api(url, payload, timeout=15.0, max_retries=2):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        if url == tiny_service.TINY_API_NFS_PESQUISA:
+            page = payload["pagina"]
+            notas = [{"nota_fiscal": {"id": f"{page}-{i}", "numero": f"{page}-{i}", "cliente": {"tipo_pessoa": "J"}}} for i in range(3)]
+            return {"retorno": {"status": "OK", "numero_paginas": 3, "notas_fiscais": notas}}
+        day = 10 if payload["id"] == "2-1" else 1
+        return {"retorno": {"nota_fiscal": {
+            "data_emissao": f"{day:02d}/01/2024",
+            "valor_produtos": "100,00",
+            "valor_faturado": "110,00",
+            "itens": [{"item": {"codigo": "GT001", "valor_unitario": "20,00"}}],
+        }}}
+
+    monkeypatch.setattr(tiny_service, "_call_tiny_api", fake_call_tiny_api)
+
+    cost, complete = asyncio.run(tiny_service._search_in_date_window("token", "GT001", "01/01/2024", "31/01/2024"))
+
+    assert cost == pytest.approx(22.0)
+    assert complete
+    assert max_in_flight > 1
+
+
+def test_find_most_recent_purchase_cost_is_cached_per_sku(monkeypatch):
+    scans = []
+
+    async def fake_deep_search(token, sku, timeout=15.0):
+        scans.append(sku)
+        return (12.5 if sku == "C1" else 0.0), True
+
+    monkeypatch.setattr(tiny_service, "_deep_search_purchase_cost", fake_deep_search)
+
+    async def _run():
+        for sku in ["C1", "C2", "C1", "C2"]:
+            await tiny_service._find_most_recent_purchase_cost("token", sku)
+        return await tiny_service._find_most_recent_purchase_cost("token", "C1")
+
+    assert asyncio.run(_run()) == 12.5
+    assert scans == ["C1", "C2"]
+
+    # "Sem NF" expira antes do custo encontrado
+    for entry in tiny_service.PURCHASE_COST_CACHE.values():
+        entry["cached_at"] -= tiny_service.PURCHASE_COST_NEGATIVE_TTL_SECONDS + 1
+    asyncio.run(tiny_service._find_most_recent_purchase_cost("token", "C1"))
+    asyncio.run(tiny_service._find_most_recent_purchase_cost("token", "C2"))
+    assert scans == ["C1", "C2", "C2"]
+
+
+def test_find_most_recent_purchase_cost_never_caches_failed_searches(monkeypatch):
+    results = {"ERR": (0.0, False), "PART": (8.0, False)}
+    scans = []
+
+    async def fake_deep_search(token, sku, timeout=15.0):
+        scans.append(sku)
+        if sku == "SLOW":
+            raise tiny_service.TinyTimeoutError("prazo")
+        return results[sku]
+
+    monkeypatch.setattr(tiny_service, "_deep_search_purchase_cost", fake_deep_search)
+
+    for sku in ["ERR", "SLOW"]:
+        with pytest.raises(tiny_service.TinyServiceError):
+            asyncio.run(tiny_service._find_most_recent_purchase_cost("token", sku))
+    # Custo achado com erros em janelas mais recentes: usado, mas não guardado
+    assert asyncio.run(tiny_service._find_most_recent_purchase_cost("token", "PART")) == 8.0
+
+    assert tiny_service.PURCHASE_COST_CACHE == {}
+
+
+def test_search_in_date_window_reports_incomplete_scan(monkeypatch):
+    async def failing_call(url, payload, timeout=15.0, max_retries=2):
+        raise tiny_service.TinyRateLimitError("429")
+
+    monkeypatch.setattr(tiny_service, "_call_tiny_api", failing_call)
+
+    assert asyncio.run(
+        tiny_service._search_in_date_window("token", "GT001", "01/01/2024", "31/01/2024")
+    ) == (0.0, False)
+
+
+@pytest.mark.parametrize("erro, expected", [
+    ("API Bloqueada - Excedido o limite de acessos", (0.0, False)),
+    ("A consulta não retornou registros", (0.0, True)),
+])
+def test_search_in_date_window_only_empty_result_error_is_complete(monkeypatch, erro, expected):
+    async def error_body(url, payload, timeout=15.0, max_retries=2):
+        return {"retorno": {"status": "Erro", "erros": [{"erro": erro}]}}
+
+    monkeypatch.setattr(tiny_service, "_call_tiny_api", error_body)
+
+    assert asyncio.run(
+        tiny_service._search_in_date_window("token", "GT001", "01/01/2024", "31/01/2024")
+    ) == expected
+
+
+def test_search_in_date_window_invoice_error_body_is_incomplete(monkeypatch):
+    async def fake_call_tiny_api(url, payload, timeout=15.0, max_retries=2):
+        if url == tiny_service.TINY_API_NFS_PESQUISA:
+            notas = [{"nota_fiscal": {"id": "1", "numero": "1", "data_emissao": "10/01/2024", "cliente": {"tipo_pessoa": "J"}}}]
+            return {"retorno": {"status": "OK", "numero_paginas": 1, "notas_fiscais": notas}}
+        return {"retorno": {"status": "Erro", "erros": [{"erro": "API Bloqueada - Excedido o limite de acessos"}]}}
+
+    monkeypatch.setattr(tiny_service, "_call_tiny_api", fake_call_tiny_api)
+
+    assert asyncio.run(
+        tiny_service._search_in_date_window("token", "GT001", "01/01/2024", "31/01/2024")
+    ) == (0.0, False)
+
+
+def test_rate_limited_deep_search_is_not_cached_as_no_invoice(monkeypatch):
+    async def blocked(url, payload, timeout=15.0, max_retries=2):
+        return {"retorno": {"status": "Erro", "erros": [{"erro": "API Bloqueada - Excedido o limite de acessos"}]}}
+
+    monkeypatch.setattr(tiny_service, "_call_tiny_api", blocked)
+    monkeypatch.setattr(tiny_service, "PURCHASE_COST_CACHE", {})
+
+    with pytest.raises(tiny_service.TinyServiceError):
+        asyncio.run(tiny_service._find_most_recent_purchase_cost("token", "GT001"))
+    assert tiny_service.PURCHASE_COST_CACHE == {}
+
+
+def test_call_tiny_api_parses_json_body(monkeypatch):
+    body = '{"retorno": {"status": "OK", "nome": "Pão"}}'.encode("utf-8")
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, content=body))
+
+    async def _run():
+        async with httpx.AsyncClient(transport=transport, base_url=tiny_service.TINY_API_BASE) as client:
+            monkeypatch.setattr(tiny_service, "_TINY_HTTP_CLIENT", client)
+            return await tiny_service._call_tiny_api(tiny_service.TINY_SEARCH_URL, {"token": "t"})
+
+    assert asyncio.run(_run())["retorno"]["nome"] == "Pão"
+
+
+def _fake_clock(monkeypatch):
+    """Relógio falso que só anda quando o limitador dorme."""
+    now = [0.0]
+    sleeps = []
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+        now[0] += delay
+
+    monkeypatch.setattr(tiny_service.asyncio, "sleep", fake_sleep)
+    return (lambda: now[0]), sleeps
+
+
+def test_rate_limiter_allows_burst_then_spaces_calls(monkeypatch):
+    clock, sleeps = _fake_clock(monkeypatch)
+    limiter = tiny_service._TinyRateLimiter(per_minute=60, burst=3, clock=clock)
+
+    async def _run():
+        for _ in range(5):
+            await limiter.acquire()
+
+    asyncio.run(_run())
+
+    # 3 na rajada, depois uma por segundo
+    assert sleeps == pytest.approx([1.0, 1.0])
+    # Balde vazio: 5 chamadas novas levam 5s
+    assert limiter.seconds_until(5) == pytest.approx(5.0)
+
+
+def test_rate_limiter_seconds_until_counts_callers_already_waiting():
+    now = [0.0]
+    limiter = tiny_service._TinyRateLimiter(per_minute=60, burst=3, clock=lambda: now[0])
+
+    async def _run():
+        assert limiter.seconds_until(5) == pytest.approx(2.0)  # 3 na rajada
+        for _ in range(3):
+            await limiter.acquire()
+        waiters = [asyncio.create_task(limiter.acquire()) for _ in range(4)]
+        await asyncio.sleep(0)
+        # 4 na frente, depois mais 2
+        assert limiter.seconds_until(2) == pytest.approx(6.0)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        assert limiter.waiting == 0
+
+    asyncio.run(_run())
+
+
+def test_rate_limiter_cancelled_waiter_does_not_consume_a_token():
+    now = [0.0]
+    limiter = tiny_service._TinyRateLimiter(per_minute=60, burst=1, clock=lambda: now[0])
+
+    async def _run():
+        await limiter.acquire()  # esvazia o balde
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        now[0] += 1.0
+        # A ficha reposta fica para o próximo, sem espera
+        await asyncio.wait_for(limiter.acquire(), timeout=0.1)
+
+    asyncio.run(_run())
+
+
+def test_rate_limiter_is_per_tiny_account(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(tiny_service, "TINY_RATE_LIMITERS", {})
+    monkeypatch.setattr(tiny_service, "TINY_RATE_LIMIT_BURST", 1)
+    monkeypatch.setattr(tiny_service, "_TinyRateLimiter", functools.partial(tiny_service._TinyRateLimiter, clock=lambda: now[0]))
+
+    async def _run():
+        await tiny_service._rate_limiter_for("token-a").acquire()  # esvazia o balde da conta A
+        # A conta B não espera pela A
+        await asyncio.wait_for(tiny_service._rate_limiter_for("token-b").acquire(), timeout=0.1)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(tiny_service._rate_limiter_for("token-a").acquire(), timeout=0.01)
+
+    asyncio.run(_run())
+    assert tiny_service._rate_limiter_for("token-a") is tiny_service._rate_limiter_for("token-a")
+
+
+def test_rate_limiter_cleanup_drops_only_idle_buckets(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(tiny_service, "TINY_RATE_LIMITERS", {})
+    monkeypatch.setattr(tiny_service, "TINY_RATE_LIMITERS_MAX_ENTRIES", 2)
+    monkeypatch.setattr(tiny_service, "_TinyRateLimiter", functools.partial(tiny_service._TinyRateLimiter, clock=lambda: now[0]))
+
+    busy = tiny_service._rate_limiter_for("busy")
+    asyncio.run(busy.acquire())
+    tiny_service._rate_limiter_for("idle")
+    tiny_service._rate_limiter_for("new")
+
+    assert tiny_service._rate_limiter_for("busy") is busy
+    assert tiny_service._token_hash("idle") not in tiny_service.TINY_RATE_LIMITERS
+
+
+def test_search_in_date_window_stops_after_newest_matching_invoice(monkeypatch):
+    fetched = []
+    dates = {f"n{i}": f"{28 - i:02d}/01/2024" for i in range(30)}
+
+    async def fake_call_tiny_api(url, payload, timeout=15.0, max_retries=2):
+        if url == tiny_service.TINY_API_NFS_PESQUISA:
+            notas = [
+                {"nota_fiscal": {"id": nid, "numero": nid, "data_emissao": d, "cliente": {"tipo_pessoa": "J"}}}
+                for nid, d in reversed(list(dates.items()))
+            ]
+            return {"retorno": {"status": "OK", "numero_paginas": 1, "notas_fiscais": notas}}
+        fetched.append(payload["id"])
+        return {"retorno": {"nota_fiscal": {
+            "data_emissao": dates[payload["id"]],
+            "valor_produtos": "100,00",
+            "valor_faturado": "100,00",
+            "itens": [{"item": {"codigo": "GT001", "valor_unitario": str(100 - int(payload["id"][1:]))}}],
+        }}}
+
+    monkeypatch.setattr(tiny_service, "_call_tiny_api", fake_call_tiny_api)
+
+    cost, _ = asyncio.run(tiny_service._search_in_date_window("token", "GT001", "01/01/2024", "31/01/2024"))
+
+    assert cost == pytest.approx(100.0)  # n0 é a mais recente, embora listada por último
+    assert len(fetched) == tiny_service.NFS_SEARCH_CONCURRENCY
+
+
+def test_deep_search_raises_timeout_when_deadline_expires(monkeypatch):
+    async def slow_window(token, sku, data_inicial, data_final, timeout=15.0, on_queue=None):
+        await asyncio.sleep(1)
+        return 10.0, True
+
+    monkeypatch.setattr(tiny_service, "_search_in_date_window", slow_window)
+    monkeypatch.setattr(tiny_service, "PURCHASE_COST_SEARCH_TIMEOUT_SECONDS", 0.05)
+
+    with pytest.raises(tiny_service.TinyTimeoutError):
+        asyncio.run(tiny_service._deep_search_purchase_cost("token", "GT001"))
+
+
+def test_deep_search_deadline_grows_with_queued_calls(monkeypatch):
+    # 60/min, sem rajada: o lote de 3 chamadas enfileirado leva o prazo para ~2s
+    monkeypatch.setattr(tiny_service, "PURCHASE_COST_SEARCH_TIMEOUT_SECONDS", None)
+    monkeypatch.setattr(tiny_service, "PURCHASE_COST_MIN_TIMEOUT_SECONDS", 0.05)
+    monkeypatch.setattr(tiny_service, "TINY_RATE_LIMITERS", {})
+    monkeypatch.setattr(tiny_service, "TINY_RATE_LIMIT_PER_MIN", 60)
+    monkeypatch.setattr(tiny_service, "TINY_RATE_LIMIT_BURST", 1)
+
+    async def queued_window(token, sku, data_inicial, data_final, timeout=15.0, on_queue=None):
+        on_queue(3)
+        await asyncio.sleep(0.2)
+        return 10.0, True
+
+    monkeypatch.setattr(tiny_service, "_search_in_date_window", queued_window)
+
+    assert asyncio.run(tiny_service._deep_search_purchase_cost("token", "GT001", timeout=0)) == (10.0, True)
+
+
+def test_deep_search_times_out_without_queued_work(monkeypatch):
+    monkeypatch.setattr(tiny_service, "PURCHASE_COST_SEARCH_TIMEOUT_SECONDS", None)
+    monkeypatch.setattr(tiny_service, "PURCHASE_COST_MIN_TIMEOUT_SECONDS", 0.05)
+
+    async def stalled_window(token, sku, data_inicial, data_final, timeout=15.0, on_queue=None):
+        await asyncio.sleep(1)
+        return 10.0, True
+
+    monkeypatch.setattr(tiny_service, "_search_in_date_window", stalled_window)
+
+    with pytest.raises(tiny_service.TinyTimeoutError):
+        asyncio.run(tiny_service._deep_search_purchase_cost("token", "GT001"))
+
+
+def test_get_product_by_sku_flags_cost_timeout_and_skips_cache(monkeypatch):
+    _patch_tiny(monkeypatch, SEARCH_ITEM)
+
+    async def timed_out(token, sku, timeout=15.0):
+        raise tiny_service.TinyTimeoutError("Busca de custo nas notas fiscais excedeu 60s")
+
+    monkeypatch.setattr(tiny_service, "_find_most_recent_purchase_cost", timed_out)
+
+    product = asyncio.run(tiny_service.get_product_by_sku("token", "GT001"))
+
+    assert product["cost_price"] == 30.0  # custo do cadastro
+    assert "GT001" in product["cost_warning"]
+    assert tiny_service.PRODUCT_CACHE == {}
+
+
+def test_deep_search_stops_at_newest_window_with_cost(monkeypatch):
+    windows = tiny_service._purchase_cost_windows(tiny_service.datetime.now())
+    costs = {windows[1]: 7.0, windows[2]: 9.0}
+    searched = []
+
+    async def fake_window(token, sku, data_inicial, data_final, timeout=15.0, on_queue=None):
+        searched.append((data_inicial, data_final))
+        return costs.get((data_inicial, data_final), 0.0), True
+
+    monkeypatch.setattr(tiny_service, "_search_in_date_window", fake_window)
+
+    assert asyncio.run(tiny_service._deep_search_purchase_cost("token", "GT001")) == (7.0, True)
+    assert searched == windows[:2]
+
+
+def test_deep_search_skips_older_windows_when_newest_has_the_invoice(monkeypatch):
+    # Só a janela mais recente tem a NF do SKU (5ª mais nova); as seguintes têm
+    # 20 notas de outros produtos cada, que não podem ser buscadas
+    windows = tiny_service._purchase_cost_windows(tiny_service.datetime.now())
+    pesquisas = []
+    detalhes = []
+    datas = {}
+
+    def _notas(prefix):
+        for i in range(20):
+            datas[f"{prefix}{i}"] = f"{28 - i:02d}/01/2024"
+        return [
+            {"nota_fiscal": {"id": f"{prefix}{i}", "numero": f"{prefix}{i}", "data_emissao": datas[f"{prefix}{i}"],
+                             "cliente": {"tipo_pessoa": "J"}}}
+            for i in range(20)
+        ]
+
+    async def fake_call_tiny_api(url, payload, timeout=15.0, max_retries=2):
+        if url == tiny_service.TINY_API_NFS_PESQUISA:
+            janela = (payload["dataInicial"], payload["dataFinal"])
+            pesquisas.append(janela)
+            notas = _notas("novo") if janela == windows[0] else _notas(f"antigo{windows.index(janela)}-")
+            return {"retorno": {"status": "OK", "numero_paginas": 1, "notas_fiscais": notas}}
+        detalhes.append(payload["id"])
+        codigo = "GT001" if payload["id"] == "novo4" else "OUTRO"
+        return {"retorno": {"nota_fiscal": {
+            "data_emissao": datas[payload["id"]],
+            "valor_produtos": "100,00",
+            "valor_faturado": "100,00",
+            "itens": [{"item": {"codigo": codigo, "valor_unitario": "42,00"}}],
+        }}}
+
+    monkeypatch.setattr(tiny_service, "_call_tiny_api", fake_call_tiny_api)
+
+    assert asyncio.run(tiny_service._deep_search_purchase_cost("token", "GT001")) == (42.0, True)
+    assert pesquisas == [windows[0]]
+    assert len(detalhes) == tiny_service.NFS_SEARCH_CONCURRENCY
+    assert all(d.startswith("novo") for d in detalhes)
+
+
+def test_get_product_by_sku_fetches_repeated_kit_component_once(monkeypatch):
+    kit = [
+        {"item": {"id_produto": "7", "quantidade": "2"}},
+        {"item": {"id_produto": "8", "quantidade": "1"}},
+        {"item": {"id_produto": "7", "quantidade": "3"}},
+    ]
+    component_gets = []
+
+    async def fake_validate_token(token):
+        return True, None
+
+    async def fake_call_tiny_api(url, payload, timeout=15.0, max_retries=2):
+        if url == tiny_service.TINY_SEARCH_URL:
+            return {"retorno": {"status": "OK", "produtos": [{"produto": dict(SEARCH_ITEM, classe_produto="K")}]}}
+        if payload["id"] == "123":
+            return {"retorno": {"status": "OK", "produto": dict(SEARCH_ITEM, kit=kit)}}
+        component_gets.append(payload["id"])
+        return {"retorno": {"status": "OK", "produto": {"codigo": f"C{payload['id']}", "preco_custo": payload["id"]}}}
+
+    async def fake_purchase_cost(token, sku, timeout=15.0):
+        return 0.0
+
+    monkeypatch.setattr(tiny_service, "validate_token", fake_validate_token)
+    monkeypatch.setattr(tiny_service, "_call_tiny_api", fake_call_tiny_api)
+    monkeypatch.setattr(tiny_service, "_find_most_recent_purchase_cost", fake_purchase_cost)
+
+    product = asyncio.run(tiny_service.get_product_by_sku("token", "GT001"))
+
+    assert sorted(component_gets) == ["7", "8"]
+    assert product["cost_price"] == pytest.approx(7 * 5 + 8 * 1)
+
+
+@pytest.mark.parametrize("status, expected_calls, error", [
+    (404, 1, tiny_service.TinyNotFoundError),
+    (400, 1, tiny_service.TinyServiceError),
+    (429, 3, tiny_service.TinyRateLimitError),
+    (500, 3, tiny_service.TinyServiceError),
+])
+def test_call_tiny_api_retries_only_transient_statuses(monkeypatch, status, expected_calls, error):
+    calls = []
+    sleeps = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(status, headers={"retry-after": "2"})
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+
+    monkeypatch.setattr(tiny_service.asyncio, "sleep", fake_sleep)
+    monkeypatch.setattr(tiny_service, "TINY_RATE_LIMIT_PER_MIN", 0)
+    monkeypatch.setattr(tiny_service, "TINY_RATE_LIMITERS", {})
+    transport = httpx.MockTransport(handler)
+
+    async def _run():
+        async with httpx.AsyncClient(transport=transport, base_url=tiny_service.TINY_API_BASE) as client:
+            monkeypatch.setattr(tiny_service, "_TINY_HTTP_CLIENT", client)
+            await tiny_service._call_tiny_api(tiny_service.TINY_SEARCH_URL, {"token": "t"})
+
+    with pytest.raises(error):
+        asyncio.run(_run())
+    assert len(calls) == expected_calls
+    assert sleeps == [2, 3.0][:expected_calls - 1]
@@ -5,18 +5,19 @@ Integração somente-leitura com Tiny ERP API para busca de produtos por SKU
 """
 
 import asyncio
+import copy
+import hashlib
 import logging
 import json
+import os
 import re
+import time
 from collections import defaultdict
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import httpx
+import orjson
 
-# Configuração de logging estruturado
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Sem basicConfig aqui: quem configura o logging é a aplicação (app.py)
 logger = logging.getLogger(__name__)
 
 
@@ -30,55 +31,188 @@ TINY_API_NFS_OBTER = f"{TINY_API_BASE}/nota.fiscal.obter.php"
 
 from datetime import datetime, timedelta
 
+# Componentes de kit consultados em paralelo em get_product_by_sku (cada um faz
+# produto.obter + busca de notas); limitado para não estourar o rate limit do Tiny
+KIT_COMPONENT_CONCURRENCY = 5
+# Chamadas simultâneas (páginas + detalhes de notas) por janela de busca de custo
+NFS_SEARCH_CONCURRENCY = 10
+# Prazo total da Deep Search por SKU (TINY_PURCHASE_COST_TIMEOUT fixa o prazo; sem
+# ele, cresce com as chamadas enfileiradas no limitador, a partir do mínimo abaixo)
+_purchase_cost_timeout_env = os.getenv("TINY_PURCHASE_COST_TIMEOUT")
+PURCHASE_COST_SEARCH_TIMEOUT_SECONDS: Optional[float] = (
+    float(_purchase_cost_timeout_env) if _purchase_cost_timeout_env else None
+)
+PURCHASE_COST_MIN_TIMEOUT_SECONDS = 60.0
+
+# Limite de chamadas à API Tiny (por conta, isto é, por token): TINY_RATE_LIMIT_PER_MIN
+# chamadas por minuto, com rajadas de até TINY_RATE_LIMIT_BURST. 0 desliga o limitador.
+# 30/min é o limite do plano mais baixo com API; nesse ritmo uma Deep Search sem NF
+# (uma página por janela, 22 janelas) já leva ~35s, e cada lote de detalhes de notas
+# mais ~20s. O prazo da Deep Search acompanha esse ritmo (_deep_search_purchase_cost).
+TINY_RATE_LIMIT_PER_MIN = float(os.getenv("TINY_RATE_LIMIT_PER_MIN", "30"))
+TINY_RATE_LIMIT_BURST = int(os.getenv("TINY_RATE_LIMIT_BURST", "5"))
+
+
+class _TinyRateLimiter:
+    """
+    Token bucket para as chamadas ao Tiny: até `burst` fichas, repostas a
+    per_minute/60 por segundo. A ficha só sai do balde quando a chamada vai ser
+    feita; quem espera não reserva nada, então um acquire() cancelado (timeout da
+    Deep Search, request abortada) não consome cota de ninguém.
+    Não usa primitivas do asyncio (presas a um event loop): entre ler e gravar o
+    balde não há await, o que basta num loop single-thread.
+    """
+
+    def __init__(self, per_minute: float, burst: int, clock: Callable[[], float] = time.monotonic):
+        self.rate = per_minute / 60.0 if per_minute > 0 else 0.0  # fichas por segundo
+        self.capacity = float(max(1, burst))
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated_at = clock()
+        self.waiting = 0  # acquire() dormindo à espera de ficha
+
+    def seconds_until(self, calls: int) -> float:
+        """Tempo até mais `calls` chamadas saírem, atrás das que já esperam ficha."""
+        if not self.rate:
+            return 0.0
+        tokens = min(self.capacity, self._tokens + (self._clock() - self._updated_at) * self.rate)
+        return max(0.0, self.waiting + calls - tokens) / self.rate
+
+    def is_full(self) -> bool:
+        """Balde cheio: ninguém esperando, e um balde novo se comportaria igual."""
+        return self._tokens + (self._clock() - self._updated_at) * self.rate >= self.capacity
+
+    async def acquire(self) -> None:
+        if not self.rate:
+            return
+        while True:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return
+            # Dorme até a próxima ficha; outro acquire pode levá-la antes (tenta de novo)
+            self.waiting += 1
+            try:
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+            finally:
+                self.waiting -= 1
+
+
+# Um balde por conta Tiny (hash do token): a cota do Tiny é por conta, então a Deep
+# Search ou o kit de um usuário não seguram as chamadas dos demais
+TINY_RATE_LIMITERS: Dict[str, _TinyRateLimiter] = {}
+TINY_RATE_LIMITERS_MAX_ENTRIES = 1000
+
+
+def _cleanup_rate_limiters() -> None:
+    """Descarta baldes cheios (ociosos) quando há contas demais; recriá-los não muda nada."""
+    if len(TINY_RATE_LIMITERS) < TINY_RATE_LIMITERS_MAX_ENTRIES:
+        return
+    for key in [k for k, limiter in TINY_RATE_LIMITERS.items() if limiter.is_full()]:
+        del TINY_RATE_LIMITERS[key]
+
+
+def _rate_limiter_for(token: str) -> _TinyRateLimiter:
+    key = _token_hash(token)
+    limiter = TINY_RATE_LIMITERS.get(key)
+    if limiter is None:
+        _cleanup_rate_limiters()
+        limiter = TINY_RATE_LIMITERS[key] = _TinyRateLimiter(TINY_RATE_LIMIT_PER_MIN, TINY_RATE_LIMIT_BURST)
+    return limiter
+
+
+# Cliente HTTP compartilhado para a API Tiny: reaproveita conexões TLS entre
+# chamadas e tentativas. keepalive_expiry curto descarta conexões ociosas antes
+# que o Tiny as derrube; conexões que falham saem do pool e a retentativa abre outra.
+_TINY_HTTP_CLIENT: Optional[httpx.AsyncClient] = None
+
+
+def _get_tiny_http_client() -> httpx.AsyncClient:
+    global _TINY_HTTP_CLIENT
+    if _TINY_HTTP_CLIENT is None or _TINY_HTTP_CLIENT.is_closed:
+        _TINY_HTTP_CLIENT = httpx.AsyncClient(
+            base_url=TINY_API_BASE,
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=5.0),
+        )
+    return _TINY_HTTP_CLIENT
+
+
+async def close_http_client() -> None:
+    """Fecha o cliente compartilhado; registrar no shutdown da aplicação."""
+    if _TINY_HTTP_CLIENT is not None:
+        await _TINY_HTTP_CLIENT.aclose()
+
+
+TINY_RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+TINY_MAX_RETRY_AFTER_SECONDS = 30.0
+
+
+def _retry_after_seconds(response: httpx.Response) -> float:
+    """Retry-After em segundos (limitado a TINY_MAX_RETRY_AFTER_SECONDS); 0 se ausente/inválido."""
+    try:
+        return min(max(float(response.headers.get("retry-after", 0)), 0.0), TINY_MAX_RETRY_AFTER_SECONDS)
+    except ValueError:
+        return 0.0
+
+
 async def _call_tiny_api(url: str, payload: Dict[str, Any], timeout: float = 15.0, max_retries: int = 2) -> Dict[str, Any]:
     """
-    Realiza uma chamada para a API Tiny garantindo uma nova conexão e retentativas silenciosas.
-    Implementa o requisito de 'matar a conexão ao fim e sempre usar uma nova'.
+    Realiza uma chamada para a API Tiny com retentativas silenciosas, usando o
+    cliente compartilhado (conexões do pool; as com falha são descartadas). Cada
+    tentativa passa pelo limitador da conta do token do payload.
     """
+    client = _get_tiny_http_client()
+    limiter = _rate_limiter_for(payload.get("token", ""))
     last_error = None
+    retry_after = 0.0
     for attempt in range(max_retries + 1):
         try:
-            # Sempre usamos um novo cliente para garantir uma conexão fresca
-            async with httpx.AsyncClient() as client:
-                if attempt > 0:
-                    await asyncio.sleep(attempt * 1.5) # backoff simples
-                
-                response = await client.post(url, data=payload, timeout=timeout)
-                
-                # Se o status code for 502, 503 ou 504 (erros de gateway/timeout do servidor), podemos retentar
-                if response.status_code in [502, 503, 504] and attempt < max_retries:
-                    continue
-                    
-                if response.status_code != 200:
-                    status_code = int(response.status_code)
-                    if status_code in (401, 403):
-                        raise TinyAuthError(f"Status HTTP {status_code}")
-                    if status_code == 404:
-                        raise TinyNotFoundError("Status HTTP 404")
-                    if status_code == 408:
-                        raise TinyTimeoutError("Status HTTP 408")
-                    if status_code == 429:
-                        raise TinyRateLimitError("Status HTTP 429")
-                    raise TinyServiceError(f"Status HTTP {status_code}")
-                
-                data = response.json()
-                retorno = data.get("retorno", {})
-                
-                # Alguns erros do Tiny indicam instabilidades que podem ser sanadas com retry
-                if retorno.get("status") == "Erro":
-                    errors = retorno.get("erros", [])
-                    if errors:
-                        msg = errors[0].get("erro", "")
-                        # Se for erro de limite de requisições ou instabilidade temporária, retenta
-                        if "limite" in msg.lower() or "temporariamente" in msg.lower() or "overload" in msg.lower():
-                            if attempt < max_retries:
-                                continue
+            if attempt > 0:
+                await asyncio.sleep(max(attempt * 1.5, retry_after)) # backoff simples (ou o Retry-After)
+                retry_after = 0.0
+            
+            await limiter.acquire()
+            response = await client.post(url, data=payload, timeout=timeout)
+            
+            # 429 e 5xx são transitórios: retenta (respeitando Retry-After). Os demais
+            # códigos (401/403/404/...) não mudam na retentativa e falham na hora.
+            if response.status_code in TINY_RETRYABLE_STATUS and attempt < max_retries:
+                retry_after = _retry_after_seconds(response)
+                continue
                 
-                return data
+            if response.status_code != 200:
+                status_code = int(response.status_code)
+                if status_code in (401, 403):
+                    raise TinyAuthError(f"Status HTTP {status_code}")
+                if status_code == 404:
+                    raise TinyNotFoundError("Status HTTP 404")
+                if status_code == 408:
+                    raise TinyTimeoutError("Status HTTP 408")
+                if status_code == 429:
+                    raise TinyRateLimitError("Status HTTP 429")
+                raise TinyServiceError(f"Status HTTP {status_code}")
+            
+            data = orjson.loads(response.content)
+            retorno = data.get("retorno", {})
+            
+            # Alguns erros do Tiny indicam instabilidades que podem ser sanadas com retry
+            if retorno.get("status") == "Erro":
+                errors = retorno.get("erros", [])
+                if errors:
+                    msg = errors[0].get("erro", "")
+                    # Se for erro de limite de requisições ou instabilidade temporária, retenta
+                    if "limite" in msg.lower() or "temporariamente" in msg.lower() or "overload" in msg.lower():
+                        if attempt < max_retries:
+                            continue
+            
+            return data
                 
         except (httpx.ConnectError, httpx.TimeoutException, httpx.NetworkError) as e:
             last_error = e
-            logger.warning(f"Conexão Tiny falhou na tentativa {attempt+1}: {e}. Retentando com nova conexão...")
+            logger.warning("Conexão Tiny falhou na tentativa %d: %s. Retentando com nova conexão...", attempt + 1, e)
             if attempt < max_retries:
                 continue
         except TinyServiceError:
@@ -192,19 +326,52 @@ def _is_tiny_not_found_message(message: Optional[str]) -> bool:
     return any(marker in msg for marker in not_found_markers)
 
 
+def _is_tiny_empty_result(retorno: Dict[str, Any]) -> bool:
+    """Erro do Tiny que só quer dizer "nenhum registro" (ex.: página além da última)."""
+    return "retornou registros" in _normalize_error_message(_extract_tiny_error(retorno))
+
+
 def _log_safe_request(url: str, has_token: bool, **kwargs):
     """Log de requisição sem expor o token"""
-    logger.info(f"Tiny API Request: {url}, authenticated: {has_token}, params: {list(kwargs.keys())}")
+    logger.info("Tiny API Request: %s, authenticated: %s, params: %s", url, has_token, list(kwargs))
 
 
-async def _search_in_date_window(token: str, sku: str, data_inicial: str, data_final: str, timeout: float = 15.0) -> float:
-    """Busca notas fiscais APENAS dentro de uma janela de datas específica (Assíncrono)."""
-    page_number = 1
-    candidatos = []
-    eh_o_fim = False
+def _nf_date_key(data_emissao: str) -> Tuple[int, int, int]:
+    """Chave de ordenação (ano, mês, dia) de uma data dd/mm/aaaa do Tiny."""
+    dia, mes, ano = data_emissao.split('/')
+    return int(ano), int(mes), int(dia)
 
-    while not eh_o_fim:
-        payload = {
+
+async def _search_in_date_window(
+    token: str,
+    sku: str,
+    data_inicial: str,
+    data_final: str,
+    timeout: float = 15.0,
+    on_queue: Optional[Callable[[int], None]] = None,
+) -> Tuple[float, bool]:
+    """
+    Busca notas fiscais APENAS dentro de uma janela de datas específica (Assíncrono).
+
+    A página 1 informa o total de páginas; as demais e os detalhes das notas são
+    buscados em paralelo (até NFS_SEARCH_CONCURRENCY chamadas simultâneas), com os
+    detalhes pedidos da nota mais recente para a mais antiga. Uma página ou nota com
+    erro encerra a varredura nela, mantendo os candidatos já encontrados.
+    `on_queue(n)` é avisado antes de cada lote de n chamadas (prazo da Deep Search).
+
+    Returns:
+        (custo, completa): custo da NF mais recente com o SKU (0.0 se nenhuma) e se a
+        janela foi varrida sem erros; incompleta, 0.0 não quer dizer "sem NF"
+    """
+    sem = asyncio.Semaphore(NFS_SEARCH_CONCURRENCY)
+    queue = on_queue or (lambda calls: None)
+
+    async def _call(url: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        async with sem:
+            return await _call_tiny_api(url, payload, timeout=timeout)
+
+    def _page_payload(page_number: int) -> Dict[str, Any]:
+        return {
             "token": token,
             "formato": "JSON",
             "tipoNota": "E",  # Entrada
@@ -212,120 +379,286 @@ async def _search_in_date_window(token: str, sku: str, data_inicial: str, data_f
             "dataFinal": data_final,
             "pagina": page_number
         }
-        
-        try:
-            data = await _call_tiny_api(TINY_API_NFS_PESQUISA, payload, timeout=timeout)
-            retorno = data.get("retorno", {})
-            
-            if retorno.get("status") != "OK":
+
+    # 1. Páginas: a primeira dá o total, as demais vão em paralelo
+    try:
+        queue(1)
+        first_page = await _call(TINY_API_NFS_PESQUISA, _page_payload(1))
+        total_pages = int((first_page.get("retorno") or {}).get('numero_paginas', 1))
+    except Exception as e:
+        logger.error("Erro em _search_in_date_window: %s", e)
+        return 0.0, False
+    pages: List[Any] = [first_page]
+    if total_pages > 1:
+        queue(total_pages - 1)
+        pages += await asyncio.gather(
+            *(_call(TINY_API_NFS_PESQUISA, _page_payload(n)) for n in range(2, total_pages + 1)),
+            return_exceptions=True,
+        )
+
+    # Resumos de notas das páginas válidas, na ordem (para na primeira página com erro/vazia)
+    resumos = []
+    completa = True
+    for data in pages:
+        if isinstance(data, Exception):
+            logger.error("Erro em _search_in_date_window: %s", data)
+            completa = False
+            break
+        retorno = data.get("retorno") or {}
+        if retorno.get("status") != "OK":
+            # Só "A consulta não retornou registros" é fim legítimo; limite/instabilidade
+            # que sobraram das retentativas não querem dizer "sem NF"
+            if not _is_tiny_empty_result(retorno):
+                logger.error("Erro em _search_in_date_window: %s", _extract_tiny_error(retorno))
+                completa = False
+            break
+        notas = retorno.get("notas_fiscais") or ()
+        if not notas:
+            break
+        for item in notas:
+            nota_resumo = item.get("nota_fiscal") or {}
+            if (nota_resumo.get("cliente") or {}).get("tipo_pessoa") == 'F':
+                continue
+            resumos.append(nota_resumo)
+
+    # 2. Detalhes das notas, da mais recente para a mais antiga (data do resumo), em
+    #    lotes de NFS_SEARCH_CONCURRENCY. Só a NF mais recente com o SKU importa: achado
+    #    um candidato, para assim que as notas restantes forem todas mais antigas.
+    #    Sem data legível em algum resumo, busca todas na ordem original.
+    try:
+        date_keys = [_nf_date_key(r.get("data_emissao")) for r in resumos]
+        ordem = sorted(range(len(resumos)), key=lambda idx: date_keys[idx], reverse=True)
+    except (AttributeError, TypeError, ValueError):
+        date_keys = None
+        ordem = list(range(len(resumos)))
+
+    encontrados = []  # (posição original, candidato)
+    for start in range(0, len(ordem), NFS_SEARCH_CONCURRENCY):
+        if encontrados and date_keys is not None:
+            melhor = max(date_keys[idx] for idx, _ in encontrados)
+            if date_keys[ordem[start]] < melhor:
                 break
-                
-            total_pages = int(retorno.get('numero_paginas', 1))
-            notas = retorno.get("notas_fiscais", [])
-            
-            if not notas:
+        lote = ordem[start:start + NFS_SEARCH_CONCURRENCY]
+        queue(len(lote))
+        detalhes = await asyncio.gather(
+            *(
+                _call(TINY_API_NFS_OBTER, {"token": token, "formato": "JSON", "id": resumos[idx].get("id")})
+                for idx in lote
+            ),
+            return_exceptions=True,
+        )
+
+        falhou = False
+        for idx, detalhe_data in zip(lote, detalhes):
+            if isinstance(detalhe_data, Exception):
+                logger.error("Erro em _search_in_date_window: %s", detalhe_data)
+                falhou = True
                 break
-                
-            for item in notas:
-                nota_resumo = item.get("nota_fiscal", {})
-                
-                if nota_resumo.get("cliente", {}).get("tipo_pessoa") == 'F':
-                    continue
-                    
-                id_nota = nota_resumo.get("id")
-                
-                # Busca detalhe da nota
-                detalhe_payload = {
-                    "token": token,
-                    "formato": "JSON",
-                    "id": id_nota
-                }
-                
-                detalhe_data = await _call_tiny_api(TINY_API_NFS_OBTER, detalhe_payload, timeout=timeout)
-                full_nota = detalhe_data.get("retorno", {}).get("nota_fiscal", {})
-                itens = full_nota.get("itens", [])
-                
-                for line in itens:
-                    prod = line.get("item", {})
-                    if prod.get("codigo") == sku:
-                        candidatos.append({
-                            "nota_numero": nota_resumo.get("numero"),
-                            "data_emissao": full_nota.get("data_emissao"),
-                            "valor_produtos": full_nota.get("valor_produtos"),
-                            "valor_faturado": full_nota.get("valor_faturado"),
-                            "custo_unitario": prod.get("valor_unitario")
-                        })
-                        break
-                            
-            page_number += 1
-            eh_o_fim = (page_number > total_pages)
+            retorno_nota = detalhe_data.get("retorno") or {}
+            if retorno_nota.get("status") == "Erro":
+                logger.error("Erro em _search_in_date_window: %s", _extract_tiny_error(retorno_nota))
+                falhou = True
+                break
+            # `.get(k) or {}` só cria o dict vazio quando falta a chave (o default de .get(k, {}) é criado sempre)
+            full_nota = retorno_nota.get("nota_fiscal") or {}
+            itens = full_nota.get("itens") or ()
             
-        except Exception as e:
-            logger.error(f"Erro em _search_in_date_window: {e}")
+            for line in itens:
+                prod = line.get("item") or {}
+                if prod.get("codigo") == sku:
+                    encontrados.append((idx, {
+                        "nota_numero": resumos[idx].get("numero"),
+                        "data_emissao": full_nota.get("data_emissao"),
+                        "valor_produtos": full_nota.get("valor_produtos"),
+                        "valor_faturado": full_nota.get("valor_faturado"),
+                        "custo_unitario": prod.get("valor_unitario")
+                    }))
+                    break
+        if falhou:
+            completa = False
             break
 
+    # Ordem original das notas: no empate de data vence a que o Tiny listou primeiro
+    candidatos = [cand for _, cand in sorted(encontrados, key=lambda pair: pair[0])]
+
     if candidatos:
         try:
-            candidatos.sort(
-                key=lambda x: datetime.strptime(x['data_emissao'], "%d/%m/%Y"),
-                reverse=True
-            )
-            vencedor = candidatos[0]
+            # NF mais recente (a primeira, em caso de empate na data)
+            vencedor = max(candidatos, key=lambda x: _nf_date_key(x['data_emissao']))
             
-            val_prod_nf = float(str(vencedor['valor_produtos']).replace(',', '.'))
-            val_fat_nf = float(str(vencedor['valor_faturado']).replace(',', '.'))
+            val_prod_nf = _parse_decimal(vencedor['valor_produtos'])
+            val_fat_nf = _parse_decimal(vencedor['valor_faturado'])
             
             taxa_custos_adicionais = 0.0
             if val_prod_nf > 0:
                 taxa_custos_adicionais = (val_fat_nf / val_prod_nf) - 1
                 
-            custo_unitario = float(str(vencedor['custo_unitario']).replace(',', '.'))
+            custo_unitario = _parse_decimal(vencedor['custo_unitario'])
             custo_final = custo_unitario * (1 + taxa_custos_adicionais)
             
-            logger.info(f"[{sku}] Deep Search: Custo encontrado na NF {vencedor['nota_numero']}: R$ {custo_final:.4f}")
-            return round(custo_final, 4)
+            logger.info("[%s] Deep Search: Custo encontrado na NF %s: R$ %.4f", sku, vencedor['nota_numero'], custo_final)
+            return round(custo_final, 4), completa
         except Exception as e:
-            logger.error(f"[{sku}] Erro processando candidato vencedor: {e}")
-            return 0.0
+            logger.error("[%s] Erro processando candidato vencedor: %s", sku, e)
+            return 0.0, False
             
-    return 0.0
+    return 0.0, completa
 
 
 async def _find_most_recent_purchase_cost(token: str, sku: str, timeout: float = 15.0) -> float:
-    """Busca em Deep Search por notas fiscais de entrada assíncrono."""
+    """
+    Custo de compra mais recente do SKU (Deep Search em NFs de entrada), em cache
+    por (token, SKU, dia): componentes repetidos entre kits não refazem a varredura.
+    Só entra no cache busca sem erros; timeout e erros da API Tiny nunca.
+
+    Raises:
+        TinyTimeoutError: prazo da Deep Search estourado
+        TinyServiceError: busca com erros e sem custo (não dá para afirmar "sem NF")
+    """
+    cache_key = (_token_hash(token), sku, datetime.now().date().isoformat())
+    cached = PURCHASE_COST_CACHE.get(cache_key)
+    if cached:
+        ttl = PURCHASE_COST_CACHE_TTL_SECONDS if cached["cost"] > 0 else PURCHASE_COST_NEGATIVE_TTL_SECONDS
+        if time.time() - cached["cached_at"] <= ttl:
+            return cached["cost"]
+
+    cost, complete = await _deep_search_purchase_cost(token, sku, timeout)
+    if complete:
+        PURCHASE_COST_CACHE[cache_key] = {"cost": cost, "cached_at": time.time()}
+        _cleanup_purchase_cost_cache()
+    elif cost == 0.0:
+        raise TinyServiceError("Busca de custo nas notas fiscais incompleta (erros na API Tiny)")
+    return cost
+
+
+def _fmt_br(d: datetime) -> str:
+    """dd/mm/aaaa (formato de data da API Tiny) sem passar pelo strftime."""
+    return f"{d.day:02d}/{d.month:02d}/{d.year}"
+
+
+def _purchase_cost_windows(now: datetime) -> List[Tuple[str, str]]:
+    """Janelas (início, fim) da Deep Search, da mais recente para a mais antiga."""
     initial_lookback = 90
     deep_search_step = 30
     max_lookback_days = 730
 
-    current_end_date = datetime.now()
+    current_end_date = now
     current_start_date = current_end_date - timedelta(days=initial_lookback)
-
     total_days_checked = initial_lookback
-    attempt = 1
-    str_inicio = current_start_date.strftime("%d/%m/%Y")
-    str_fim = current_end_date.strftime("%d/%m/%Y")
-
-    logger.info(f"[{sku}] Iniciando busca de custo (Janela {str_inicio} a {str_fim})")
 
+    windows = []
     while total_days_checked <= max_lookback_days:
-        custo = await _search_in_date_window(token, sku, str_inicio, str_fim, timeout)
-        
-        if custo > 0:
-            return custo
-            
+        windows.append((_fmt_br(current_start_date), _fmt_br(current_end_date)))
         current_end_date = current_start_date - timedelta(days=1)
         current_start_date = current_end_date - timedelta(days=deep_search_step)
-        
         total_days_checked += deep_search_step
-        attempt += 1
-        str_inicio = current_start_date.strftime("%d/%m/%Y")
-        str_fim = current_end_date.strftime("%d/%m/%Y")
-        
-        if attempt > 1:
-            logger.info(f"[{sku}] Recuando (Tentativa {attempt}: Janela {str_inicio} a {str_fim})")
+    return windows
+
 
-    return 0.0
+async def _deep_search_purchase_cost(token: str, sku: str, timeout: float = 15.0) -> Tuple[float, bool]:
+    """
+    Busca em Deep Search por notas fiscais de entrada assíncrono.
 
+    As janelas são varridas uma a uma, da mais recente para a mais antiga (a primeira
+    com custo vence); o paralelismo fica dentro de cada janela. Assim nenhuma janela
+    mais antiga gasta cota do Tiny quando uma mais nova já tem a NF. Devolve
+    (custo, completa) como _search_in_date_window: completa se nenhuma janela até a
+    vencedora (ou até a última, sem custo) teve erro.
+
+    Prazo: PURCHASE_COST_SEARCH_TIMEOUT_SECONDS, se definido; senão começa em
+    PURCHASE_COST_MIN_TIMEOUT_SECONDS e, a cada lote enfileirado, estende-se até o
+    limitador da conta liberar o lote (atrás de quem já espera ficha, como os outros
+    componentes de um kit) mais o timeout de uma chamada.
+
+    Raises:
+        TinyTimeoutError: prazo estourado (não dá para afirmar que não há NF)
+    """
+    windows = _purchase_cost_windows(datetime.now())
+    limiter = _rate_limiter_for(token)
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+    fixed_timeout = PURCHASE_COST_SEARCH_TIMEOUT_SECONDS
+    deadline = started_at + (fixed_timeout if fixed_timeout is not None else PURCHASE_COST_MIN_TIMEOUT_SECONDS)
+    logger.info("[%s] Iniciando busca de custo (Janela %s a %s)", sku, windows[0][0], windows[0][1])
+
+    def _on_queue(calls: int) -> None:
+        nonlocal deadline
+        if fixed_timeout is None:
+            deadline = max(deadline, loop.time() + limiter.seconds_until(calls) + timeout)
+
+    async def _walk_back() -> Tuple[float, bool]:
+        completa = True
+        for attempt, (inicio, fim) in enumerate(windows):
+            if attempt:
+                logger.debug("[%s] Recuando (Tentativa %d: %s a %s)", sku, attempt + 1, inicio, fim)
+            custo, janela_completa = await _search_in_date_window(
+                token, sku, inicio, fim, timeout, on_queue=_on_queue
+            )
+            completa = completa and janela_completa
+            if custo > 0:
+                return custo, completa
+        return 0.0, completa
+
+    search = asyncio.ensure_future(_walk_back())
+    try:
+        # O prazo pode ter crescido enquanto se esperava: só desiste ao alcançá-lo
+        while True:
+            done, _ = await asyncio.wait({search}, timeout=max(0.0, deadline - loop.time()))
+            if done:
+                return search.result()
+            if loop.time() >= deadline:
+                break
+    finally:
+        search.cancel()
+    raise TinyTimeoutError(f"Busca de custo nas notas fiscais excedeu {loop.time() - started_at:.0f}s")
+
+
+
+# Caches em memória (TTL curto): validação de token e produto por (token, SKU, include_raw).
+# Tokens entram só como hash. Apenas resultados de sucesso são guardados.
+TOKEN_VALIDATION_CACHE: Dict[str, float] = {}
+TOKEN_VALIDATION_CACHE_TTL_SECONDS = 300
+PRODUCT_CACHE: Dict[Tuple[str, str, bool], Dict[str, Any]] = {}
+PRODUCT_CACHE_TTL_SECONDS = 60
+PRODUCT_CACHE_MAX_ENTRIES = 1000
+# Custo de compra (Deep Search em NFs) por (token, SKU, dia). "Sem NF" (0.0) expira
+# antes, para que uma nota recém-lançada apareça logo.
+PURCHASE_COST_CACHE: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+PURCHASE_COST_CACHE_TTL_SECONDS = 3600
+PURCHASE_COST_NEGATIVE_TTL_SECONDS = 300
+PURCHASE_COST_CACHE_MAX_ENTRIES = 5000
+
+
+def _token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()[:16]
+
+
+def _cleanup_product_cache() -> None:
+    now = time.time()
+    expired = [k for k, v in PRODUCT_CACHE.items() if now - v["cached_at"] > PRODUCT_CACHE_TTL_SECONDS]
+    for k in expired:
+        del PRODUCT_CACHE[k]
+    while len(PRODUCT_CACHE) > PRODUCT_CACHE_MAX_ENTRIES:
+        PRODUCT_CACHE.pop(next(iter(PRODUCT_CACHE)))
+
+
+def _cleanup_purchase_cost_cache() -> None:
+    now = time.time()
+    expired = [k for k, v in PURCHASE_COST_CACHE.items() if now - v["cached_at"] > PURCHASE_COST_CACHE_TTL_SECONDS]
+    for k in expired:
+        del PURCHASE_COST_CACHE[k]
+    while len(PURCHASE_COST_CACHE) > PURCHASE_COST_CACHE_MAX_ENTRIES:
+        PURCHASE_COST_CACHE.pop(next(iter(PURCHASE_COST_CACHE)))
+
+
+def invalidate_product_cache(sku: Optional[str] = None) -> None:
+    """Descarta o produto em cache de um SKU (todos os tokens) ou o cache inteiro."""
+    if sku is None:
+        PRODUCT_CACHE.clear()
+        return
+    sku_key = sku.strip().upper()
+    for key in [k for k in PRODUCT_CACHE if k[1] == sku_key]:
+        del PRODUCT_CACHE[key]
 
 
 async def validate_token(token: str) -> Tuple[bool, Optional[str]]:
@@ -341,6 +674,11 @@ async def validate_token(token: str) -> Tuple[bool, Optional[str]]:
     if not token or not token.strip():
         return False, "Token vazio"
     
+    token_key = _token_hash(token.strip())
+    validated_at = TOKEN_VALIDATION_CACHE.get(token_key)
+    if validated_at is not None and time.time() - validated_at <= TOKEN_VALIDATION_CACHE_TTL_SECONDS:
+        return True, None
+    
     try:
         payload = {
             'token': token.strip(),
@@ -361,25 +699,58 @@ async def validate_token(token: str) -> Tuple[bool, Optional[str]]:
         
         if status == 'OK' or status_processamento == '3':
             logger.info("Token validado com sucesso")
+            TOKEN_VALIDATION_CACHE[token_key] = time.time()
             return True, None
         
         erro_msg = data['retorno'].get('erros', [{}])[0].get('erro', 'Token inválido')
-        logger.warning(f"Tiny API validation failed: {erro_msg}")
+        logger.warning("Tiny API validation failed: %s", erro_msg)
         return False, erro_msg
         
     except httpx.TimeoutException:
         logger.error("Timeout ao validar token Tiny")
         return False, "Timeout na validação"
     except Exception as e:
-        logger.error(f"Erro ao validar token: {str(e)}")
+        logger.error("Erro ao validar token: %s", e)
         return False, f"Erro: {str(e)}"
 
 
+# Campos usados por get_product_by_sku/map_tiny_to_product_data e lidos pela UI em
+# raw_data (TINY_TO_ML_ATTR_MAP e unidade em static/main.html). Se o item da
+# pesquisa já trouxer todos (e não for kit), produto.obter.php é dispensado.
+_FULL_PRODUCT_FIELDS = (
+    'id', 'nome', 'codigo', 'gtin', 'unidade', 'categoria', 'classe_produto',
+    'preco', 'preco_promocional', 'preco_custo', 'marca',
+    'peso_bruto', 'peso_liquido', 'alturaEmbalagem', 'larguraEmbalagem', 'comprimentoEmbalagem',
+)
+
+
+def _search_item_is_complete(produto_info: Dict[str, Any]) -> bool:
+    return (
+        all(field in produto_info for field in _FULL_PRODUCT_FIELDS)
+        and produto_info.get('classe_produto') != 'K'
+        and not produto_info.get('kit')
+    )
+
+
+async def _ensure_token_sane(token: str) -> None:
+    """Verificação de sanidade do token/conexão; levanta o erro Tiny correspondente."""
+    is_ok, error = await validate_token(token)
+    if not is_ok:
+        if _is_tiny_auth_message(error):
+            raise TinyAuthError(f"Falha na sanidade da conexão/token: {error}")
+        if _is_tiny_transient_message(error):
+            raise TinyRateLimitError(f"Falha temporária na sanidade da conexão Tiny: {error}")
+        raise TinyServiceError(f"Falha na sanidade da conexão Tiny: {error}")
+
+
 async def get_product_by_sku(
     token: str,
     sku: str,
     max_retries: int = 1,
-    timeout: float = 15.0
+    timeout: float = 15.0,
+    force_full: bool = False,
+    check_token: bool = True,
+    include_raw: bool = False
 ) -> Dict[str, Any]:
     """
     Busca produto no Tiny ERP por SKU com retry exponencial.
@@ -389,9 +760,16 @@ async def get_product_by_sku(
         sku: SKU do produto (código)
         max_retries: Número máximo de retentativas após primeira tentativa (padrão: 1 = 2 tentativas totais)
         timeout: Timeout em segundos (padrão: 15.0)
+        force_full: Sempre busca o cadastro completo (produto.obter.php), mesmo
+            quando a pesquisa já traz todos os campos usados
+        check_token: Faz a verificação de sanidade do token antes da busca
+            (lotes a fazem uma única vez e passam False)
+        include_raw: Inclui a resposta bruta inteira do Tiny em 'raw_data' (fixtures,
+            depuração); sem ele, 'raw_data' traz só os campos lidos pela UI
         
     Returns:
-        Dict com dados do produto mapeados
+        Dict com dados do produto mapeados; com 'cost_warning' quando a busca do
+        custo nas notas não terminou (prazo ou erros) e o custo veio do cadastro
         
     Raises:
         TinyAuthError: Token inválido
@@ -408,23 +786,22 @@ async def get_product_by_sku(
     token = token.strip()
     sku = sku.strip()
     
+    cache_key = (_token_hash(token), sku.upper(), include_raw)
+    cached = PRODUCT_CACHE.get(cache_key)
+    if not force_full and cached and time.time() - cached["cached_at"] <= PRODUCT_CACHE_TTL_SECONDS:
+        return copy.deepcopy(cached["data"])
+    
     # 1. Sanity Check Inicial (Válida Token e Conexão antes de começar)
     # Atende ao requisito de "fazer uma primeira verificação de sanidade"
-    is_ok, error = await validate_token(token)
-    if not is_ok:
-        if _is_tiny_auth_message(error):
-            raise TinyAuthError(f"Falha na sanidade da conexão/token: {error}")
-        if _is_tiny_transient_message(error):
-            raise TinyRateLimitError(f"Falha temporária na sanidade da conexão Tiny: {error}")
-        raise TinyServiceError(f"Falha na sanidade da conexão Tiny: {error}")
+    if check_token:
+        await _ensure_token_sane(token)
 
     try:
+        # Campos comuns a todas as chamadas desta busca
+        base_payload = {'token': token, 'formato': 'JSON'}
+
         # 1. Pesquisar produto por SKU
-        search_payload = {
-            'token': token,
-            'formato': 'JSON',
-            'pesquisa': sku
-        }
+        search_payload = {**base_payload, 'pesquisa': sku}
         
         _log_safe_request(TINY_SEARCH_URL, has_token=True, pesquisa=sku)
         search_data = await _call_tiny_api(TINY_SEARCH_URL, search_payload, timeout=timeout)
@@ -454,101 +831,172 @@ async def get_product_by_sku(
         if not produtos:
             raise TinyNotFoundError(f"SKU '{sku}' não encontrado no Tiny ERP")
         
-        # Procurar produto com código exato
-        produto_info = None
+        # Procurar produto com código exato (índice código normalizado -> produto;
+        # em códigos repetidos vale o primeiro, como na busca sequencial)
+        produtos_por_codigo: Dict[str, Dict[str, Any]] = {}
         for p in produtos:
-            prod = p.get('produto', {})
-            if prod.get('codigo', '').strip().upper() == sku.upper():
-                produto_info = prod
-                break
+            prod = p.get('produto') or {}
+            produtos_por_codigo.setdefault(_normalize_sku(prod.get('codigo')), prod)
+        produto_info = produtos_por_codigo.get(_normalize_sku(sku))
         
         if not produto_info:
             produto_info = produtos[0].get('produto', {})
-            logger.warning(f"SKU '{sku}' não encontrado exato, usando melhor match")
+            logger.warning("SKU '%s' não encontrado exato, usando melhor match", sku)
         
-        # 2. Obter detalhes completos do produto
+        # 2. Obter detalhes completos do produto (dispensado se a pesquisa já bastar)
         produto_id = produto_info.get('id')
         if not produto_id:
             raise TinyServiceError("ID do produto não encontrado")
         
-        get_payload = {
-            'token': token,
-            'formato': 'JSON',
-            'id': produto_id
-        }
-        
-        _log_safe_request(TINY_GET_URL, has_token=True, id=produto_id)
-        get_data = await _call_tiny_api(TINY_GET_URL, get_payload, timeout=timeout)
-        
-        if 'retorno' not in get_data or 'produto' not in get_data['retorno']:
-            raise TinyServiceError("Dados do produto não encontrados")
-        
-        produto_completo = get_data['retorno']['produto']
+        if not force_full and _search_item_is_complete(produto_info):
+            logger.info("[%s] Pesquisa já traz o cadastro completo; sem produto.obter", sku)
+            produto_completo = dict(produto_info)
+        else:
+            get_payload = {**base_payload, 'id': produto_id}
+            
+            _log_safe_request(TINY_GET_URL, has_token=True, id=produto_id)
+            get_data = await _call_tiny_api(TINY_GET_URL, get_payload, timeout=timeout)
+            
+            if 'retorno' not in get_data or 'produto' not in get_data['retorno']:
+                raise TinyServiceError("Dados do produto não encontrados")
+            
+            produto_completo = get_data['retorno']['produto']
         
         # 3. Adicionar Lógica Deep Search e Kit
         final_cost = 0.0
+        # SKUs cuja Deep Search estourou o prazo ou falhou: o custo cai no cadastro e
+        # o aviso vai junto no produto (cost_warning), em vez de passar por "sem NF"
+        cost_unresolved: List[str] = []
+
+        async def _purchase_cost(item_sku: str) -> float:
+            try:
+                return await _find_most_recent_purchase_cost(token, item_sku, timeout)
+            except TinyServiceError as e:
+                # Timeout ou busca incompleta (erros já logados na janela)
+                logger.warning("[%s] %s; usando custo do cadastro", item_sku, e)
+                cost_unresolved.append(item_sku)
+                return 0.0
+
         kit_items = produto_completo.get("kit", [])
         
         if kit_items:
-            logger.info(f"[{sku}] Identificado como KIT. Calculando componentes...")
-            custo_total_kit = 0.0
+            logger.info("[%s] Identificado como KIT. Calculando componentes...", sku)
+            # Quantidade total por componente: o mesmo id_produto repetido no kit é
+            # buscado uma vez só
+            qty_by_id: Dict[Any, float] = {}
             for component in kit_items:
                 item_data = component.get("item", {})
                 comp_id = item_data.get("id_produto")
                 
                 qty_str = item_data.get("quantidade", 0)
                 try:
-                    comp_qty = float(str(qty_str).replace(',', '.'))
+                    comp_qty = _parse_decimal(qty_str)
                 except (ValueError, TypeError):
                     comp_qty = 0.0
+                qty_by_id[comp_id] = qty_by_id.get(comp_id, 0.0) + comp_qty
+
+            sem = asyncio.Semaphore(KIT_COMPONENT_CONCURRENCY)
+
+            async def _component_cost(comp_id: Any, comp_qty: float) -> float:
+                async with sem:
+                    # Buscar componente
+                    comp_data = await _call_tiny_api(TINY_GET_URL, {**base_payload, "id": comp_id}, timeout=timeout)
+                    comp_full = comp_data.get("retorno", {}).get("produto", {})
+                    comp_sku = comp_full.get("codigo", "")
                     
-                # Buscar componente
-                comp_payload = {
-                    "token": token,
-                    "formato": "JSON",
-                    "id": comp_id
-                }
-                comp_data = await _call_tiny_api(TINY_GET_URL, comp_payload, timeout=timeout)
-                comp_full = comp_data.get("retorno", {}).get("produto", {})
-                comp_sku = comp_full.get("codigo", "")
-                
-                if comp_sku:
-                    custo_unit = await _find_most_recent_purchase_cost(token, comp_sku, timeout)
-                    if custo_unit == 0.0:
-                        try:
-                            custo_unit = float(str(comp_full.get("preco_custo")).replace(',', '.'))
-                        except (ValueError, TypeError):
-                            custo_unit = 0.0
-                    custo_total_kit += (custo_unit * comp_qty)
+                    if not comp_sku:
+                        return 0.0
+                    custo_unit = await _purchase_cost(comp_sku)
+                if custo_unit == 0.0:
+                    try:
+                        custo_unit = _parse_decimal(comp_full.get("preco_custo"))
+                    except (ValueError, TypeError):
+                        custo_unit = 0.0
+                return custo_unit * comp_qty
+
+            # Componentes em paralelo (limitado pelo semáforo); a falha de qualquer um
+            # propaga, como antes: custo de kit parcial seria preço errado
+            component_costs = await asyncio.gather(
+                *(_component_cost(comp_id, comp_qty) for comp_id, comp_qty in qty_by_id.items())
+            )
+            custo_total_kit = sum(component_costs)
             final_cost = custo_total_kit
         else:
-            final_cost = await _find_most_recent_purchase_cost(token, sku, timeout)
+            final_cost = await _purchase_cost(sku)
             if final_cost == 0.0:
                 try:
-                    final_cost = float(str(produto_completo.get("preco_custo")).replace(',', '.'))
-                    logger.info(f"[{sku}] Fallback cadastro: R$ {final_cost:.4f}")
+                    final_cost = _parse_decimal(produto_completo.get("preco_custo"))
+                    logger.info("[%s] Fallback cadastro: R$ %.4f", sku, final_cost)
                 except (ValueError, TypeError):
                     final_cost = 0.0
 
-        produto_completo['preco_custo_calculado'] = final_cost
-        mapped_data = map_tiny_to_product_data(produto_completo)
+        # Custo zero não sobrepõe nada: o mapeamento já cai no preco_custo do cadastro
+        if final_cost > 0:
+            produto_completo['preco_custo_calculado'] = final_cost
+        mapped_data = map_tiny_to_product_data(produto_completo, include_raw=include_raw)
         
-        logger.info(f"Produto '{sku}' obtido com sucesso")
+        logger.info("Produto '%s' obtido com sucesso", sku)
+        if cost_unresolved:
+            # Custo provisório: avisa quem chamou e não guarda em cache
+            mapped_data['cost_warning'] = (
+                f"A busca do custo nas notas fiscais não terminou ({', '.join(sorted(set(cost_unresolved)))}); "
+                "usando o custo do cadastro."
+            )
+            return mapped_data
+        PRODUCT_CACHE[cache_key] = {"data": copy.deepcopy(mapped_data), "cached_at": time.time()}
+        _cleanup_product_cache()
         return mapped_data
         
     except (TinyAuthError, TinyNotFoundError, TinyRateLimitError):
         raise
     except Exception as e:
-        logger.error(f"Erro ao obter produto Tiny: {str(e)}")
+        logger.error("Erro ao obter produto Tiny: %s", e)
         raise TinyServiceError(f"Falha na comunicação com Tiny ERP: {str(e)}")
 
 
-def map_tiny_to_product_data(raw_product: Dict[str, Any]) -> Dict[str, Any]:
+async def get_products_by_skus(
+    token: str,
+    skus: List[str],
+    concurrency: int = 8,
+    timeout: float = 15.0
+) -> Dict[str, Any]:
+    """
+    Busca vários SKUs em paralelo (no máximo `concurrency` por vez), com uma
+    única verificação de sanidade do token para o lote.
+    
+    Returns:
+        Dict sku -> dados mapeados (como get_product_by_sku) ou a TinyServiceError
+        daquele SKU; um SKU com falha não interrompe os demais.
+        
+    Raises:
+        TinyAuthError / TinyRateLimitError / TinyServiceError: falha na sanidade do token
+    """
+    if not token or not token.strip():
+        raise TinyAuthError("Token não fornecido")
+    token = token.strip()
+    await _ensure_token_sane(token)
+
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def _one(sku: str) -> Tuple[str, Any]:
+        async with sem:
+            try:
+                return sku, await get_product_by_sku(token, sku, timeout=timeout, check_token=False)
+            except TinyServiceError as e:
+                return sku, e
+
+    return dict(await asyncio.gather(*(_one(sku) for sku in skus)))
+
+
+def map_tiny_to_product_data(raw_product: Dict[str, Any], *, include_raw: bool = False) -> Dict[str, Any]:
     """
     Mapeia resposta da API Tiny para formato interno do app.
     
     Args:
         raw_product: Dados brutos do produto da API Tiny
+        include_raw: Mantém raw_product inteiro em 'raw_data' (dobra o tamanho do
+            dict, então só quem consome a resposta bruta deve pedir); sem ele,
+            'raw_data' traz só _TINY_RAW_UI_FIELDS
         
     Returns:
         Dict com dados mapeados:
@@ -563,84 +1011,101 @@ def map_tiny_to_product_data(raw_product: Dict[str, Any]) -> Dict[str, Any]:
             - list_price: Preço de lista/tabela
             - promo_price: Preço promocional
     """
-    def safe_float(value, default=0.0):
-        """Converte valor para float com fallback"""
-        if value is None or value == '':
-            return default
-        try:
-            return float(str(value).replace(',', '.'))
-        except (ValueError, TypeError):
-            return default
-    
-    def safe_str(value, default=''):
-        """Converte valor para string com fallback"""
-        if value is None:
-            return default
-        return str(value).strip()
-    
-    # Extrair campos básicos
-    title = safe_str(raw_product.get('nome', ''))
-    sku = safe_str(raw_product.get('codigo', ''))
-    gtin = safe_str(raw_product.get('gtin', ''))
-    unit = safe_str(raw_product.get('unidade', ''))
+    get = raw_product.get
+    mapped = {out: _safe_str(get(src)) for out, src in _TINY_STR_FIELDS}
+
     # Categoria do produto no Tiny (pode ser objeto {id, descricao} ou string)
-    _cat_raw = raw_product.get('categoria', '')
+    _cat_raw = get('categoria', '')
     if isinstance(_cat_raw, dict):
-        categoria = safe_str(_cat_raw.get('descricao') or _cat_raw.get('nome', ''))
+        mapped['categoria'] = _safe_str(_cat_raw.get('descricao') or _cat_raw.get('nome', ''))
     else:
-        categoria = safe_str(_cat_raw)
-    
+        mapped['categoria'] = _safe_str(_cat_raw)
+
     # Dimensões (campos podem variar: altura_embalagem, largura_embalagem, etc)
-    height_cm = safe_float(raw_product.get('alturaEmbalagem', 0))
-    width_cm = safe_float(raw_product.get('larguraEmbalagem', 0))
-    length_cm = safe_float(raw_product.get('comprimentoEmbalagem', 0))
-    weight_kg = safe_float(raw_product.get('peso_bruto', 0))
-    
+    mapped.update({out: _safe_float(get(src)) for out, src in _TINY_DIMENSION_FIELDS})
+
     # Preços
     # Utilizar sempre o custo calculado (priorizando Notas Fiscais, seguindo no Kit, com fallback para o cadastro de produto)
-    calculated_cost = raw_product.get('preco_custo_calculado')
+    calculated_cost = get('preco_custo_calculado')
     if calculated_cost is not None and calculated_cost > 0:
-        cost_price = safe_float(calculated_cost)
+        mapped['cost_price'] = _safe_float(calculated_cost)
     else:
-        cost_price = safe_float(raw_product.get('preco_custo', 0))
-        
-    list_price = safe_float(raw_product.get('preco', 0))
-    promo_price = safe_float(raw_product.get('preco_promocional', 0))
-    
-    mapped = {
-        'title': title,
-        'sku': sku,
-        'gtin': gtin,
-        'unit': unit,
-        'categoria': categoria,
-        'height_cm': height_cm,
-        'width_cm': width_cm,
-        'length_cm': length_cm,
-        'weight_kg': weight_kg,
-        'cost_price': cost_price,
-        'list_price': list_price,
-        'promo_price': promo_price,
-        'raw_data': raw_product  # Manter dados brutos para debug
-    }
-    
-    logger.info(f"Produto mapeado: {title} (SKU: {sku})")
-    logger.debug(f"Dimensões: {height_cm}x{width_cm}x{length_cm} cm, {weight_kg} kg")
-    
+        mapped['cost_price'] = _safe_float(get('preco_custo'))
+    mapped.update({out: _safe_float(get(src)) for out, src in _TINY_PRICE_FIELDS})
+
+    if include_raw:
+        mapped['raw_data'] = raw_product
+    else:
+        mapped['raw_data'] = {k: raw_product[k] for k in _TINY_RAW_UI_FIELDS if k in raw_product}
+
+    # Chamado por produto em lotes: detalhe só em DEBUG, e sem montar argumentos à toa
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Produto mapeado: %s (SKU: %s)", mapped['title'], mapped['sku'])
+        logger.debug(
+            "Dimensões: %sx%sx%s cm, %s kg",
+            mapped['height_cm'], mapped['width_cm'], mapped['length_cm'], mapped['weight_kg'],
+        )
+
     return mapped
 
 
+# Tabelas de campos de map_tiny_to_product_data: (chave interna, campo Tiny)
+_TINY_STR_FIELDS = (
+    ('title', 'nome'),
+    ('sku', 'codigo'),
+    ('gtin', 'gtin'),
+    ('unit', 'unidade'),
+)
+_TINY_DIMENSION_FIELDS = (
+    ('height_cm', 'alturaEmbalagem'),
+    ('width_cm', 'larguraEmbalagem'),
+    ('length_cm', 'comprimentoEmbalagem'),
+    ('weight_kg', 'peso_bruto'),
+)
+_TINY_PRICE_FIELDS = (
+    ('list_price', 'preco'),
+    ('promo_price', 'preco_promocional'),
+)
+# Campos brutos que a UI lê em raw_data (TINY_TO_ML_ATTR_MAP e unidade em static/main.html)
+_TINY_RAW_UI_FIELDS = (
+    'id', 'codigo', 'marca', 'gtin', 'unidade', 'peso_bruto', 'peso_liquido',
+    'alturaEmbalagem', 'larguraEmbalagem', 'comprimentoEmbalagem',
+)
+_DECIMAL_COMMA = str.maketrans(",", ".")
+
+
+def _parse_decimal(value: Any) -> float:
+    """float de um número do Tiny (12.5, "12,50", ...); levanta ValueError/TypeError como float()."""
+    # Caminho rápido: a API já devolve a maioria dos números como int/float
+    if type(value) is float or type(value) is int:
+        return float(value)
+    text = value if isinstance(value, str) else str(value)
+    if ',' in text:
+        text = text.translate(_DECIMAL_COMMA)
+    return float(text)
+
+
 def _safe_float(value: Any, default: float = 0.0) -> float:
-    if value is None or value == "":
+    # Testes baratos antes do try: número nativo e vazio/None são os casos comuns
+    if type(value) is float or type(value) is int:
+        return float(value)
+    if not value:
         return default
     try:
-        return float(str(value).replace(",", "."))
+        return _parse_decimal(value)
     except (TypeError, ValueError):
         return default
 
 
+def _safe_str(value: Any, default: str = "") -> str:
+    if value is None:
+        return default
+    return str(value).strip()
+
+
 def _safe_int(value: Any, default: int = 0) -> int:
     try:
-        return int(float(str(value).replace(",", ".")))
+        return int(_parse_decimal(value))
     except (TypeError, ValueError):
         return default
 
@@ -1287,6 +1752,7 @@ async def create_kit_product(
                 "Tiny retornou OK na inclusao do KIT, mas o SKU nao foi encontrado na confirmacao pos-inclusao."
             )
         created_id = str(confirmed.get("id") or "").strip()
+    invalidate_product_cache(combo_sku)
     validation = {
         "is_valid": True,
         "is_kit_class": True,